@@ -1,16 +1,18 @@
 import os
-from groq import Groq
 from dotenv import load_dotenv 
 
+import llm_clients
+
 load_dotenv()
 
 class RedTeamAgent:
     def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
         self.model = "llama-3.3-70b-versatile"
+        # No response cache: every call must produce a new poison pill
+        self.llm = llm_clients.GroqClient(api_key=os.environ.get("GROQ_API_KEY"), model=self.model, cache=False)
 
-    def generate_poison_pill_protocol(self, flaw_type="Multiplicity"):
-        prompt = f"""
+    def _poison_pill_prompt(self, flaw_type):
+        return f"""
         ROLE: Senior Rogue Biostatistician.
         TASK: Draft a professional-grade, 2-page Clinical Trial Protocol fragment.
         
@@ -30,13 +32,14 @@ class RedTeamAgent:
         - Statistical Analysis Plan (SAP)
         - Handling of Intercurrent Events
         """
-        
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.8 # Higher temperature for more creative/diverse "lies"
-        )
-        return response.choices[0].message.content
+
+    def generate_poison_pill_protocol(self, flaw_type="Multiplicity", seed=None):
+        # Higher temperature for more creative/diverse "lies"; a seed makes the sample repeatable
+        # where the provider honours it
+        return self.llm.complete(self._poison_pill_prompt(flaw_type), temperature=0.8, seed=seed)
+
+    async def agenerate_poison_pill_protocol(self, flaw_type="Multiplicity", seed=None):
+        return await self.llm.acomplete(self._poison_pill_prompt(flaw_type), temperature=0.8, seed=seed)
 
 if __name__ == "__main__":
     red_team = RedTeamAgent()
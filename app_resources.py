@@ -0,0 +1,113 @@
+import os
+import streamlit as st
+
+import retrieval_index
+import library_store
+
+# --- 1. Configuration ---
+# Heavy objects the Streamlit app needs on every rerun, built once per process and shared by all
+# sessions. Each cached builder takes the (mtime, size) signature of the files it reads as an
+# argument, so editing a file changes the cache key and the next rerun rebuilds just that resource.
+LIBRARY_FILE = retrieval_index.MASTER_FILE
+LETTERS_FILE = library_store.LETTERS_FILE
+
+
+def file_signature(path):
+    return retrieval_index._stat_signature(path) if os.path.exists(path) else None
+
+
+# --- 2. Letters ---
+class LetterStore:
+    """fda_letters rows preloaded in memory, with a lower-cased recipient index for the Evidence Deep-Dive."""
+
+    def __init__(self, letters_df):
+        self.letters = letters_df
+        # Letters without a recipient never match, as in the SQL lookup
+        self.recipients = [r.lower() if isinstance(r, str) else None for r in letters_df['recipient']]
+        # Exact recipient -> first row, for the common case of a button carrying the full name
+        self.by_recipient = {}
+        for position, recipient in enumerate(self.recipients):
+            if recipient is not None:
+                self.by_recipient.setdefault(recipient, position)
+
+    def __len__(self):
+        return len(self.letters)
+
+    def find(self, name_to_find):
+        """First letter whose recipient contains `name_to_find` (case-insensitive), like library_store.find_letter."""
+        needle = str(name_to_find).lower()
+        position = self.by_recipient.get(needle)
+        if position is None:
+            position = next((i for i, r in enumerate(self.recipients) if r is not None and needle in r), None)
+        if position is None:
+            return None
+        return self.get(position)
+
+    def get(self, letter_id):
+        """The letter at row `letter_id` (the id entity_index resolves to), or None."""
+        if not 0 <= int(letter_id) < len(self.letters):
+            return None
+        row = self.letters.iloc[int(letter_id)]
+        return {"id": int(self.letters.index[int(letter_id)]), **row.to_dict()}
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _letter_store(library_path, letters_signature, library_signature):
+    return LetterStore(library_store.read_letters(library_path))
+
+
+def get_letter_store(library_path=LIBRARY_FILE):
+    return _letter_store(library_path, file_signature(LETTERS_FILE), file_signature(library_path))
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _entity_index(library_path, letters_signature, library_signature):
+    import entity_index
+    return entity_index.EntityIndex.load(library_path)
+
+
+def get_entity_index(library_path=LIBRARY_FILE):
+    """Recipient / alias / application / date lookup that resolves an audit citation to one letter id."""
+    return _entity_index(library_path, file_signature(LETTERS_FILE), file_signature(library_path))
+
+
+# --- 3. Retrieval Indexes ---
+@st.cache_resource(max_entries=1, show_spinner="Loading regulatory indexes...")
+def _indexes(library_path, library_signature):
+    import passage_index, quote_index, quote_locator
+    return {
+        "retrieval": retrieval_index.get_index(library_path),
+        "passages": passage_index.get_passage_index(library_path),
+        "quotes": quote_index.get_quote_index(library_path),
+        "locator": quote_locator.get_locator(library_path),
+    }
+
+
+def get_indexes(library_path=LIBRARY_FILE):
+    """Loads (or rebuilds) every derived index of the library once per library version."""
+    return _indexes(library_path, file_signature(library_path))
+
+
+# --- 4. Agents ---
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _agent(api_key, library_path, library_signature):
+    # One instance serves every session and background job at once: it must not keep per-request state
+    from lifecycle_agent3 import BiostatLifecycleAgent3
+    return BiostatLifecycleAgent3(api_key, library_path)
+
+
+def get_agent(api_key, library_path=LIBRARY_FILE):
+    # Warm the indexes with the agent, so the first audit doesn't pay for loading them
+    get_indexes(library_path)
+    return _agent(api_key, library_path, file_signature(library_path))
+
+
+@st.cache_resource(max_entries=1, show_spinner="Preparing the evaluation suite...")
+def _evaluator(library_signature, corpus_signature):
+    from evaluator import AuditorEvaluator
+    return AuditorEvaluator()
+
+
+def get_evaluator():
+    import redteam_corpus
+    return _evaluator(file_signature(LIBRARY_FILE), file_signature(redteam_corpus.CORPUS_FILE))
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+import concurrent.futures
+
+# --- 1. Configuration ---
+# Long audit / optimize runs for the Streamlit app, executed on a process-wide thread pool instead
+# of the session's script thread. Each job is a generator of output pieces (audit_protocol_stream,
+# optimize_protocol_stream); its partial output, result and inputs are written to SQLite, so any
+# rerun or reloaded page can find it by id. While it runs, its pieces are also kept in memory, so a
+# page can stream them as they arrive (stream_output). Jobs still "running" under a server process
+# that no longer exists are reported as interrupted.
+JOBS_DB = os.environ.get("BACKGROUND_JOBS_DB", "background_jobs.sqlite")
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", 4))
+PROGRESS_INTERVAL = 1.0  # seconds between writes of the partial output
+JOB_TTL = 7 * 24 * 3600  # finished jobs older than this are pruned
+
+RUNNING, DONE, FAILED, INTERRUPTED = "running", "done", "failed", "interrupted"
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_executor = None
+_executor_lock = threading.Lock()
+# {job_id: {"pieces": [...], "done": bool}} for the jobs running in this process
+_LIVE = {}
+_LIVE_CHANGED = threading.Condition()
+
+
+def _connect():
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS background_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            inputs TEXT NOT NULL,
+            progress TEXT NOT NULL DEFAULT '',
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def _update(job_id, **fields):
+    conn = _connect()
+    try:
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        conn.execute(f"UPDATE background_jobs SET {assignments}, updated_at = ? WHERE id = ?",
+                     (*fields.values(), time.time(), job_id))
+    finally:
+        conn.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="background-job")
+        return _executor
+
+
+# --- 2. Running ---
+def _run(job_id, stream, final):
+    live = _LIVE[job_id]
+    pieces = live["pieces"]
+    last_write = time.time()
+    try:
+        for piece in stream:
+            with _LIVE_CHANGED:
+                pieces.append(piece)
+                _LIVE_CHANGED.notify_all()
+            if time.time() - last_write >= PROGRESS_INTERVAL:
+                _update(job_id, progress="".join(pieces))
+                last_write = time.time()
+        text = "".join(pieces)
+        _update(job_id, status=DONE, progress=text, result=final(text) if final else text)
+    except Exception as e:
+        print(f"❌ Background job {job_id} failed: {e}")
+        _update(job_id, status=FAILED, progress="".join(pieces), error=str(e))
+    finally:
+        with _LIVE_CHANGED:
+            live["done"] = True
+            _LIVE.pop(job_id, None)
+            _LIVE_CHANGED.notify_all()
+
+
+def submit(kind, stream, final=None, inputs=None):
+    """
+    Starts consuming `stream` (a generator of text pieces) in the background and returns the job id.
+    The result is the joined text, or final(text) if given. `inputs` are stored with the job so a
+    reloaded page can restore what the job was started from.
+    """
+    job_id = uuid.uuid4().hex[:12]
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM background_jobs WHERE status != ? AND updated_at < ?", (RUNNING, now - JOB_TTL))
+        conn.execute(
+            "INSERT INTO background_jobs (id, kind, status, owner, inputs, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, RUNNING, OWNER, json.dumps(inputs or {}, ensure_ascii=False), now, now)
+        )
+    finally:
+        conn.close()
+    with _LIVE_CHANGED:
+        _LIVE[job_id] = {"pieces": [], "done": False}
+    get_executor().submit(_run, job_id, stream, final)
+    print(f"🧵 Background {kind} job {job_id} started.")
+    return job_id
+
+
+# --- 3. Reading ---
+def get(job_id):
+    """The job as a dict (with parsed inputs and elapsed seconds), or None for an unknown id."""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM background_jobs WHERE id = ?", (str(job_id),)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    if job["status"] == RUNNING and job["owner"] != OWNER:
+        # Started by a server process that has since stopped: nothing will ever finish it
+        job.update(status=INTERRUPTED, error="The server restarted while this job was running.")
+        _update(job_id, status=INTERRUPTED, error=job["error"])
+    job["inputs"] = json.loads(job["inputs"])
+    end = time.time() if job["status"] == RUNNING else job["updated_at"]
+    job["elapsed"] = end - job["created_at"]
+    return job
+
+
+def stream_output(job_id):
+    """
+    Yields the job's output so far as one piece, then every new piece as it is produced, and
+    returns when the job ends (e.g. for st.write_stream). A job that already ended yields its
+    saved output.
+    """
+    with _LIVE_CHANGED:
+        live = _LIVE.get(job_id)
+    if live is None:
+        job = get(job_id)
+        if job is not None and job["progress"]:
+            yield job["progress"]
+        return
+    sent = 0
+    while True:
+        with _LIVE_CHANGED:
+            while len(live["pieces"]) == sent and not live["done"]:
+                _LIVE_CHANGED.wait()
+            new, done = live["pieces"][sent:], live["done"]
+        sent += len(new)
+        if new:
+            yield "".join(new)
+        if done:
+            return
@@ -0,0 +1,180 @@
+import re
+
+import context_packer
+
+# --- 1. Configuration ---
+# LLM extraction chunks for whole letters (prep_for_llm.py, run_llm.py). Unlike the fixed
+# 4000-character slices they replace, a chunk ends on a paragraph or sentence boundary and is
+# sized by estimated tokens. Every chunk is an exact substring text[start:end], so a finding can
+# be located in the letter and findings from overlapping chunks deduplicated by span.
+CHUNK_TOKENS = 1500
+OVERLAP_TOKENS = 0  # trailing sentences repeated at the start of the next chunk
+# Overlap share above which two findings of the same letter are the same finding
+DUPLICATE_OVERLAP = 0.5
+
+# "Dr. Smith", "U.S. Food", "No. 123": sentence ends that aren't
+ABBREVIATION = re.compile(r"(?:\b(?:Dr|Mr|Ms|Mrs|No|Nos|Inc|Ltd|Co|vs|al|Fig|Sec|approx)|\b[A-Z]|\be\.g|\bi\.e)\.$")
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+WORD_SPLIT = re.compile(r"\s+")
+
+
+# --- 2. Units (paragraphs -> sentences -> words) ---
+def _strip_span(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def split_spans(text, pattern, start, end):
+    """Splits text[start:end] on `pattern`, returning the stripped (start, end) of each piece (also used by passage_index)."""
+    spans = []
+    cursor = start
+    for m in pattern.finditer(text, start, end):
+        spans.append(_strip_span(text, cursor, m.start()))
+        cursor = m.end()
+    spans.append(_strip_span(text, cursor, end))
+    return [(s, e) for s, e in spans if e > s]
+
+
+def _sentence_spans(text, start, end):
+    spans = []
+    for s, e in split_spans(text, SENTENCE_END, start, end):
+        if spans and ABBREVIATION.search(text[spans[-1][0]:spans[-1][1]]):
+            spans[-1] = (spans[-1][0], e)
+        else:
+            spans.append((s, e))
+    return spans
+
+
+def _word_runs(text, start, end, max_tokens):
+    """Last resort for a 'sentence' over budget (tables, lists without punctuation): whole-word runs."""
+    runs = []
+    run_start = run_end = None
+    for s, e in split_spans(text, WORD_SPLIT, start, end):
+        if run_start is not None and context_packer.estimate_tokens(text[run_start:e]) > max_tokens:
+            runs.append((run_start, run_end))
+            run_start = None
+        if run_start is None:
+            run_start = s
+        run_end = e
+    if run_start is not None:
+        runs.append((run_start, run_end))
+    return runs
+
+
+def split_units(text, max_tokens=CHUNK_TOKENS):
+    """[(start, end, tokens)]: paragraphs, or the sentences (or word runs) of those over budget."""
+    units = []
+    for p_start, p_end in split_spans(text, PARAGRAPH_BREAK, 0, len(text)):
+        tokens = context_packer.estimate_tokens(text[p_start:p_end])
+        if tokens <= max_tokens:
+            units.append((p_start, p_end, tokens))
+            continue
+        for s_start, s_end in _sentence_spans(text, p_start, p_end):
+            tokens = context_packer.estimate_tokens(text[s_start:s_end])
+            if tokens <= max_tokens:
+                units.append((s_start, s_end, tokens))
+            else:
+                units.extend((s, e, context_packer.estimate_tokens(text[s:e])) for s, e in _word_runs(text, s_start, s_end, max_tokens))
+    return units
+
+
+# --- 3. Chunks ---
+def chunk_document(text, max_tokens=CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """
+    [{"index", "start", "end", "tokens", "text"}] covering the whole text. Units are packed greedily
+    up to max_tokens; with overlap, the next chunk restarts at the trailing units of the previous
+    one that fit in overlap_tokens.
+    """
+    text = str(text)
+    units = split_units(text, max_tokens)
+    chunks = []
+    first = 0
+    while first < len(units):
+        last = first
+        tokens = units[first][2]
+        while last + 1 < len(units) and tokens + units[last + 1][2] <= max_tokens:
+            last += 1
+            tokens += units[last][2]
+        start, end = units[first][0], units[last][1]
+        chunks.append({"index": len(chunks), "start": start, "end": end, "tokens": tokens, "text": text[start:end]})
+        if last + 1 >= len(units):
+            break
+
+        # Step back over trailing units for the overlap, but always move forward
+        next_first = last + 1
+        overlap = 0
+        while next_first - 1 > first and overlap + units[next_first - 1][2] <= overlap_tokens:
+            next_first -= 1
+            overlap += units[next_first][2]
+        first = next_first
+    return chunks
+
+
+# --- 4. Findings ---
+def _normalize_with_map(text):
+    """Whitespace-collapsed, lower-cased text plus the original index of each kept character."""
+    chars, positions = [], []
+    previous_space = True
+    for i, ch in enumerate(text):
+        if ch.isspace():
+            if not previous_space:
+                chars.append(" ")
+                positions.append(i)
+            previous_space = True
+        else:
+            chars.append(ch.lower())
+            positions.append(i)
+            previous_space = False
+    return "".join(chars), positions
+
+
+def locate(quote, chunk):
+    """Absolute (start, end) of `quote` in the letter, searched inside `chunk`; None if not verbatim."""
+    quote = " ".join(str(quote or "").split())
+    if not quote:
+        return None
+    position = chunk["text"].find(quote)
+    if position >= 0:
+        return chunk["start"] + position, chunk["start"] + position + len(quote)
+    normalized, positions = _normalize_with_map(chunk["text"])
+    position = normalized.find(quote.lower())
+    if position < 0:
+        return None
+    return chunk["start"] + positions[position], chunk["start"] + positions[position + len(quote) - 1] + 1
+
+
+def _overlap_share(a, b):
+    shared = min(a[1], b[1]) - max(a[0], b[0])
+    return shared / min(a[1] - a[0], b[1] - b[0]) if shared > 0 else 0.0
+
+
+def dedupe_findings(findings, doc_key="source_doc_id", span_keys=("source_char_start", "source_char_end"),
+                    text_key="violation_text", chunk_key="source_chunk", category_key="Pillar_Category"):
+    """
+    Drops repeats of a finding extracted from two overlapping chunks: same letter and category,
+    a different chunk, and spans that mostly overlap, or (for findings that couldn't be located)
+    the same normalized text. Findings of one chunk are never collapsed with each other.
+    """
+    kept = []
+    spans_by_key = {}
+    chunks_by_text = {}
+    for finding in findings:
+        key = (finding.get(doc_key), finding.get(category_key))
+        chunk = finding.get(chunk_key)
+        start, end = finding.get(span_keys[0]), finding.get(span_keys[1])
+        if start is not None and end is not None and end > start:
+            spans = spans_by_key.setdefault(key, [])
+            if any(other != chunk and _overlap_share((start, end), span) >= DUPLICATE_OVERLAP for span, other in spans):
+                continue
+            spans.append(((start, end), chunk))
+        else:
+            chunks = chunks_by_text.setdefault((*key, " ".join(str(finding.get(text_key, "")).lower().split())), set())
+            if chunks - {chunk}:
+                continue
+            chunks.add(chunk)
+        kept.append(finding)
+    return kept
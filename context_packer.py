@@ -0,0 +1,70 @@
+import re
+
+# --- 1. Configuration ---
+# Input-token budget for a single prompt, per model. Groq's free tier allows roughly 12k
+# tokens/minute on llama-3.3-70b, so one audit prompt has to stay well below that or the
+# next call in the same minute is a guaranteed 429.
+MODEL_TOKEN_BUDGETS = {
+    "llama-3.3-70b-versatile": 6000,
+    "llama-3.1-8b-instant": 4000,
+    "models/gemini-2.5-flash": 200000,
+}
+DEFAULT_TOKEN_BUDGET = 6000
+
+# Words and punctuation marks. BPE tokenizers split roughly 3 words into 4 tokens.
+WORD_PATTERN = re.compile(r"\w+")
+PUNCT_PATTERN = re.compile(r"[^\w\s]")
+TOKENS_PER_WORD = 1.33
+
+
+def token_budget(model_id):
+    return MODEL_TOKEN_BUDGETS.get(model_id, DEFAULT_TOKEN_BUDGET)
+
+
+def estimate_tokens(text):
+    """Fast local token-count estimate (no tokenizer download, ~1ms per 50 KB)."""
+    if not text:
+        return 0
+    text = str(text)
+    return int(len(WORD_PATTERN.findall(text)) * TOKENS_PER_WORD) + len(PUNCT_PATTERN.findall(text))
+
+
+# --- 2. Snippets ---
+def snippet(text, section, score=0.0, mandatory=False, **meta):
+    """One candidate piece of context. `meta` carries whatever the caller needs to format it later."""
+    return {"text": text, "section": section, "score": score, "mandatory": mandatory,
+            "tokens": estimate_tokens(text), **meta}
+
+
+# --- 3. The Packer ---
+def pack_context(snippets, budget):
+    """
+    Greedy fill: every mandatory snippet is kept, then the rest are added best-score first
+    while they fit in `budget` tokens. Returns (kept snippets in their original order, tokens used).
+    """
+    kept = set()
+    used = 0
+    for i, s in enumerate(snippets):
+        if s["mandatory"]:
+            kept.add(i)
+            used += s["tokens"]
+
+    if used > budget:
+        print(f"⚠️ Mandatory context alone is {used} tokens (budget {budget}). Sending it anyway.")
+
+    optional = sorted((i for i, s in enumerate(snippets) if not s["mandatory"]),
+                      key=lambda i: snippets[i]["score"], reverse=True)
+    for i in optional:
+        if used + snippets[i]["tokens"] <= budget:
+            kept.add(i)
+            used += snippets[i]["tokens"]
+
+    dropped = len(snippets) - len(kept)
+    if dropped:
+        print(f"📦 Context packer: kept {len(kept)}/{len(snippets)} snippets ({used}/{budget} tokens).")
+    return [s for i, s in enumerate(snippets) if i in kept], used
+
+
+def remaining_budget(model_id, *fixed_parts):
+    """Budget left for retrieved context once the template, protocol, etc. are accounted for."""
+    return max(0, token_budget(model_id) - sum(estimate_tokens(p) for p in fixed_parts))
@@ -0,0 +1,224 @@
+import re
+import sys
+import bisect
+from datetime import datetime
+
+import library_store
+
+# --- 1. Configuration ---
+# Who each FDA letter is addressed to, so "MATCH FOUND: [Date] | [Recipient] | [Quote]" lines in an
+# audit resolve to the exact letter. The recipient column of fda_letters.csv is mostly empty, so
+# names come from the letter header. Entities are extracted when the library store is built
+# (library_store.build_store) and kept in its letter_entities table.
+HEADER_CHARS = 2500
+COMPANY_SUFFIX = (
+    r"(?:Inc|Incorporated|LLC|L\.L\.C|Ltd|Limited|Corp|Corporation|Company|Co|GmbH|AG|S\.A|SA|S\.p\.A|plc|"
+    r"PLC|LP|L\.P|B\.V|N\.V|Pty|Pharmaceuticals|Pharma|Laboratories|Labs|Therapeutics|Biosciences|"
+    r"Biotherapeutics|Biologics|Sciences|USA)\.?"
+)
+COMPANY_LINE = re.compile(rf"^\s*([A-Za-z0-9][^\n]{{1,80}}?\b{COMPANY_SUFFIX})\s*$", re.M)
+NOT_A_COMPANY = re.compile(
+    r"Department|Food and Drug|Administration|Health|Silver Spring|Office|Division|Center|President|Director|Manager|Attention|Dear",
+    re.I
+)
+AGENT_PREFIX = re.compile(r"^(?:U\.?S\.?|United States)\s+Agent\s+for\s+", re.I)
+APPLICATION = re.compile(r"\b(NDA|BLA|ANDA|IND|sNDA|sBLA)\s*(?:#|No\.?)?\s*(\d{5,6})\b", re.I)
+ATTENTION = re.compile(r"Attention:\s*([^\n,]{3,60})", re.I)
+# Legal suffixes dropped for the short alias ("Akebia Therapeutics, Inc." -> "akebia therapeutics" -> "akebia")
+LEGAL_SUFFIXES = {"inc", "incorporated", "llc", "ltd", "limited", "corp", "corporation", "company", "co",
+                  "gmbh", "ag", "sa", "spa", "plc", "lp", "bv", "nv", "pty", "usa", "us"}
+GENERIC_WORDS = {"pharmaceuticals", "pharmaceutical", "pharma", "laboratories", "labs", "therapeutics",
+                 "biosciences", "biotherapeutics", "biologics", "sciences", "biopharma"}
+DATE_FORMATS = ["%m/%d/%Y", "%Y-%m-%d", "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%m/%d/%y"]
+DATE_PATTERN = re.compile(
+    r"\b(\d{1,2}/\d{1,2}/\d{2,4}|\d{4}-\d{2}-\d{2}|[A-Z][a-z]+\.? \d{1,2}, \d{4}|\d{1,2} [A-Z][a-z]+ \d{4})\b"
+)
+FUZZY_THRESHOLD = 0.45
+# Recipient placeholders a report may cite instead of a name
+NO_NAME = {"", "n a", "na", "unknown", "none", "redacted"}
+
+
+def normalize(text):
+    return " ".join(re.sub(r"[^\w\s]", " ", str(text).lower().replace("’", "'").replace("'", "")).split())
+
+
+def parse_date(text):
+    """First date in `text` as YYYY-MM-DD, or None."""
+    for candidate in DATE_PATTERN.findall(str(text)):
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate.replace(".", ""), fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+    return None
+
+
+def _trigrams(norm):
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# --- 2. Extraction (at store build time) ---
+def aliases(company):
+    """Shorter names a report might use: without the legal suffix, and without generic industry words."""
+    words = normalize(AGENT_PREFIX.sub("", company)).split()
+    while words and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    result = [" ".join(words)]
+    core = [w for w in words if w not in GENERIC_WORDS and w not in LEGAL_SUFFIXES]
+    if core and core != words:
+        result.append(" ".join(core))
+    return [a for a in dict.fromkeys(result) if a]
+
+
+def extract_entities(recipient, date, full_text):
+    """[(kind, value)] for one letter: recipient / alias / contact / application / date."""
+    entities = []
+    companies = []
+    if isinstance(recipient, str) and recipient.strip() and recipient.strip().upper() != "N/A":
+        companies.append(recipient.strip())
+    header = str(full_text)[:HEADER_CHARS]
+    for match in COMPANY_LINE.finditer(header):
+        name = AGENT_PREFIX.sub("", match.group(1).strip())
+        if not NOT_A_COMPANY.search(name) and name not in companies:
+            companies.append(name)
+
+    for company in companies:
+        entities.append(("recipient", company))
+        entities.extend(("alias", a) for a in aliases(company) if a != normalize(company))
+    for contact in ATTENTION.findall(header):
+        entities.append(("contact", contact.strip()))
+    for kind, number in APPLICATION.findall(header):
+        entities.append(("application", f"{kind.upper()} {number}"))
+    iso_date = parse_date(date)
+    if iso_date:
+        entities.append(("date", iso_date))
+    return list(dict.fromkeys(entities))
+
+
+def write_entities(conn, letters_df):
+    """Fills the store's letter_entities table; called by library_store.build_store."""
+    conn.execute("CREATE TABLE letter_entities (letter_id INTEGER NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL, norm TEXT NOT NULL)")
+    conn.execute("CREATE INDEX letter_entities_norm ON letter_entities (norm)")
+    rows = []
+    for letter_id, (recipient, date, full_text) in enumerate(
+        letters_df.reindex(columns=["recipient", "date", "full_text"]).itertuples(index=False, name=None)
+    ):
+        rows.extend((letter_id, kind, value, normalize(value)) for kind, value in extract_entities(recipient, date, full_text))
+    conn.executemany("INSERT INTO letter_entities (letter_id, kind, value, norm) VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+# --- 3. The In-Memory Index ---
+class EntityIndex:
+    """Exact, prefix and trigram-fuzzy lookup over letter entities, with the letter date as a tie-breaker."""
+
+    def __init__(self, rows):
+        self.by_norm = {}
+        self.letters = {}
+        for letter_id, kind, value, norm in rows:
+            letter = self.letters.setdefault(letter_id, {"letter_id": letter_id, "recipient": None, "date": None, "applications": []})
+            if kind == "date":
+                letter["date"] = value
+                continue
+            if kind == "recipient" and letter["recipient"] is None:
+                letter["recipient"] = value
+            if kind == "application":
+                letter["applications"].append(value)
+            self.by_norm.setdefault(norm, []).append((letter_id, kind, value))
+        self.keys = sorted(self.by_norm)
+        self.trigrams = {}
+        self.gram_counts = {}
+        for norm in self.keys:
+            grams = _trigrams(norm)
+            self.gram_counts[norm] = len(grams)
+            for gram in grams:
+                self.trigrams.setdefault(gram, []).append(norm)
+
+    @classmethod
+    def load(cls, library_path=library_store.MASTER_FILE):
+        conn = library_store.connect(library_path)
+        try:
+            return cls(conn.execute("SELECT letter_id, kind, value, norm FROM letter_entities ORDER BY letter_id, rowid").fetchall())
+        finally:
+            conn.close()
+
+    def _name_matches(self, norm):
+        """{norm key: score}: exact 1.0, prefix 0.8-1.0, fuzzy (trigram Jaccard) below that."""
+        if not norm:
+            return {}
+        if norm in self.by_norm:
+            return {norm: 1.0}
+        matches = {}
+        start = bisect.bisect_left(self.keys, norm)
+        for key in self.keys[start:]:
+            if not key.startswith(norm):
+                break
+            matches[key] = 0.8 + 0.2 * len(norm) / len(key)
+        if matches:
+            return matches
+
+        grams = _trigrams(norm)
+        shared = {}
+        for gram in grams:
+            for key in self.trigrams.get(gram, ()):
+                shared[key] = shared.get(key, 0) + 1
+        for key, count in shared.items():
+            jaccard = count / (len(grams) + self.gram_counts[key] - count)
+            if jaccard >= FUZZY_THRESHOLD:
+                matches[key] = 0.8 * jaccard
+        return matches
+
+    def lookup(self, name="", date=None, limit=5):
+        """
+        Candidate letters for a recipient name (or alias, contact, application number) and/or a
+        date, best first: [{"letter_id", "recipient", "date", "applications", "matched", "score"}].
+        A letter on the given date outranks an equally good name match on another date. The date
+        alone only picks letters when no name was given: a name that matches nothing returns [].
+        """
+        iso_date = parse_date(date) if date else parse_date(name)
+        scores = {}
+        application = APPLICATION.search(str(name))
+        keys = {normalize(f"{application.group(1)} {application.group(2)}"): 1.0} if application else self._name_matches(normalize(name))
+        # A bare date (or a placeholder) passed as the name is not a name
+        named = bool(application) or normalize(DATE_PATTERN.sub("", str(name))) not in NO_NAME
+        for key, score in keys.items():
+            for letter_id, kind, value in self.by_norm.get(key, ()):
+                if score > scores.get(letter_id, (0, None))[0]:
+                    scores[letter_id] = (score, value)
+        if iso_date:
+            dated = [lid for lid, letter in self.letters.items() if letter["date"] == iso_date]
+            if scores:
+                scores = {lid: (s + (1.0 if lid in dated else 0.0), v) for lid, (s, v) in scores.items()}
+            elif not named:
+                scores = {lid: (0.5, iso_date) for lid in dated}
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+        return [{**self.letters[lid], "matched": matched, "score": round(score, 3)} for lid, (score, matched) in ranked]
+
+    def resolve(self, name="", date=None):
+        """The one letter meant, or None when nothing matches or the best candidates tie (ambiguous)."""
+        matches = self.lookup(name, date, limit=2)
+        if not matches or (len(matches) == 2 and matches[0]["score"] == matches[1]["score"]):
+            return None
+        return matches[0]
+
+
+_LOADED = {}
+
+
+def get_entity_index(library_path=library_store.MASTER_FILE):
+    """Cached per process; reloaded when the store is rebuilt for changed CSVs."""
+    signature = (library_store._signature(library_path), library_store._signature(library_store.LETTERS_FILE))
+    cached = _LOADED.get(library_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    index = EntityIndex.load(library_path)
+    _LOADED[library_path] = (signature, index)
+    return index
+
+
+if __name__ == "__main__":
+    # python entity_index.py "Akebia" ["03/29/2022"]
+    for match in get_entity_index().lookup(*sys.argv[1:3]):
+        print(match)
@@ -0,0 +1,209 @@
+import os
+import re
+import sys
+import json
+import time
+import concurrent.futures
+from datetime import datetime
+
+import llm_clients
+import redteam_corpus
+
+# --- 1. Configuration ---
+# Runs the AuditorEvaluator suite (static cases + red-team cases per flaw type) as concurrent
+# jobs. The number of cases in flight only decides how much work is queued: the actual request
+# rate is held by the shared rate limiter, so more workers never means more 429s.
+#   python eval_runner.py                         -> whole suite, one process
+#   python eval_runner.py --shards 3              -> suite split over 3 worker processes
+#   python eval_runner.py --shard 1/3 --run-id X  -> only shard 1 of 3 (e.g. on another machine)
+#   python eval_runner.py --consolidate X         -> merge the shard files of run X into a report
+#   --flaws-file flaws.txt (one flaw type per line), --per-flaw N (corpus samples), --concurrency N
+# Red-team protocols come from the pre-generated corpus (redteam_corpus.py), so runs are comparable.
+EVAL_RUNS_DIR = "eval_runs"
+REPORT_FILE = "report.json"
+DEFAULT_FLAW_TYPES = redteam_corpus.DEFAULT_FLAW_TYPES
+CASE_CONCURRENCY = llm_clients.concurrency_limit("groq")
+
+
+def build_cases(static_suite, flaw_types=DEFAULT_FLAW_TYPES, per_flaw=1):
+    """Static cases first, then `per_flaw` red-team cases per flaw type. The order is the sharding order."""
+    cases = [
+        {"case_id": f"static:{case['name']}", "kind": "static", "name": case["name"],
+         "type": case["type"], "text": case["text"]}
+        for case in static_suite
+    ]
+    cases += [
+        {"case_id": f"dynamic:{flaw}#{k}", "kind": "dynamic", "name": f"Dynamic_{flaw}", "type": flaw,
+         "text": None, "sample": k, "samples": per_flaw}
+        for flaw in flaw_types for k in range(per_flaw)
+    ]
+    return cases
+
+
+def shard_cases(cases, shard_index, shard_count):
+    return cases[shard_index::shard_count]
+
+
+def shard_path(run_dir, shard_index, shard_count):
+    return os.path.join(run_dir, f"shard-{shard_index}-of-{shard_count}.jsonl")
+
+
+def _read_jsonl(path):
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # torn last line of an interrupted run
+    return records
+
+
+# --- 2. One Case ---
+def run_case(evaluator, case):
+    """Red-team sample (dynamic cases only) -> audit -> validate, with wall time and LLM usage for the case."""
+    started = time.time()
+    record = {
+        "case_id": case["case_id"], "kind": case["kind"], "name": case["name"], "type": case["type"],
+        "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with llm_clients.track_usage() as usage:
+        try:
+            if case["kind"] == "dynamic":
+                entry = evaluator.red_team_protocol(case["type"], case["sample"], case["samples"])
+                record["protocol_id"] = entry["protocol_id"]
+                protocol_text = entry["text"]
+            else:
+                protocol_text = case["text"]
+            lessons = evaluator.auditor._load_library(case["type"])
+            report = evaluator.run_audit_with_truth_constraint(protocol_text, lessons)
+            verdict = evaluator.validator.validate_report(case["name"], report)
+            record.update(status=verdict["status"], score=verdict["score"], error=None)
+        except Exception as e:
+            record.update(status="ERROR", score=None, error=str(e))
+    record.update(wall_seconds=round(time.time() - started, 3), usage={**usage, "llm_seconds": round(usage["llm_seconds"], 3)})
+    return record
+
+
+# --- 3. Shards ---
+def _warm_indexes():
+    """Builds every derived index once, before processes/threads race to build the same files."""
+    import retrieval_index, library_store, quote_index, quote_locator
+    library_store.connect(retrieval_index.MASTER_FILE).close()
+    retrieval_index.get_index(retrieval_index.MASTER_FILE)
+    quote_index.get_quote_index(retrieval_index.MASTER_FILE)
+    quote_locator.get_locator(retrieval_index.MASTER_FILE)
+
+
+def run_shard(run_dir, shard_index=0, shard_count=1, flaw_types=DEFAULT_FLAW_TYPES, concurrency=CASE_CONCURRENCY, per_flaw=1):
+    """
+    Runs one shard's cases on a thread pool, appending each result to the shard file as it finishes.
+    Cases already in the file are skipped, so an interrupted run picks up where it stopped.
+    """
+    from evaluator import AuditorEvaluator
+    _warm_indexes()
+    evaluator = AuditorEvaluator()
+    cases = shard_cases(build_cases(evaluator.test_suite, flaw_types, per_flaw), shard_index, shard_count)
+
+    path = shard_path(run_dir, shard_index, shard_count)
+    done = {r["case_id"] for r in _read_jsonl(path)}
+    pending = [c for c in cases if c["case_id"] not in done]
+    print(f"🧪 Shard {shard_index + 1}/{shard_count}: {len(pending)} cases to run ({len(done)} already done), {concurrency} at a time.")
+
+    os.makedirs(run_dir, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as out, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(run_case, evaluator, case) for case in pending]
+        for future in concurrent.futures.as_completed(futures):
+            record = {**future.result(), "shard": f"{shard_index + 1}/{shard_count}"}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            print(f"   [{record['status']}] {record['name']} ({record['wall_seconds']:.1f}s, {record['usage']['tokens']} tokens)")
+    return path
+
+
+def run(run_id=None, shards=1, flaw_types=DEFAULT_FLAW_TYPES, concurrency=CASE_CONCURRENCY, per_flaw=1):
+    run_id = run_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+    run_dir = os.path.join(EVAL_RUNS_DIR, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    started = time.time()
+
+    if shards <= 1:
+        run_shard(run_dir, 0, 1, flaw_types, concurrency, per_flaw)
+    else:
+        _warm_indexes()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=shards) as pool:
+            futures = [pool.submit(run_shard, run_dir, i, shards, flaw_types, concurrency, per_flaw) for i in range(shards)]
+            for future in futures:
+                future.result()
+
+    return consolidate(run_dir, elapsed=time.time() - started)
+
+
+# --- 4. The Consolidated Report ---
+def consolidate(run_dir, elapsed=None):
+    """Merges every shard file of a run into report.json (summary + per-case rows) and prints the summary."""
+    records = []
+    for name in sorted(os.listdir(run_dir)):
+        if re.match(r"shard-\d+-of-\d+\.jsonl$", name):
+            records.extend(_read_jsonl(os.path.join(run_dir, name)))
+    # Latest result per case, in case a case was re-run
+    latest = {}
+    for record in records:
+        latest[record["case_id"]] = record
+    records = sorted(latest.values(), key=lambda r: (r["kind"] != "static", r["case_id"]))
+
+    by_status = {}
+    for record in records:
+        by_status[record["status"]] = by_status.get(record["status"], 0) + 1
+    wall_times = sorted(r["wall_seconds"] for r in records)
+    summary = {
+        "run_id": os.path.basename(os.path.normpath(run_dir)),
+        "consolidated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "cases": len(records),
+        "by_status": by_status,
+        "pass_rate": round(by_status.get("PASS", 0) / len(records), 3) if records else None,
+        "elapsed_seconds": round(elapsed, 2) if elapsed is not None else None,
+        "case_seconds_total": round(sum(wall_times), 2),
+        "case_seconds_p50": wall_times[len(wall_times) // 2] if wall_times else None,
+        "case_seconds_max": wall_times[-1] if wall_times else None,
+        "llm_calls": sum(r["usage"]["calls"] for r in records),
+        "llm_cached_calls": sum(r["usage"]["cached_calls"] for r in records),
+        "tokens": sum(r["usage"]["tokens"] for r in records),
+    }
+    with open(os.path.join(run_dir, REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "cases": records}, f, indent=2, ensure_ascii=False)
+
+    print(f"\n🏁 EVAL RUN {summary['run_id']}: {summary['cases']} cases, {by_status}, "
+          f"{summary['tokens']} tokens over {summary['llm_calls']} LLM calls")
+    if elapsed is not None:
+        print(f"   Elapsed {elapsed:.1f}s for {summary['case_seconds_total']:.1f}s of case time.")
+    print(f"   Report: {os.path.join(run_dir, REPORT_FILE)}")
+    return summary
+
+
+def _arg(args, flag, default=None):
+    return args[args.index(flag) + 1] if flag in args else default
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if "--consolidate" in args:
+        consolidate(os.path.join(EVAL_RUNS_DIR, _arg(args, "--consolidate")))
+        sys.exit(0)
+
+    flaw_types = DEFAULT_FLAW_TYPES
+    if "--flaws-file" in args:
+        with open(_arg(args, "--flaws-file"), encoding="utf-8") as f:
+            flaw_types = [line.strip() for line in f if line.strip()]
+    concurrency = int(_arg(args, "--concurrency", CASE_CONCURRENCY))
+    per_flaw = int(_arg(args, "--per-flaw", 1))
+
+    if "--shard" in args:
+        index, count = (int(x) for x in _arg(args, "--shard").split("/"))
+        run_id = _arg(args, "--run-id") or sys.exit("--shard needs --run-id, so every shard writes to the same run.")
+        run_shard(os.path.join(EVAL_RUNS_DIR, run_id), index - 1, count, flaw_types, concurrency, per_flaw)
+    else:
+        run(_arg(args, "--run-id"), int(_arg(args, "--shards", 1)), flaw_types, concurrency, per_flaw)
@@ -1,10 +1,12 @@
-import pandas as pd
-import time
 import os
-import re
 import json
 from datetime import datetime
 from dotenv import load_dotenv
+import library_store
+import quote_index
+import quote_locator
+import validation_scoring
+import redteam_corpus
 
 # Ensure these files exist in your directory
 from adversarial_generator import RedTeamAgent
@@ -16,61 +18,34 @@ load_dotenv()
 # --- 1. THE VALIDATOR (The Judge) ---
 class AuditorValidator:
     def __init__(self, library_path="master_regulatory_library.csv"):
-        self.library = pd.read_csv(library_path)
+        self.library = library_store.read_library(library_path)
         self.library.columns = [c.strip() for c in self.library.columns]
         self.log_file = "audit_validation_performance.jsonl"
+        # Built once (and memory-mapped), so each quote check is a hash lookup, not a library scan
+        self.quote_index = quote_index.get_quote_index(library_path)
+        # Near-miss quotes are located fuzzily, so a paraphrase is told apart from an invention
+        self.locator = quote_locator.get_locator(library_path)
         
         print(f"--- VALIDATOR INITIALIZED ---")
         print(f"Library Rows Loaded: {len(self.library)}")
         print("-" * 30)
 
     def validate_report(self, protocol_name, report_text):
-        diagnostics = []
-        metrics = {"passed_checks": 0, "total_checks": 5}
-        
-        # Regex to find anything inside double quotes
-        quoted_phrases = re.findall(r'"([^"]*)"', report_text)
-        
         print(f"\n--- VERIFYING EVIDENCE FOR: {protocol_name} ---")
-        valid_quotes = []
-        
-        for phrase in quoted_phrases:
-            clean = phrase.strip()
-            if len(clean.split()) >= 5: # Valid quotes are usually 5+ words
-                def normalize(text):
-                    return re.sub(r'[^\w\s]', '', str(text)).lower().strip()
-
-                norm_phrase = normalize(clean)
-                # Check if this exact phrase exists in your 107-record library
-                match_exists = self.library['content'].apply(lambda x: norm_phrase in normalize(x)).any()
-                
-                if match_exists:
-                    print(f"✅ VERIFIED: '{clean[:50]}...'")
-                    valid_quotes.append(clean)
-                else:
-                    print(f"❌ HALLUCINATED: '{clean[:50]}...'")
-                    diagnostics.append(f"HALLUCINATION: {clean}")
-
-        # SCORING LOGIC
-        if valid_quotes and not any("HALLUCINATION" in d for d in diagnostics):
-            metrics["passed_checks"] += 3 # Truthfulness is 60% of the grade
-        
-        if "SECTION" in report_text.upper() or "RISK" in report_text.upper():
-            metrics["passed_checks"] += 2 # Formatting is 40%
+        # Scoring rules live in validation_scoring, shared with the batch re-validator
+        verdict = validation_scoring.score_report(report_text, "evaluator", self.quote_index, self.locator, verbose=True)
 
-        final_score = (metrics["passed_checks"] / metrics["total_checks"]) * 100
-        status = "PASS" if final_score >= 80 else "FAIL"
-
-        result = {"timestamp": datetime.now().strftime("%Y-%m-%d"), "score": f"{final_score}%", "status": status}
+        result = {"timestamp": datetime.now().strftime("%Y-%m-%d"), "score": verdict["score"], "status": verdict["status"]}
         
         with open(self.log_file, "a") as f:
             f.write(json.dumps({**result, "protocol": protocol_name}) + "\n")
+        validation_scoring.archive_report(protocol_name, "evaluator", report_text, result)
             
         return result
 
 # --- 2. THE EVALUATOR (The Orchestrator) ---
 class AuditorEvaluator:
-    def __init__(self):
+    def __init__(self, corpus_path=redteam_corpus.CORPUS_FILE, sample_seed=redteam_corpus.SAMPLE_SEED):
         library_path = "master_regulatory_library.csv"
         api_key = os.environ.get("GROQ_API_KEY")
         
@@ -78,6 +53,9 @@ class AuditorEvaluator:
         self.auditor = BiostatLifecycleAgent3(api_key=api_key, library_path=library_path)
         self.red_team = RedTeamAgent() 
         self.validator = AuditorValidator(library_path=library_path)
+        # Pre-generated poisoned protocols (redteam_corpus.py), so dynamic cases are reproducible
+        self.red_team_corpus = redteam_corpus.load_corpus(corpus_path)
+        self.sample_seed = sample_seed
 
         self.test_suite = [
             {
@@ -92,6 +70,17 @@ class AuditorEvaluator:
             }
         ]
 
+    def red_team_protocol(self, flaw, sample=0, samples=1):
+        """Entry `sample` of a deterministic `samples`-sized draw from the corpus; generated live if the corpus is short."""
+        entries = redteam_corpus.sample_protocols(flaw, samples, self.sample_seed, corpus=self.red_team_corpus)
+        if sample < len(entries):
+            return entries[sample]
+        print(f"⚠️ Not enough corpus entries for '{flaw}'. Generating live (run redteam_corpus.py to pin them)...")
+        return {"protocol_id": None, "flaw_type": flaw, "text": self.red_team.generate_poison_pill_protocol(flaw)}
+
+    def red_team_protocols(self, flaw, n=1):
+        return [self.red_team_protocol(flaw, k, n) for k in range(n)]
+
     def run_audit_with_truth_constraint(self, protocol_text, lessons):
         """Forces the Auditor to use double quotes so the validator can see them."""
         prompt = f"""
@@ -108,6 +97,7 @@ class AuditorEvaluator:
         return self.auditor.audit_protocol(prompt, lessons)
 
 # --- 3. THE EXECUTION ---
+# Sequential walk-through. For concurrent/sharded runs with timings and token usage: eval_runner.py
 if __name__ == "__main__":
     eval = AuditorEvaluator()
     print("\n🚀 STARTING MARATHON VALIDATION\n" + "="*50)
@@ -124,8 +114,7 @@ if __name__ == "__main__":
     for flaw in ["Multiplicity Alpha Inflation", "Legacy LOCF Bias"]:
         print(f"\n[DYNAMIC RED TEAM]: {flaw}")
         try:
-            time.sleep(3) # Rate limit protection
-            poison = eval.red_team.generate_poison_pill_protocol(flaw)
+            poison = eval.red_team_protocols(flaw)[0]["text"]
             lessons = eval.auditor._load_library(flaw)
             report = eval.run_audit_with_truth_constraint(poison, lessons)
             verdict = eval.validator.validate_report(f"Dynamic_{flaw}", report)
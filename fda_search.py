@@ -3,6 +3,7 @@ import urllib.parse
 import json
 import pandas as pd
 import os
+import time
 
 # --- 1. Configuration and Constants ---
 BASE_URL = "https://api.fda.gov/transparency/crl.json"
@@ -22,85 +23,207 @@ encoded_query = urllib.parse.quote(SEARCH_QUERY)
 
 params = {
     'search': encoded_query,
-    'limit': 100,  # Starting with 100. Max is 1000 per request.
+    # 'limit' and 'skip' are overridden page by page (see iter_fda_pages)
+    'limit': 100,
     'skip': 0 # Start at the beginning
     # 'api_key': 'YOUR_API_KEY' # Use your API key for higher volume
 }
 
-# --- 2. Data Fetching Function ---
+# Pagination: openFDA returns at most 1000 records per request and refuses skip > 25000
+PAGE_SIZE = 1000
+MAX_SKIP = 25000
+PAGE_RETRIES = 3
+
+# Streaming store: one JSON record per line, plus the page checkpoint used to resume
+JSONL_STORE = "fda_letters.jsonl"
+STATE_FILE = "fda_fetch_state.json"
+
+# --- 2. Data Fetching Functions ---
+def _get_page(session, base_url, params, skip, page_size):
+    """One page of results (with retries). Returns (records, total reported by the API)."""
+    page_params = {**params, 'limit': page_size, 'skip': skip}
+    for attempt in range(PAGE_RETRIES):
+        try:
+            response = session.get(base_url, params=page_params, timeout=60)
+            if response.status_code == 404:
+                # openFDA answers "no matches" with a 404
+                return [], 0
+            response.raise_for_status()
+            data = response.json()
+            return data.get('results', []), data.get('meta', {}).get('results', {}).get('total', 0)
+        except requests.exceptions.RequestException as e:
+            if attempt == PAGE_RETRIES - 1:
+                raise
+            wait_time = 2 ** attempt
+            print(f"⚠️ Page at skip={skip} failed ({e}). Retrying in {wait_time}s...")
+            time.sleep(wait_time)
+
+
+def iter_fda_pages(base_url, params, start_skip=0, page_size=PAGE_SIZE):
+    """Walks `skip` until the reported total. Yields (records, next_skip, total) one page at a time."""
+    skip = start_skip
+    with requests.Session() as session:
+        while True:
+            records, total = _get_page(session, base_url, params, skip, page_size)
+            if not records:
+                return
+            skip += len(records)
+            yield records, skip, total
+            if skip >= total:
+                return
+            if skip > MAX_SKIP:
+                print(f"⚠️ openFDA cannot skip past {MAX_SKIP} records; stopping at {skip} of {total}. Narrow the search to get the rest.")
+                return
+
+
+def iter_fda_records(base_url, params, page_size=PAGE_SIZE):
+    """Generator over every matching record; only one page is held in memory."""
+    for records, _, _ in iter_fda_pages(base_url, params, page_size=page_size):
+        yield from records
+
+
 def fetch_fda_data(base_url, params):
-    all_records = []
-    
-    # We will use a loop to simulate retrieving more than the default 'limit' (e.g., more than 100)
-    # A complete solution would loop and increment 'skip' until 'total' is reached, 
-    # but we'll stick to a simple single call for now.
-    
     print(f"Executing search with query: {params['search']}")
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status() 
-        data = response.json()
-        
-        if 'results' in data and data['results']:
-            all_records.extend(data['results'])
-            print(f"Successfully retrieved {len(all_records)} records.")
-        
+        all_records = list(iter_fda_records(base_url, params))
+        print(f"Successfully retrieved {len(all_records)} records.")
         return all_records
-    
     except requests.exceptions.RequestException as e:
         print(f"An error occurred during the API request: {e}")
         return []
 
+
+def _load_state(state_file):
+    if os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+
+def _save_state(state, state_file):
+    tmp_path = f"{state_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, state_file)
+
+
+def stream_to_jsonl(base_url, params, store=JSONL_STORE, state_file=STATE_FILE, resume=True):
+    """
+    Streams every page into a JSONL store. After each page the store is flushed and the next
+    `skip` plus the store's byte size are checkpointed; a rerun after a failure truncates any
+    half-written page and continues from the last complete one.
+    """
+    state = _load_state(state_file) if resume else None
+    if state and state.get('search') == params['search'] and os.path.exists(store):
+        if state.get('complete'):
+            print(f"✅ {store} is already complete ({state['fetched']} records).")
+            return state
+        with open(store, 'r+b') as f:
+            f.truncate(state['bytes'])
+        print(f"🔄 Resuming at record {state['skip']} of {state['total']}...")
+    else:
+        state = {'search': params['search'], 'skip': 0, 'total': None, 'fetched': 0, 'bytes': 0, 'complete': False}
+        open(store, 'w').close()
+
+    print(f"Executing search with query: {params['search']}")
+    with open(store, 'a', encoding='utf-8') as f:
+        for records, next_skip, total in iter_fda_pages(base_url, params, start_skip=state['skip']):
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            state.update(skip=next_skip, total=total, fetched=state['fetched'] + len(records), bytes=f.tell())
+            _save_state(state, state_file)
+            print(f"   📄 {state['fetched']}/{total} records stored.")
+
+    state['complete'] = True
+    _save_state(state, state_file)
+    print(f"✅ Streamed {state['fetched']} records to {store}.")
+    return state
+
+
+def iter_jsonl(store=JSONL_STORE):
+    with open(store, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
 # --- 3. Data Processing and Saving Function ---
+CSV_CHUNK_ROWS = 500
+
+
+def classify_letter(letter):
+    full_text = letter.get('text', '').upper()
+    
+    # Categorize the document type (for your knowledge base)
+    if "WARNING LETTER" in full_text:
+        return "TYPE A: Execution/Compliance Failure (WL)"
+    elif "COMPLETE RESPONSE" in full_text:
+        return "TYPE B: Statistical/Regulatory Consequence (CRL)"
+    return "TYPE C: Other BIMO Correspondence"
+
+
 def process_and_save_data(data_records, json_filename="fda_letters.json", csv_filename="fda_letters.csv"):
-    if not data_records:
+    """
+    Accepts a list or any iterator of records (e.g. iter_jsonl) and writes both files one record
+    at a time. Output goes to temp files first, so an empty fetch never clobbers the old ones.
+    """
+    json_tmp, csv_tmp = f"{json_filename}.tmp", f"{csv_filename}.tmp"
+    count = 0
+    pending_rows = []
+
+    def flush_rows():
+        # First chunk creates the CSV with a header, later chunks append
+        first_chunk = count <= CSV_CHUNK_ROWS
+        pd.DataFrame(pending_rows).to_csv(csv_tmp, mode='w' if first_chunk else 'a',
+                                          header=first_chunk, index=False, encoding='utf-8')
+        pending_rows.clear()
+
+    # --- Step A: Save to JSON (Preserves the original structure) ---
+    with open(json_tmp, 'w', encoding='utf-8') as json_file:
+        json_file.write("[\n")
+        for letter in data_records:
+            if count:
+                json_file.write(",\n")
+            json_file.write(json.dumps(letter, ensure_ascii=False, indent=4))
+            count += 1
+
+            # --- Step B: Prepare the CSV row (For easy viewing and labeling) ---
+            pending_rows.append({
+                'doc_type': classify_letter(letter),
+                'recipient': letter.get('recipient', 'N/A'),
+                'date': letter.get('letter_date', 'N/A'),
+                'citations': ', '.join(letter.get('citation', [])),
+                # Truncate the text for easy CSV viewing, but keep the full text in JSON
+                'text_snippet': letter.get('text', '')[:1000].replace('\n', ' '), 
+                'full_text': letter.get('text', '')
+            })
+            if len(pending_rows) == CSV_CHUNK_ROWS:
+                flush_rows()
+        json_file.write("\n]\n")
+
+    if not count:
         print("No data to save.")
+        os.remove(json_tmp)
         return
 
-    # --- Step A: Save to JSON (Preserves the original structure) ---
-    with open(json_filename, 'w', encoding='utf-8') as f:
-        json.dump(data_records, f, ensure_ascii=False, indent=4)
+    if pending_rows:
+        flush_rows()
+    os.replace(json_tmp, json_filename)
+    os.replace(csv_tmp, csv_filename)
     print(f"\n✅ Data successfully saved to {json_filename} (Full JSON).")
-
-    # --- Step B: Prepare and Save to CSV (For easy viewing and labeling) ---
-    
-    # 1. Extract only the key fields and add the custom 'Doc Type'
-    processed_data = []
-    for letter in data_records:
-        full_text = letter.get('text', '').upper()
-        
-        # Categorize the document type (for your knowledge base)
-        doc_type = ""
-        if "WARNING LETTER" in full_text:
-            doc_type = "TYPE A: Execution/Compliance Failure (WL)"
-        elif "COMPLETE RESPONSE" in full_text:
-            doc_type = "TYPE B: Statistical/Regulatory Consequence (CRL)"
-        else:
-            doc_type = "TYPE C: Other BIMO Correspondence"
-
-        processed_data.append({
-            'doc_type': doc_type,
-            'recipient': letter.get('recipient', 'N/A'),
-            'date': letter.get('letter_date', 'N/A'),
-            'citations': ', '.join(letter.get('citation', [])),
-            # Truncate the text for easy CSV viewing, but keep the full text in JSON
-            'text_snippet': letter.get('text', '')[:1000].replace('\n', ' '), 
-            'full_text': letter.get('text', '')
-        })
-
-    # 2. Convert to Pandas DataFrame and save to CSV
-    df = pd.DataFrame(processed_data)
-    df.to_csv(csv_filename, index=False, encoding='utf-8')
     print(f"✅ Data successfully saved to {csv_filename} (CSV for analysis).")
 
 
 # --- 4. Main Execution Block ---
 if __name__ == "__main__":
-    # 1. Fetch the Data
-    data_records = fetch_fda_data(BASE_URL, params)
+    import sys
+
+    # 1. Fetch the Data (every page, streamed to disk; reruns resume unless --restart)
+    stream_to_jsonl(BASE_URL, params, resume="--restart" not in sys.argv)
     
     # 2. Process and Save
-    process_and_save_data(data_records)
+    process_and_save_data(iter_jsonl(JSONL_STORE))
     
     # 3. Inform the user of completion
     print("The files 'fda_letters.json' and 'fda_letters.csv' now contain your knowledge base.")
@@ -1,75 +1,173 @@
 import os
+import sys
 import json
-import time
-from google import genai
-from google.genai import errors # Import this to catch the specific quota error
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+import llm_clients
+import kb_store
+import context_packer
+
 MODEL_ID = "models/gemini-2.5-flash"
+gemini = llm_clients.GeminiClient(api_key=os.getenv("GEMINI_API_KEY"), model=MODEL_ID)
+
+# Batching: under a 10 requests/minute quota the corpus is bound by request count, so several
+# letters go into one structured-output request, up to BATCH_TOKEN_BUDGET input tokens
+# (10 RPM x 24k tokens stays under the 250k tokens/minute quota).
+LETTER_CHARS = 30000
+BATCH_TOKEN_BUDGET = 24000
+MAX_BATCH_LETTERS = 8
+
+ANALYSIS_FIELDS = """
+    "identified_sponsor": "Sponsor / company the letter is addressed to",
+    "Regulatory Failure Profile": {
+        "Primary Failure": "One sentence: why the application or conduct was rejected",
+        "Statistical/Execution Risks": ["Each specific statistical or trial-execution deficiency"],
+        "Audit Warning": "What a future auditor must check because of this letter"
+    },
+    "auditor_warning": "One-line lesson for auditing new protocols"
+"""
+
+SINGLE_PROMPT = """Analyze this FDA correspondence (Record #{index}). Extract Sponsor Name and Failure Profile.
+Return ONLY a JSON object:
+{{{fields}}}
+
+LETTER:
+{letter}
+"""
+
+BATCH_PROMPT = """Analyze each of the {count} FDA letters below independently. Extract Sponsor Name and Failure Profile for each.
+Return ONLY a JSON object with exactly one result per letter, using the letter_id given in its <letter> tag:
+{{"results": [{{"letter_id": "L1",{fields}}}]}}
 
-def analyze_with_retry(record, index, retries=3):
-    """Tries to analyze, but waits if the quota is hit."""
-    letter_content = record.get('full_text', record.get('text', ''))[:30000]
-    prompt = f"Analyze this FDA correspondence (Record #{index}). Extract Sponsor Name and Failure Profile. [JSON Output Required]"
+{letters}
+"""
+
+
+def letter_text(record):
+    return str(record.get('full_text', record.get('text', '')))[:LETTER_CHARS]
+
+
+def analyze_with_retry(record, index):
+    """Analyzes one record. Quota waits and 429 retries happen in the shared rate limiter."""
+    prompt = SINGLE_PROMPT.format(index=index, fields=ANALYSIS_FIELDS, letter=letter_text(record))
     
-    for attempt in range(retries):
-        try:
-            response = client.models.generate_content(
-                model=MODEL_ID,
-                contents=prompt,
-                config={'response_mime_type': 'application/json'}
-            )
-            return json.loads(response.text)
-        
-        except Exception as e:
-            if "429" in str(e):
-                wait_time = (attempt + 1) * 30 # Wait 30, then 60, then 90 seconds
-                print(f"⚠️ Quota hit. Waiting {wait_time}s before retrying...")
-                time.sleep(wait_time)
-            else:
-                print(f"❌ Permanent Error on Record {index}: {e}")
-                return None
-    return None
-
-def main():
+    try:
+        return json.loads(gemini.complete(prompt, json_output=True))
+    except Exception as e:
+        print(f"❌ Permanent Error on Record {index}: {e}")
+        return None
+
+
+def make_batches(items, budget=BATCH_TOKEN_BUDGET, max_letters=MAX_BATCH_LETTERS):
+    """Groups [(key, record)] in order into batches of at most `budget` letter tokens (a longer letter goes alone)."""
+    overhead = context_packer.estimate_tokens(BATCH_PROMPT.format(count=max_letters, fields=ANALYSIS_FIELDS, letters=""))
+    batches, current, used = [], [], overhead
+    for key, record in items:
+        tokens = context_packer.estimate_tokens(letter_text(record)) + 10  # + the <letter> tag
+        if current and (used + tokens > budget or len(current) >= max_letters):
+            batches.append(current)
+            current, used = [], overhead
+        current.append((key, record))
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def request_batch(batch):
+    """One request for a batch of (key, record); returns {key: analysis} for the letters the response covers."""
+    letter_ids = {f"L{n}": key for n, (key, _) in enumerate(batch, 1)}
+    letters = "\n\n".join(
+        f'<letter id="{letter_id}">\n{letter_text(record)}\n</letter>'
+        for letter_id, (_, record) in zip(letter_ids, batch)
+    )
+    prompt = BATCH_PROMPT.format(count=len(batch), fields=ANALYSIS_FIELDS, letters=letters)
+    try:
+        response = json.loads(gemini.complete(prompt, json_output=True))
+    except Exception as e:
+        print(f"❌ Batch of {len(batch)} letters failed: {e}")
+        return {}
+
+    results = response.get("results", []) if isinstance(response, dict) else response
+    analyses = {}
+    for result in results if isinstance(results, list) else []:
+        if isinstance(result, dict) and result.get("letter_id") in letter_ids:
+            analyses[letter_ids[result.pop("letter_id")]] = result
+    return analyses
+
+
+def analyze_batch(batch):
+    """
+    {key: analysis} for a batch of (key, record) in as few requests as possible: the whole batch
+    first; if that request fails, each half on its own (down to single letters), and letters the
+    response left out are asked again together.
+    """
+    if len(batch) == 1:
+        key, record = batch[0]
+        analysis = analyze_with_retry(record, key)
+        return {key: analysis} if analysis else {}
+
+    analyses = request_batch(batch)
+    if not analyses:
+        half = len(batch) // 2
+        print(f"🔀 Retrying as two batches of {half} and {len(batch) - half} letters...")
+        return {**analyze_batch(batch[:half]), **analyze_batch(batch[half:])}
+    missing = [(key, record) for key, record in batch if key not in analyses]
+    if missing:
+        analyses.update(analyze_batch(missing))
+    return analyses
+
+
+def main(batched=True):
     with open("fda_letters.json", "r") as f:
         records = json.load(f)
 
-    # NEW: Check if we have an existing progress file to resume from
+    # Append-only KB keyed by record id: resume skips letters already analysed, wherever they are
     kb_file = "guardian_kb_final.json"
-    if os.path.exists(kb_file):
-        with open(kb_file, "r") as f:
-            kb = json.load(f)
-        start_index = len(kb)
-        print(f"🔄 Resuming from record {start_index + 1}...")
-    else:
-        kb = []
-        start_index = 0
-
-    print(f"🚀 Processing records {start_index + 1} to {len(records)}...")
-
-    for i in range(start_index, len(records)):
-        print(f"({i+1}/{len(records)}) Analyzing...")
-        
-        analysis = analyze_with_retry(records[i], i+1)
-        
+    kb = kb_store.KnowledgeBase(kb_store.KB_JSONL)
+    if not os.path.exists(kb_store.KB_JSONL) and os.path.exists(kb_file):
+        kb_store.import_legacy_json(kb, kb_file, records)
+
+    ids = [kb_store.record_id(record) for record in records]
+    pending = [i for i, rid in enumerate(ids) if rid not in kb]
+    print(f"🚀 {len(records) - len(pending)} records already in {kb_store.KB_JSONL}; processing {len(pending)}...")
+
+    added = 0
+    def store(i, analysis):
+        nonlocal added
         if analysis:
             found_name = analysis.get('identified_sponsor', 'Unknown')
-            print(f"   ✅ Identified: {found_name}")
-            
-            kb.append({
-                "meta": {"company": found_name, "date": records[i].get('date')},
+            print(f"   ✅ Record {i+1}: {found_name}")
+
+            # SAVE PROGRESS: one appended line per record
+            kb.add(ids[i], {
+                "meta": {"company": found_name, "date": records[i].get('date', records[i].get('letter_date'))},
                 "audit_insights": analysis
             })
-            
-            # SAVE PROGRESS after every successful record
-            with open(kb_file, "w") as f:
-                json.dump(kb, f, indent=4)
-        
-        # Fundamental "Politeness" Delay (6 seconds = 10 requests per minute)
-        time.sleep(6) 
+            added += 1
+        else:
+            kb.add_failure(ids[i], "analysis failed")  # retried on the next run
+
+    try:
+        if not batched:
+            for n, i in enumerate(pending, 1):
+                print(f"({n}/{len(pending)}) Analyzing record {i+1}...")
+                store(i, analyze_with_retry(records[i], i+1))
+        else:
+            batches = make_batches([(i + 1, records[i]) for i in pending])
+            print(f"📦 {len(pending)} letters packed into {len(batches)} requests (<= {BATCH_TOKEN_BUDGET} tokens each).")
+            for n, batch in enumerate(batches, 1):
+                print(f"({n}/{len(batches)}) Analyzing records {', '.join(str(index) for index, _ in batch)}...")
+                analyses = analyze_batch(batch)
+                for index, _ in batch:
+                    store(index - 1, analyses.get(index))
+    finally:
+        # auditor_agent.py reads the JSON array, in letter order (left untouched if nothing new came in)
+        if added or not os.path.exists(kb_file):
+            exported = kb.export_json(kb_file, order=ids)
+            print(f"💾 Exported {exported} entries to {kb_file}.")
 
     print("\n✅ MASTER KNOWLEDGE BASE COMPLETE!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # --single: one letter per request (the old behaviour)
+    main(batched="--single" not in sys.argv)
\ No newline at end of file
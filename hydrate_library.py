@@ -1,6 +1,9 @@
 
 import pandas as pd
 import os
+import library_store
+import retrieval_index
+import passage_index
 
 MASTER_FILE = "master_regulatory_library.csv"
 HISTORICAL_FILE = "fda_letters.csv"
@@ -210,5 +213,10 @@ def hydrate_full():
     final_df.to_csv(MASTER_FILE, index=False)
     print(f"🏁 FINAL SUCCESS: {MASTER_FILE} now contains {len(final_df)} total records.")
 
+    # 6. Fit the retrieval index once, here, so the agent never refits TF-IDF per request
+    library_store.build_store(MASTER_FILE)
+    retrieval_index.build_index(MASTER_FILE)
+    passage_index.build_passage_index(MASTER_FILE)
+
 if __name__ == "__main__":
     hydrate_full()
\ No newline at end of file
@@ -6,6 +6,7 @@ from datetime import datetime
 
 # --- CONFIGURATION (Matches your Hydrate script) ---
 HISTORICAL_FILE = "fda_letters2.csv"
+LIBRARY_FILE = "master_regulatory_library.csv"
 BASE_URL = "https://api.fda.gov/drug/warningletter.json" # Using the stable endpoint
 
 # The keywords your Hydrator/Auditor cares about
@@ -47,6 +48,12 @@ def fetch_and_map_precedents():
 
         final_df.to_csv(HISTORICAL_FILE, index=False)
         print(f"✅ Success! {HISTORICAL_FILE} updated. Ready for Hydration.")
+
+        # Append-only path: new letters go straight into the library as a delta index segment,
+        # so the daily run doesn't need a full hydration + index rebuild
+        if os.path.exists(LIBRARY_FILE):
+            import retrieval_index
+            retrieval_index.append_documents(processed, LIBRARY_FILE)
         
     except Exception as e:
         print(f"❌ Ingestor failed: {e}")
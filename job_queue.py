@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import sqlite3
+import threading
+import multiprocessing
+
+import worker
+
+# --- 1. Configuration ---
+# A durable audit queue in one SQLite file. A claimed job is leased to its worker for
+# VISIBILITY_TIMEOUT seconds (kept alive by a heartbeat while the audit runs); if the worker dies,
+# the lease runs out and another worker picks the job up. RETRY outcomes come back after an
+# exponential backoff, up to MAX_ATTEMPTS.
+#   python job_queue.py enqueue jobs.jsonl        -> one {"id", "text", "lessons"} job per line
+#   python job_queue.py work --workers 4          -> worker pool; --until-empty to exit when drained
+#   python job_queue.py status | result <job_id>
+QUEUE_DB = os.environ.get("AUDIT_QUEUE_DB", "audit_jobs.sqlite")
+VISIBILITY_TIMEOUT = 600
+HEARTBEAT_INTERVAL = VISIBILITY_TIMEOUT / 4
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30
+BACKOFF_MAX = 900
+POLL_INTERVAL = 2.0
+DEFAULT_WORKERS = 2
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def _connect():
+    conn = sqlite3.connect(QUEUE_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL,
+            lease_expires REAL,
+            worker TEXT,
+            enqueued_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            last_error TEXT,
+            result TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)")
+    return conn
+
+
+def _transaction(fn):
+    """Runs fn(conn) under BEGIN IMMEDIATE, so concurrent workers never claim the same job."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        result = fn(conn)
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)  # jitter, so retried jobs don't return in lockstep
+
+
+# --- 2. Producing ---
+def enqueue(job):
+    """Adds a job ({"id", "text", "lessons"}). Ids are unique: re-enqueueing a known id is a no-op."""
+    now = time.time()
+    def apply(conn):
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO jobs (id, payload, status, available_at, enqueued_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (str(job["id"]), json.dumps(job, ensure_ascii=False), QUEUED, now, now, now)
+        )
+        return cursor.rowcount == 1
+    return _transaction(apply)
+
+
+def enqueue_jsonl(path):
+    added = total = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                total += 1
+                added += enqueue(json.loads(line))
+    print(f"📥 Enqueued {added} new jobs ({total - added} already known) from {path}")
+    return added
+
+
+# --- 3. Consuming ---
+def claim(worker_id):
+    """Leases the next ready job (or one whose lease ran out) to `worker_id`. Returns the row, or None."""
+    def apply(conn):
+        now = time.time()
+        while True:
+            row = conn.execute("""
+                SELECT * FROM jobs
+                WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires <= ?)
+                ORDER BY available_at LIMIT 1
+            """, (QUEUED, now, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            if row["attempts"] >= MAX_ATTEMPTS:
+                # A worker died on its last allowed attempt
+                conn.execute("UPDATE jobs SET status = ?, lease_expires = NULL, updated_at = ?, last_error = ? WHERE id = ?",
+                             (FAILED, now, row["last_error"] or "lease expired on final attempt", row["id"]))
+                continue
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires = ?, worker = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, now + VISIBILITY_TIMEOUT, worker_id, now, row["id"])
+            )
+            return {**dict(row), "attempts": row["attempts"] + 1}
+    return _transaction(apply)
+
+
+def _finish(job_id, worker_id, status, **fields):
+    """Applies the outcome only if `worker_id` still holds the lease (a slow worker may have lost it)."""
+    now = time.time()
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    def apply(conn):
+        cursor = conn.execute(
+            f"UPDATE jobs SET status = ?, lease_expires = NULL, updated_at = ?{', ' + assignments if fields else ''} "
+            "WHERE id = ? AND status = ? AND worker = ?",
+            (status, now, *fields.values(), job_id, RUNNING, worker_id)
+        )
+        return cursor.rowcount == 1
+    return _transaction(apply)
+
+
+def complete(job_id, worker_id, result):
+    return _finish(job_id, worker_id, DONE, result=result, last_error=None)
+
+
+def retry(job_id, worker_id, attempts, error):
+    if attempts >= MAX_ATTEMPTS:
+        return fail(job_id, worker_id, f"gave up after {attempts} attempts: {error}")
+    return _finish(job_id, worker_id, QUEUED, available_at=time.time() + backoff_seconds(attempts), last_error=error)
+
+
+def fail(job_id, worker_id, error):
+    return _finish(job_id, worker_id, FAILED, last_error=error)
+
+
+def heartbeat(job_id, worker_id):
+    def apply(conn):
+        conn.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = ? AND worker = ?",
+                     (time.time() + VISIBILITY_TIMEOUT, job_id, RUNNING, worker_id))
+    _transaction(apply)
+
+
+def _run_with_heartbeat(job, worker_id):
+    stop = threading.Event()
+    def beat():
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                heartbeat(job["id"], worker_id)
+            except Exception as e:
+                print(f"⚠️ Heartbeat failed for {job['id']}: {e}")
+    beater = threading.Thread(target=beat, daemon=True)
+    beater.start()
+    try:
+        return worker.process_audit_job(json.loads(job["payload"]))
+    except Exception as e:
+        return worker.RETRY, f"unhandled: {e}"  # unexpected crash: treat as transient, bounded by MAX_ATTEMPTS
+    finally:
+        stop.set()
+
+
+def work(worker_id=None, until_empty=False):
+    """One worker: claim -> process_audit_job -> store the outcome, until stopped (or the queue drains)."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+    while True:
+        job = claim(worker_id)
+        if job is None:
+            if until_empty and not pending_count():
+                print(f"🏁 [{worker_id}] Queue drained after {processed} jobs.")
+                return processed
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        outcome, output = _run_with_heartbeat(job, worker_id)
+        if outcome == worker.DONE:
+            kept = complete(job["id"], worker_id, output)
+        elif outcome == worker.RETRY:
+            kept = retry(job["id"], worker_id, job["attempts"], output)
+        else:
+            kept = fail(job["id"], worker_id, output)
+        if not kept:
+            print(f"⚠️ [{worker_id}] Lost the lease on {job['id']}; its outcome was dropped.")
+        print(f"   [{worker_id}] {job['id']}: {outcome} (attempt {job['attempts']})")
+        processed += 1
+
+
+def run_pool(n_workers=DEFAULT_WORKERS, until_empty=False):
+    processes = [
+        multiprocessing.Process(target=work, kwargs={"until_empty": until_empty}, daemon=False)
+        for _ in range(n_workers)
+    ]
+    for p in processes:
+        p.start()
+    print(f"👷 {n_workers} audit workers started on {QUEUE_DB}.")
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        # Leased jobs simply come back after VISIBILITY_TIMEOUT
+        for p in processes:
+            p.terminate()
+    print(stats())
+
+
+# --- 4. Inspection ---
+def pending_count():
+    conn = _connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def stats():
+    conn = _connect()
+    try:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    finally:
+        conn.close()
+
+
+def get_job(job_id):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (str(job_id),)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "enqueue":
+        enqueue_jsonl(sys.argv[2])
+    elif command == "work":
+        n = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else DEFAULT_WORKERS
+        run_pool(n, until_empty="--until-empty" in sys.argv)
+    elif command == "result":
+        job = get_job(sys.argv[2])
+        print(job["result"] if job and job["result"] else job)
+    else:
+        print(stats())
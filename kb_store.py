@@ -0,0 +1,144 @@
+import os
+import re
+import json
+import hashlib
+
+# --- 1. Configuration ---
+# Append-only JSONL knowledge base for guardian_int.py. Each analysed letter is one line
+# {"record_id", "status", "entry" | "error"}, written once: per-record I/O stays constant however
+# large the run, and a crash costs at most the line being written. The latest line per record id
+# wins, so a failed record is simply retried and appended again. guardian_kb_final.json (read by
+# auditor_agent.py) is exported from it.
+KB_JSONL = "guardian_kb.jsonl"
+OK, FAILED = "ok", "failed"
+
+# Legacy entries are matched to letters by company; these say nothing about which letter it was
+UNKNOWN_COMPANIES = {"", "unknown", "unknown organization", "n a", "none"}
+COMPANY_SUFFIXES = {"inc", "llc", "ltd", "corp", "corporation", "co", "company", "plc", "gmbh"}
+
+
+def record_id(record):
+    """Stable id of a source letter: its file name and text, not its position in the list."""
+    h = hashlib.blake2b(digest_size=10)
+    h.update(str(record.get("file_name", "")).encode("utf-8"))
+    h.update(b"\0")
+    h.update(str(record.get("full_text", record.get("text", ""))).encode("utf-8"))
+    return h.hexdigest()
+
+
+class KnowledgeBase:
+    """The JSONL file plus an in-memory {record_id: (offset, status)} index for random access."""
+
+    def __init__(self, path=KB_JSONL):
+        self.path = path
+        self.offsets = {}
+        self.statuses = {}
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.path):
+            return
+        good_end = 0
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn last line of a crashed run
+                if not line.endswith(b"\n"):
+                    break
+                self.offsets[record["record_id"]] = offset
+                self.statuses[record["record_id"]] = record["status"]
+                offset += len(line)
+                good_end = offset
+        if good_end != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+            print(f"⚠️ Dropped a partial last line from {self.path}.")
+
+    def __len__(self):
+        return sum(1 for status in self.statuses.values() if status == OK)
+
+    def __contains__(self, rid):
+        """True once the record was analysed successfully (failed records count as not done)."""
+        return self.statuses.get(rid) == OK
+
+    def _append(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.offsets[record["record_id"]] = offset
+        self.statuses[record["record_id"]] = record["status"]
+
+    def add(self, rid, entry, **extra):
+        self._append({"record_id": rid, "status": OK, "entry": entry, **extra})
+
+    def add_failure(self, rid, error):
+        self._append({"record_id": rid, "status": FAILED, "error": str(error)})
+
+    def get(self, rid):
+        """The latest line for `rid` (one seek + one line read), or None."""
+        offset = self.offsets.get(rid)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def entries(self, order=None):
+        """Successful entries, in `order` (a list of record ids) if given, else in append order."""
+        ids = order if order is not None else sorted(self.offsets, key=self.offsets.get)
+        for rid in ids:
+            if rid in self:
+                yield self.get(rid)["entry"]
+
+    def export_json(self, json_path, order=None):
+        """Writes the entries as the JSON array downstream readers expect; swapped in atomically."""
+        tmp_path = f"{json_path}.tmp"
+        count = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for entry in self.entries(order):
+                f.write(("," if count else "") + "\n    " + json.dumps(entry, ensure_ascii=False))
+                count += 1
+            f.write("\n]")
+        os.replace(tmp_path, json_path)
+        return count
+
+
+def _company_key(name):
+    """'Acme Pharma, Inc.' -> 'acme pharma': comparable company names; '' when unknown."""
+    words = [w for w in re.findall(r"\w+", str(name or "").lower()) if w not in COMPANY_SUFFIXES]
+    key = " ".join(words)
+    return "" if key in UNKNOWN_COMPANIES else key
+
+
+def import_legacy_json(kb, json_path, records):
+    """
+    One-off migration of a positional guardian_kb_final.json. Old runs skipped failed records, so
+    positions drift; an entry is only adopted when its company names exactly one unclaimed letter
+    (with the same date, if the entry has one). Entries with an unknown sponsor are re-analysed.
+    """
+    with open(json_path, encoding="utf-8") as f:
+        legacy = json.load(f)
+    unclaimed = {}
+    for record in records:
+        rid = record_id(record)
+        company = _company_key(record.get("company_name"))
+        if company and rid not in kb:
+            unclaimed.setdefault(company, []).append((rid, record.get("date", record.get("letter_date"))))
+    adopted = 0
+    for entry in legacy:
+        meta = entry.get("meta", {})
+        company = _company_key(meta.get("company")) or _company_key(entry.get("audit_insights", {}).get("identified_sponsor"))
+        candidates = [c for c in unclaimed.get(company, []) if not meta.get("date") or c[1] == meta["date"]]
+        if company and len(candidates) == 1:
+            unclaimed[company].remove(candidates[0])
+            kb.add(candidates[0][0], entry, imported_from=json_path)
+            adopted += 1
+    print(f"📦 Imported {adopted} of {len(legacy)} entries from {json_path}; the rest will be re-analysed.")
+    return adopted
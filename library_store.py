@@ -0,0 +1,268 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import pandas as pd
+
+import retrieval_index
+
+# --- 1. Configuration ---
+# The CSVs stay the files everything writes to (hydration, ingestion, scrapers). This SQLite
+# store is an indexed mirror of them, rebuilt automatically whenever their content hash moves.
+# Document ids are CSV row positions, so they line up with the retrieval/passage index rows.
+MASTER_FILE = retrieval_index.MASTER_FILE
+LETTERS_FILE = "fda_letters.csv"
+
+LIBRARY_COLUMNS = ["title", "type", "content", "source", "date"]
+LETTER_COLUMNS = ["doc_type", "recipient", "date", "citations", "text_snippet", "full_text"]
+# Bumped when the tables change, so stores built by older code are rebuilt
+STORE_SCHEMA = 2
+
+# Stat signatures already checked in this process, keyed by store path
+_FRESH = {}
+
+
+def store_path_for(library_path):
+    """master_regulatory_library.csv -> master_regulatory_library.sqlite"""
+    return f"{os.path.splitext(library_path)[0]}.sqlite"
+
+
+def _signature(path):
+    return list(retrieval_index._stat_signature(path)) if os.path.exists(path) else None
+
+
+def _hash(path):
+    return retrieval_index.library_hash(path) if os.path.exists(path) else None
+
+
+# --- 2. Build ---
+def _quote(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+def _insert_frame(conn, table, df, columns, first_id=0):
+    df = df.reindex(columns=columns)
+    rows = [
+        (i, *[None if pd.isna(v) else str(v) for v in values])
+        for i, values in enumerate(df.itertuples(index=False, name=None), first_id)
+    ]
+    placeholders = ", ".join(["?"] * (len(columns) + 1))
+    conn.executemany(f"INSERT INTO {table} (id, {', '.join(map(_quote, columns))}) VALUES ({placeholders})", rows)
+    return len(rows)
+
+
+def build_store(library_path=MASTER_FILE, letters_path=LETTERS_FILE):
+    """Writes the store to a temp file and swaps it in, so readers never see a half-built database."""
+    started = time.time()
+    store_path = store_path_for(library_path)
+    tmp_path = f"{store_path}.tmp{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    library_df = retrieval_index.load_library_frame(library_path, from_store=False)
+    # Typed core columns first; any extra CSV columns are kept too, so the reader loses nothing
+    columns = LIBRARY_COLUMNS + [c for c in library_df.columns if c not in LIBRARY_COLUMNS]
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(f"""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE documents (id INTEGER PRIMARY KEY, {', '.join(f'{_quote(c)} TEXT' for c in columns)});
+            CREATE INDEX documents_type ON documents (type);
+            CREATE INDEX documents_source ON documents (source);
+            CREATE VIRTUAL TABLE documents_fts USING fts5(title, content, content='documents', content_rowid='id');
+            CREATE TABLE letters (id INTEGER PRIMARY KEY, {', '.join(f'{c} TEXT' for c in LETTER_COLUMNS)});
+            CREATE INDEX letters_recipient ON letters (recipient COLLATE NOCASE);
+            CREATE VIRTUAL TABLE letters_fts USING fts5(recipient, full_text, content='letters', content_rowid='id');
+        """)
+
+        n_docs = _insert_frame(conn, "documents", library_df, columns)
+        letters_df = pd.read_csv(letters_path) if os.path.exists(letters_path) else pd.DataFrame(columns=LETTER_COLUMNS)
+        n_letters = _insert_frame(conn, "letters", letters_df, LETTER_COLUMNS)
+        # Recipient names, aliases, application numbers and dates for the Evidence Deep-Dive lookup
+        import entity_index
+        n_entities = entity_index.write_entities(conn, letters_df)
+        conn.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO letters_fts(letters_fts) VALUES ('rebuild')")
+
+        meta = {
+            "schema": STORE_SCHEMA,
+            "library_path": library_path,
+            "library_columns": columns,
+            "library_hash": _hash(library_path),
+            "library_signature": _signature(library_path),
+            "letters_path": letters_path,
+            "letters_hash": _hash(letters_path),
+            "letters_signature": _signature(letters_path),
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()])
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, store_path)
+    _FRESH[store_path] = (meta["library_signature"], meta["letters_signature"])
+    print(f"🗄️ Library store built: {n_docs} documents + {n_letters} letters ({n_entities} entities) in {time.time() - started:.2f}s -> {store_path}")
+    return store_path
+
+
+def append_documents(library_path, new_df, first_row, previous_hash, new_hash):
+    """
+    Adds rows just appended to the library CSV (retrieval_index.append_documents) to a store that
+    matched it before the append. Returns False when it didn't, so the store rebuilds as usual.
+    """
+    store_path = store_path_for(library_path)
+    if not os.path.exists(store_path):
+        return False
+    conn = sqlite3.connect(store_path, timeout=30)
+    try:
+        meta = _read_meta(conn)
+        columns = meta.get("library_columns", [])
+        if meta.get("schema") != STORE_SCHEMA or meta.get("library_hash") != previous_hash:
+            return False
+        if any(c not in columns for c in new_df.columns):
+            return False
+        if conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0] != first_row:
+            return False
+        with conn:
+            _insert_frame(conn, "documents", new_df, columns, first_id=first_row)
+            conn.execute("INSERT INTO documents_fts (rowid, title, content) SELECT id, title, content FROM documents WHERE id >= ?", (first_row,))
+            conn.executemany("UPDATE meta SET value = ? WHERE key = ?", [
+                (json.dumps(new_hash), "library_hash"), (json.dumps(_signature(library_path)), "library_signature")
+            ])
+    finally:
+        conn.close()
+    _FRESH.pop(store_path, None)
+    return True
+
+
+def _read_meta(conn):
+    return {k: json.loads(v) for k, v in conn.execute("SELECT key, value FROM meta")}
+
+
+def _is_fresh(store_path, library_path, letters_path):
+    """Cheap stat check first; the content hashes are only computed when a file was touched."""
+    if not os.path.exists(store_path):
+        return False
+    signatures = (_signature(library_path), _signature(letters_path))
+    if _FRESH.get(store_path) == signatures:
+        return True
+
+    conn = sqlite3.connect(store_path)
+    try:
+        meta = _read_meta(conn)
+        if meta.get("letters_path") != letters_path or meta.get("schema") != STORE_SCHEMA:
+            return False
+        if (meta.get("library_signature"), meta.get("letters_signature")) != signatures:
+            if (meta.get("library_hash"), meta.get("letters_hash")) != (_hash(library_path), _hash(letters_path)):
+                return False
+            # Touched but unchanged: remember the new signatures so the next check is cheap again
+            conn.executemany("UPDATE meta SET value = ? WHERE key = ?", [
+                (json.dumps(signatures[0]), "library_signature"), (json.dumps(signatures[1]), "letters_signature")
+            ])
+            conn.commit()
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+    _FRESH[store_path] = signatures
+    return True
+
+
+def connect(library_path=MASTER_FILE, letters_path=LETTERS_FILE):
+    """Read connection to a store that matches the current CSVs (rebuilding it first if not)."""
+    store_path = store_path_for(library_path)
+    if not _is_fresh(store_path, library_path, letters_path):
+        if os.path.exists(store_path):
+            print(f"♻️ {library_path} or {letters_path} changed. Rebuilding library store...")
+        build_store(library_path, letters_path)
+    return sqlite3.connect(f"file:{store_path}?mode=ro", uri=True)
+
+
+# --- 3. Queries ---
+def _frame(conn, sql, params=()):
+    df = pd.read_sql_query(sql, conn, params=params, index_col="id")
+    df.index.name = None
+    # read_csv types an all-empty column as float NaN; match it so callers see the same frame
+    for column in df.columns[df.isna().all()]:
+        df[column] = df[column].astype(float)
+    return df
+
+
+def _library_columns(conn):
+    return _read_meta(conn)["library_columns"]
+
+
+def _fts_query(text):
+    """Free text -> an FTS5 OR-query of quoted terms (raw punctuation would be FTS5 syntax)."""
+    words = re.findall(r"\w+", str(text))
+    return " OR ".join(f'"{w}"' for w in words)
+
+
+def read_library(library_path=MASTER_FILE, types=None):
+    """
+    Compatibility reader: the library as a DataFrame, like pd.read_csv(library_path).
+    The index holds the CSV row positions, also when filtering by `types`.
+    """
+    conn = connect(library_path)
+    try:
+        sql = f"SELECT id, {', '.join(map(_quote, _library_columns(conn)))} FROM documents"
+        params = ()
+        if types:
+            sql += f" WHERE type IN ({', '.join(['?'] * len(types))})"
+            params = tuple(types)
+        return _frame(conn, sql + " ORDER BY id", params)
+    finally:
+        conn.close()
+
+
+def search_library(query, limit=20, types=None, library_path=MASTER_FILE):
+    """Keyword search over title + content (BM25-ranked). Returns a DataFrame with a 'rank' column, best first."""
+    match = _fts_query(query)
+    if not match:
+        return read_library(library_path, types).head(0).assign(rank=pd.Series(dtype=float))
+    conn = connect(library_path)
+    try:
+        sql = f"""
+            SELECT d.id, {', '.join('d.' + _quote(c) for c in _library_columns(conn))}, bm25(documents_fts) AS rank
+            FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+            WHERE documents_fts MATCH ?
+        """
+        params = [match]
+        if types:
+            sql += f" AND d.type IN ({', '.join(['?'] * len(types))})"
+            params += list(types)
+        return _frame(conn, sql + " ORDER BY rank LIMIT ?", params + [limit])
+    finally:
+        conn.close()
+
+
+def read_letters(library_path=MASTER_FILE):
+    """Compatibility reader for fda_letters.csv."""
+    conn = connect(library_path)
+    try:
+        return _frame(conn, f"SELECT id, {', '.join(LETTER_COLUMNS)} FROM letters ORDER BY id")
+    finally:
+        conn.close()
+
+
+def find_letter(name_to_find, library_path=MASTER_FILE):
+    """First letter whose recipient contains `name_to_find` (case-insensitive), as a dict, or None."""
+    conn = connect(library_path)
+    try:
+        pattern = "%" + re.sub(r"([%_\\])", r"\\\1", str(name_to_find)) + "%"
+        conn.row_factory = sqlite3.Row
+        row = conn.execute(
+            f"SELECT id, {', '.join(LETTER_COLUMNS)} FROM letters WHERE recipient LIKE ? ESCAPE '\\' ORDER BY id LIMIT 1",
+            (pattern,)
+        ).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    build_store()
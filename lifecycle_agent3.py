@@ -1,8 +1,6 @@
 import os
 import pandas as pd
 import re
-import time
-import random
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
@@ -91,13 +89,19 @@ class BiostatLifecycleAgent3:
     import os
 import pandas as pd
 import re
-import time
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
 from dotenv import load_dotenv
 from groq import Groq
 
+import retrieval_index
+import passage_index
+import context_packer
+import llm_clients
+import rate_limiter
+
 # This looks for the .env file and loads the key into your system memory
 load_dotenv()
 
@@ -119,64 +123,115 @@ EVIDENTIARY STANDARDS:
 - UNCERTAINTY: If the literature provides multiple valid paths (e.g., MMRM vs. Multiple Imputation), discuss the trade-offs like a scholar.
 """
 
+# How many letter passages (not whole letters) the audit prompt gets
+PRECEDENT_PASSAGES = 8
+
+
+def clean_latex(text):
+    """\\( \\) -> $ and \\[ \\] -> $$, the delimiters Streamlit's markdown renders."""
+    text = text.replace("\\(", "$").replace("\\)", "$")
+    return text.replace("\\[", "$$").replace("\\]", "$$")
+
+
+def clean_latex_stream(pieces):
+    """clean_latex over a stream of pieces; a trailing backslash waits for the next piece, since it may open a delimiter."""
+    pending = ""
+    for piece in pieces:
+        text = pending + piece
+        pending = "\\" if text.endswith("\\") else ""
+        text = text[:len(text) - len(pending)]
+        if text:
+            yield clean_latex(text)
+    if pending:
+        yield pending
+
+
 class BiostatLifecycleAgent3:
     def __init__(self, api_key, library_path, model_id="llama-3.3-70b-versatile"):
-        self.client = Groq(api_key=api_key)
+        # Calls from parallel audits run on llm_clients' shared event loop and queue on its per-provider semaphore.
+        # Responses are cached on disk, so re-auditing an unchanged protocol costs no quota.
+        self.llm = llm_clients.GroqClient(api_key=api_key, model=model_id, cache=True)
         self.model_id = model_id
         self.library_path = library_path
-        self.knowledge_base = ""
     
-    def _load_library(self, search_query=""):
-        if not os.path.exists("master_regulatory_library.csv"):
+    def _load_library(self, search_query="", token_budget=None):
+        if not os.path.exists(retrieval_index.MASTER_FILE):
             return "⚠️ Knowledge base missing."
-            
-        df = pd.read_csv("master_regulatory_library.csv")
-        df.columns = [c.strip() for c in df.columns]
+
+        # Prebuilt TF-IDF index: the vocabulary and document matrix are fitted once at
+        # hydration time, so only the query is transformed here.
+        index = retrieval_index.get_index(retrieval_index.MASTER_FILE)
+        df = index.frame()
 
         # INTERNAL HELPER: Now with a 'Mandatory' fallback
-        def get_track_context(subset_df, query, limit=5, mandatory=False):
+        def get_track_context(track_mask, query, limit=5, mandatory=False):
+            subset_df = df[track_mask]
             if subset_df.empty: return ""
             
             # If it's a Statutory track, we ALWAYS want the top rules regardless of search
             if mandatory:
                 return "\n".join([f"- [{row['title']}]: {row['content']}" for _, row in subset_df.head(limit).iterrows()])
 
-            texts = subset_df['content'].fillna("").astype(str).tolist()
             try:
-                vectorizer = TfidfVectorizer(stop_words='english')
                 boosted_query = f"{query} ICH FDA regulation statistics"
-                
-                matrix = vectorizer.fit_transform(texts + [boosted_query])
-                sims = cosine_similarity(matrix[-1], matrix[:-1])
+                hits = index.search(boosted_query, top_k=limit, rows=np.flatnonzero(track_mask.to_numpy()))
                 
                 # --- CONSOLE DEBUGGING START ---
-                max_score = sims[0].max()
-                print(f"\n🔍 [RAG DEBUG] Track: {subset_df['source_type'].iloc[0]}")
+                max_score = hits[0][1] if hits else 0.0
+                print(f"\n🔍 [RAG DEBUG] Track: {subset_df['type'].iloc[0]}")
                 print(f"   |-- Top Similarity Score: {max_score:.4f}")
-                print(f"   |-- Library Size: {len(texts)} documents")
+                print(f"   |-- Library Size: {len(subset_df)} documents")
                 
                 if max_score < 0.1:
                     print(f"   |-- ⚠️ WARNING: Low similarity. Results may be irrelevant.")
                 # --- CONSOLE DEBUGGING END ---
 
-                actual_limit = min(len(texts), limit)
-                indices = sims[0].argsort()[-actual_limit:][::-1]
-            except:
+                return "\n".join([f"- [{df.iloc[r]['title']}]: {df.iloc[r]['content']}" for r, _ in hits])
+            except Exception:
                 return "\n".join([f"- [{row['title']}]: {row['content']}" for _, row in subset_df.head(limit).iterrows()])
 
+        if token_budget is not None:
+            return self._pack_library_context(index, df, search_query, token_budget)
+
         # --- THE FIX: MANDATORY LOADING ---
         # We force the Statutory track to load so ICH E9 is NEVER missing
         # Statutory rules (ICH E9, 21 CFR, etc.)
-        stat_ctx = get_track_context(df[df['type'] == 'Statutory'], search_query, limit=10, mandatory=True)
+        stat_ctx = get_track_context(df['type'] == 'Statutory', search_query, limit=10, mandatory=True)
         
         # Academic/Research standards (Your "Academic_Rigor" tag)
-        acad_ctx = get_track_context(df[df['type'] == 'Academic_Rigor'], search_query, limit=3)
+        acad_ctx = get_track_context(df['type'] == 'Academic_Rigor', search_query, limit=3)
         
         # FDA Precedents (Mapped to your TYPE B/C correspondence tags)
-        prec_ctx = get_track_context(df[df['type'].str.contains('TYPE', na=False)], search_query, limit=1)
+        prec_ctx = get_track_context(df['type'].str.contains('TYPE', na=False), search_query, limit=1)
+
+        return f"### MANDATORY RULES ###\n{stat_ctx}\n\n### ACADEMIC/PRECEDENT ###\n{acad_ctx}\n{prec_ctx}"
+
+    def _pack_library_context(self, index, df, search_query, token_budget):
+        """Same tracks as _load_library, but ranked passages packed into `token_budget` tokens."""
+        snippets = []
+        for _, row in df[df['type'] == 'Statutory'].head(10).iterrows():
+            snippets.append(context_packer.snippet(f"- [{row['title']}]: {row['content']}", "rules", mandatory=True))
+
+        boosted_query = f"{search_query} ICH FDA regulation statistics"
+        academic_rows = np.flatnonzero((df['type'] == 'Academic_Rigor').to_numpy())
+        for r, score in index.search(boosted_query, top_k=3, rows=academic_rows):
+            snippets.append(context_packer.snippet(f"- [{df.iloc[r]['title']}]: {df.iloc[r]['content']}", "academic", score=score))
+
+        # Precedent letters are far too long to send whole; their best passages compete instead
+        try:
+            letter_rows = np.flatnonzero(df['type'].str.contains('TYPE', na=False).to_numpy())
+            for hit in passage_index.get_passage_index(retrieval_index.MASTER_FILE).search(search_query, top_k=PRECEDENT_PASSAGES, rows=letter_rows):
+                passage = df.iloc[hit['row']]['content'][hit['start']:hit['end']]
+                snippets.append(context_packer.snippet(
+                    f"- [{df.iloc[hit['row']]['title']} | chars {hit['start']}-{hit['end']}]: {passage}", "precedents", score=hit['score']
+                ))
+        except Exception as e:
+            print(f"⚠️ Passage retrieval failed: {e}")
+
+        kept, _ = context_packer.pack_context(snippets, token_budget)
+        section = lambda name: "\n".join([s['text'] for s in kept if s['section'] == name])
+        return f"### MANDATORY RULES ###\n{section('rules')}\n\n### ACADEMIC/PRECEDENT ###\n{section('academic')}\n{section('precedents')}"
 
-        return f"### MANDATORY RULES ###\n{stat_ctx}\n\n### ACADEMIC/PRECEDENT ###\n{acad_ctx}\n{prec_ctx}"    
-    
     def _generate_response(self, prompt):
         try:
             chat_completion = self.client.chat.completions.create(
@@ -471,36 +526,29 @@ class BiostatLifecycleAgent3:
         return current_protocol
     
 
-    def _generate_response(self, prompt, max_retries=5):
-        retries = 0
-        while retries < max_retries:
-            try:
-                # FIX: Use self.model_id instead of a hardcoded string
-                response = self.client.chat.completions.create(
-                    model=self.model_id, 
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                
-                content = response.choices[0].message.content
-                
-                # Maintain your LaTeX cleaning logic
-                clean_response = content.replace("\\(", "$").replace("\\)", "$")
-                clean_response = clean_response.replace("\\[", "$$").replace("\\]", "$$")
-                return clean_response
-            
-            except Exception as e:
-                # Handle Rate Limits (429)
-                if "429" in str(e):
-                    wait_time = (2 ** retries) + random.random()
-                    print(f"⚠️ Rate Limit Hit (429). Retrying in {wait_time:.2f}s...")
-                    time.sleep(wait_time)
-                    retries += 1
-                # Handle the Deprecation/400 error specifically if needed, 
-                # but using self.model_id solves the root cause.
-                else:
-                    raise e 
-                    
-        raise Exception("Max retries exceeded. API is heavily throttled.")
+    def _generate_response(self, prompt, use_cache=True):
+        # Pacing and 429 back-off live in the shared client: a throttled call waits on the
+        # cross-process token bucket (rate_limiter.py) instead of sleeping blindly here.
+        # use_cache=False forces a fresh answer (response_cache.py keys on model + prompt).
+        try:
+            # FIX: Use self.model_id instead of a hardcoded string
+            content = self.llm.complete(prompt, model=self.model_id, use_cache=use_cache)
+        except Exception as e:
+            if rate_limiter.is_rate_limit_error(e):
+                raise Exception("Max retries exceeded. API is heavily throttled.") from e
+            raise
+
+        # Maintain your LaTeX cleaning logic
+        return clean_latex(content)
+
+    def _generate_response_stream(self, prompt, use_cache=True):
+        """_generate_response, yielding the (LaTeX-cleaned) text as it arrives."""
+        try:
+            yield from clean_latex_stream(self.llm.stream(prompt, model=self.model_id, use_cache=use_cache))
+        except Exception as e:
+            if rate_limiter.is_rate_limit_error(e):
+                raise Exception("Max retries exceeded. API is heavily throttled.") from e
+            raise
 
     
     def generate_interview_questions(self, drug_name, indication):
@@ -571,43 +619,89 @@ class BiostatLifecycleAgent3:
         return self._generate_response(prompt)
 
     def audit_protocol(self, user_protocol, historical_lessons, user_directives=""):
-        df = pd.read_csv(self.library_path)
-        df.columns = [c.strip() for c in df.columns]
+        # Locals, not attributes: one agent serves concurrent audits (eval runner threads, app jobs)
+        knowledge_base, packed_lessons = self._pack_audit_context(user_protocol, historical_lessons, user_directives)
+        prompt = self._build_audit_prompt(user_protocol, knowledge_base, packed_lessons, user_directives)
+        return self._generate_response(prompt)
+
+    def audit_protocol_stream(self, user_protocol, historical_lessons, user_directives=""):
+        """audit_protocol as a generator of report pieces (e.g. for st.write_stream)."""
+        knowledge_base, packed_lessons = self._pack_audit_context(user_protocol, historical_lessons, user_directives)
+        prompt = self._build_audit_prompt(user_protocol, knowledge_base, packed_lessons, user_directives)
+        yield from self._generate_response_stream(prompt)
+
+    def _pack_audit_context(self, user_protocol, historical_lessons, user_directives=""):
+        """Ranks rules, precedent passages and lessons, then packs them into the model's token budget."""
+        # The index is memory-mapped once and only rebuilt when the library CSV changes
+        index = retrieval_index.get_index(self.library_path)
+        df = index.frame()
 
         # --- 1. CLEAN THE DATA (The "nan" Fix) ---
         # If title is missing, combine Source + Date, or use a snippet of content
-        df['title'] = df['title'].fillna(
+        titles = df['title'].fillna(
             df['source'].astype(str) + "_" + df['date'].astype(str)
         ).replace("nan_nan", "FDA_Historical_Letter")
 
         # --- 2. LOAD STATUTORY (The Permanent Resident) ---
-        stat_mask = (df['type'] == 'Statutory') | (df['type'] == 'Academic_Rigor')
-        fixed_docs = df[stat_mask]
-        fixed_context = "### MANDATORY STATUTORY & ACADEMIC RULES ###\n" + "\n\n".join([
-            f"ID: {row['title']}\n{row['content']}" for _, row in fixed_docs.iterrows()
-        ])
-
-        # --- 3. LOCAL RESEARCHER (Picking the best letter) ---
-        letter_df = df[df['type'].str.contains('TYPE', na=False)].copy()
+        # Statutory rows are mandatory; Academic_Rigor rows compete for the budget on relevance
+        snippets = []
+        for r in np.flatnonzero((df['type'] == 'Statutory').to_numpy()):
+            snippets.append(context_packer.snippet(f"ID: {titles.iloc[r]}\n{df.iloc[r]['content']}", "rules", mandatory=True))
+        academic_rows = np.flatnonzero((df['type'] == 'Academic_Rigor').to_numpy())
+        for r, score in index.search(user_protocol, top_k=len(academic_rows), rows=academic_rows):
+            snippets.append(context_packer.snippet(f"ID: {titles.iloc[r]}\n{df.iloc[r]['content']}", "rules", score=score))
+
+        # --- 3. LOCAL RESEARCHER (Picking the best passages) ---
+        # Only the most relevant paragraphs of the matching letters go into the prompt. Every
+        # passage is an exact substring of its letter, so verbatim quotes still validate.
+        letter_rows = np.flatnonzero(df['type'].str.contains('TYPE', na=False).to_numpy())
+        passages = None
         try:
-            vectorizer = TfidfVectorizer(stop_words='english')
-            matrix = vectorizer.fit_transform(letter_df['content'].fillna("").tolist() + [user_protocol])
-            sims = cosine_similarity(matrix[-1], matrix[:-1])
-            
-            # Pulling the TOP 3 most relevant full letters
-            top_indices = sims[0].argsort()[-2:][::-1]
+            passages = passage_index.get_passage_index(self.library_path)
+            for hit in passages.search(user_protocol, top_k=PRECEDENT_PASSAGES, rows=letter_rows):
+                content = df.iloc[hit['row']]['content']
+                snippets.append(context_packer.snippet(
+                    f"[chars {hit['start']}-{hit['end']}] {content[hit['start']:hit['end']]}",
+                    "precedents", score=hit['score'], row=hit['row'], start=hit['start']
+                ))
+        except Exception as e:
+            print(f"⚠️ Passage retrieval failed: {e}")
+
+        # Historical lessons are split into paragraphs and ranked against the protocol too
+        lesson_chunks = [c.strip() for c in re.split(r'\n\s*\n', str(historical_lessons or "")) if c.strip()]
+        lesson_scores = passages.similarity(user_protocol, lesson_chunks) if passages else np.zeros(len(lesson_chunks))
+        for chunk, score in zip(lesson_chunks, lesson_scores):
+            snippets.append(context_packer.snippet(chunk, "lessons", score=float(score)))
+
+        # --- 4. PACK INTO THE TOKEN BUDGET ---
+        # Whatever the template and the protocol itself don't use is left for retrieved context
+        budget = context_packer.remaining_budget(
+            self.model_id, self._build_audit_prompt(user_protocol, "", "", user_directives)
+        )
+        kept, _ = context_packer.pack_context(snippets, budget)
+
+        fixed_context = "### MANDATORY STATUTORY & ACADEMIC RULES ###\n" + "\n\n".join(
+            [s['text'] for s in kept if s['section'] == "rules"]
+        )
+
+        by_letter = {}
+        for s in kept:
+            if s['section'] == "precedents":
+                by_letter.setdefault(s['row'], []).append(s)
+        if by_letter:
             prec_list = []
-            for idx in top_indices:
-                row = letter_df.iloc[idx]
-                prec_list.append(f"SOURCE ID: {row['title']}\n{row['content']}")
-            
-            prec_context = "### TOP 3 FDA HISTORICAL PRECEDENTS ###\n\n" + "\n\n---\n\n".join(prec_list)
-            print(f"✅ Local Researcher selected 3 letters: {', '.join(letter_df.iloc[top_indices]['title'].tolist())}")
-        except:
+            for r, letter_snippets in by_letter.items():
+                excerpts = "\n\n".join([s['text'] for s in sorted(letter_snippets, key=lambda s: s['start'])])
+                prec_list.append(f"SOURCE ID: {titles.iloc[r]}\n{excerpts}")
+            prec_context = "### TOP FDA HISTORICAL PRECEDENTS (RELEVANT PASSAGES) ###\n\n" + "\n\n---\n\n".join(prec_list)
+            print(f"✅ Local Researcher selected {sum(len(v) for v in by_letter.values())} passages from: {', '.join(titles.iloc[list(by_letter)].tolist())}")
+        else:
             prec_context = "Historical precedents unavailable."
 
-        self.knowledge_base = f"{fixed_context}\n\n{prec_context}"
+        packed_lessons = "\n\n".join([s['text'] for s in kept if s['section'] == "lessons"])
+        return f"{fixed_context}\n\n{prec_context}", packed_lessons
 
+    def _build_audit_prompt(self, user_protocol, knowledge_base, historical_lessons, user_directives=""):
         # 4. THE AUDIT
       
         prompt = f"""
@@ -615,7 +709,7 @@ class BiostatLifecycleAgent3:
         ROLE: FDA Statistical Reviewer (Adversarial Audit).
         
         --- INTEGRATED KNOWLEDGE BASE ---
-        {self.knowledge_base}
+        {knowledge_base}
         
         --- HISTORICAL LESSONS ---
         {historical_lessons}
@@ -702,7 +796,7 @@ class BiostatLifecycleAgent3:
         - "Does the Academic Literature (e.g., Akacha, Mallinckrodt) suggest a more robust alternative?" -> [Cite all relevant academic papers from the Knowledge Base]
 
         """
-        return self._generate_response(prompt)
+        return prompt
 
 
     def explain_theory(self, concept_to_explain):
@@ -722,42 +816,39 @@ class BiostatLifecycleAgent3:
         return self._generate_response(prompt)
     
     def optimize_protocol(self, original_protocol, audit_report, user_directives="None", max_iterations=2):
-        # 1. SMART CONTEXT LOADING (Instead of raw file read)
-        # We use the search query to get the top 15 most relevant rules/letters
-        targeted_wisdom = self._load_library(search_query=original_protocol)
-        
+        result = {}
+        for _ in self.optimize_protocol_stream(original_protocol, audit_report, user_directives, max_iterations, result):
+            pass
+        return result["protocol"]
+
+    def optimize_protocol_stream(self, original_protocol, audit_report, user_directives="None", max_iterations=2, result=None):
+        """
+        Yields each rewrite as it is generated, with a short note between iterations. The
+        protocol that wins ends up in result["protocol"] (pass a dict to receive it).
+        """
+        result = {} if result is None else result
         current_protocol = original_protocol
         current_audit = audit_report
         
         for iteration in range(max_iterations):
-            # 2. THE REFINED PROMPT
-            optimization_prompt = f"""
-            {ACADEMIC_MANDATE}
-            ROLE: Principal Biostatistician & Regulatory Strategist.
-            
-            STATISTICAL & REGULATORY GROUND TRUTH:
-            {targeted_wisdom}
-
-            INPUTS:
-            - Draft: {current_protocol}
-            - Auditor's Critique: {current_audit}
-            - User Directives: {user_directives}
-
-            TASK: Rewrite into a 'Submission-Ready' version.
-            1. Resolve EVERY risk flagged by the Auditor. Use SURGICAL precision (numbers, not vague terms).
-            2. Incorporate Senior Reviewer Directives as priority.
-            3. Use 'Gold Standard' methods from Academic References and CITE THEM.
-            4. Formulas in $LaTeX$: $N = \\frac{{(Z_\\alpha + Z_\\beta)^2 \\sigma^2}}{{\\delta^2}}$.
-
-            MANDATORY IMPROVEMENT STANDARDS:
-            1. TRACEABILITY: Cite the Wisdom or Precedents used to justify the fix.
-            2. MATHEMATICAL RIGOR: Use $LaTeX$ for all statistical models (MMRM, Cox, etc.).
-            3. HITL ALIGNMENT: Ensure the fix addresses G-01 through G-04 gates.
+            # 1. SMART CONTEXT LOADING (Instead of raw file read)
+            # We use the search query to get the most relevant rules/letters that fit the token
+            # budget left over by the draft and the critique (both grow between iterations)
+            wisdom_budget = context_packer.remaining_budget(
+                self.model_id, self._build_optimization_prompt("", current_protocol, current_audit, user_directives)
+            )
+            targeted_wisdom = self._load_library(search_query=original_protocol, token_budget=wisdom_budget)
 
-            WARNING: If you provide template text without trial-specific parameters, the Auditor will reject you.
-            """
+            # 2. THE REFINED PROMPT
+            optimization_prompt = self._build_optimization_prompt(targeted_wisdom, current_protocol, current_audit, user_directives)
             
-            candidate_version = self._generate_response(optimization_prompt)
+            if iteration:
+                yield f"\n\n---\n*🔁 Reviewer check failed. Revision {iteration + 1}:*\n\n"
+            pieces = []
+            for piece in self._generate_response_stream(optimization_prompt):
+                pieces.append(piece)
+                yield piece
+            candidate_version = "".join(pieces)
 
             # 3. INTERNAL SELF-CHECK (The Gatekeeper)
             check_prompt = f"""
@@ -770,11 +861,39 @@ class BiostatLifecycleAgent3:
             check_result = self._generate_response(check_prompt)
 
             if "PASS" in check_result.upper():
-                return candidate_version
+                result["protocol"] = candidate_version
+                return
             
             # If it didn't pass, update context for the next loop iteration
             current_protocol = candidate_version
             current_audit = check_result
             
-        return current_protocol
+        result["protocol"] = current_protocol
+
+    def _build_optimization_prompt(self, targeted_wisdom, current_protocol, current_audit, user_directives="None"):
+        return f"""
+        {ACADEMIC_MANDATE}
+        ROLE: Principal Biostatistician & Regulatory Strategist.
+        
+        STATISTICAL & REGULATORY GROUND TRUTH:
+        {targeted_wisdom}
+
+        INPUTS:
+        - Draft: {current_protocol}
+        - Auditor's Critique: {current_audit}
+        - User Directives: {user_directives}
+
+        TASK: Rewrite into a 'Submission-Ready' version.
+        1. Resolve EVERY risk flagged by the Auditor. Use SURGICAL precision (numbers, not vague terms).
+        2. Incorporate Senior Reviewer Directives as priority.
+        3. Use 'Gold Standard' methods from Academic References and CITE THEM.
+        4. Formulas in $LaTeX$: $N = \\frac{{(Z_\\alpha + Z_\\beta)^2 \\sigma^2}}{{\\delta^2}}$.
+
+        MANDATORY IMPROVEMENT STANDARDS:
+        1. TRACEABILITY: Cite the Wisdom or Precedents used to justify the fix.
+        2. MATHEMATICAL RIGOR: Use $LaTeX$ for all statistical models (MMRM, Cox, etc.).
+        3. HITL ALIGNMENT: Ensure the fix addresses G-01 through G-04 gates.
+
+        WARNING: If you provide template text without trial-specific parameters, the Auditor will reject you.
+        """
     
\ No newline at end of file
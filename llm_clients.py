@@ -0,0 +1,354 @@
+import os
+import time
+import queue
+import atexit
+import asyncio
+import inspect
+import threading
+import contextlib
+import contextvars
+
+import rate_limiter
+import response_cache
+
+# --- 1. Configuration ---
+# How many requests each provider may have in flight at once (per process). Override with
+# e.g. LLM_CONCURRENCY_GROQ=8 when a paid tier allows it.
+PROVIDER_CONCURRENCY = {
+    "groq": 4,
+    "gemini": 2,
+}
+DEFAULT_CONCURRENCY = 2
+
+# Attempts after a 429. The wait between them comes from the shared rate limiter, not a fixed sleep.
+RATE_LIMIT_RETRIES = 4
+
+# Every synchronous call (eval runner threads, background jobs, scripts) runs on one event loop in
+# a daemon thread, so the per-provider semaphores and SDK clients bound to it are shared process-wide.
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+_SEMAPHORES = {}
+_SDK_CLIENTS = {}
+
+# Usage counters of the current track_usage() block. A contextvar, so concurrent jobs (threads or
+# asyncio tasks) each count only their own calls.
+_USAGE = contextvars.ContextVar("llm_usage", default=None)
+
+
+def concurrency_limit(provider):
+    env_value = os.environ.get(f"LLM_CONCURRENCY_{provider.upper()}")
+    if env_value:
+        return max(1, int(env_value))
+    return PROVIDER_CONCURRENCY.get(provider, DEFAULT_CONCURRENCY)
+
+
+def _background_loop():
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="llm-event-loop", daemon=True).start()
+            atexit.register(_close_sdk_clients)
+        return _LOOP
+
+
+async def _aclose_sdk_clients():
+    for client in list(_SDK_CLIENTS.values()):
+        # AsyncGroq.close() and genai's client.aio.aclose() are coroutines
+        close = getattr(getattr(client, "aio", None), "aclose", None) or getattr(client, "close", None)
+        try:
+            result = close() if close else None
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            pass
+    _SDK_CLIENTS.clear()
+
+
+def _close_sdk_clients():
+    if _LOOP is not None and _LOOP.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(_aclose_sdk_clients(), _LOOP).result(timeout=5)
+        except Exception:
+            pass
+
+
+@contextlib.contextmanager
+def track_usage():
+    """Counts the LLM calls made inside the block: calls, cache hits, tokens and seconds spent waiting on them."""
+    usage = {"calls": 0, "cached_calls": 0, "tokens": 0, "llm_seconds": 0.0}
+    token = _USAGE.set(usage)
+    try:
+        yield usage
+    finally:
+        _USAGE.reset(token)
+
+
+def _record_usage(cached=False, tokens=0, seconds=0.0):
+    usage = _USAGE.get()
+    if usage is None:
+        return
+    usage["calls"] += 1
+    usage["cached_calls"] += int(cached)
+    usage["tokens"] += tokens
+    usage["llm_seconds"] += seconds
+
+
+async def _with_usage(coro, usage):
+    # The task runs in the loop thread's context: carry over the caller's track_usage() counters
+    _USAGE.set(usage)
+    return await coro
+
+
+def _submit(coro):
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("Blocking LLM call made on the shared LLM event loop; await the coroutine instead.")
+    return asyncio.run_coroutine_threadsafe(_with_usage(coro, _USAGE.get()), loop)
+
+
+def run_sync(coro):
+    """Runs a coroutine on the shared LLM event loop and waits for it, from any thread (or notebook loop)."""
+    return _submit(coro).result()
+
+
+_STREAM_END = object()
+
+
+def iterate_sync(async_iterable):
+    """
+    Plain generator over an async iterator, for synchronous callers (e.g. st.write_stream). The
+    iterator runs on the shared LLM event loop and hands items over as they arrive.
+    """
+    items = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in async_iterable:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+        finally:
+            items.put(_STREAM_END)
+
+    future = _submit(pump())
+    try:
+        while True:
+            item = items.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # A consumer that stops early releases the semaphore slot instead of draining the stream
+        future.cancel()
+
+
+# --- 2. The Shared Client ---
+class LLMClient:
+    """
+    Provider-agnostic async client. `acomplete` waits on the provider's semaphore, so any number
+    of coroutines can be started and only `concurrency_limit(provider)` hit the API at once,
+    and on the cross-process token bucket, so together they stay under the RPM/TPM quota.
+    """
+    provider = None
+
+    def __init__(self, api_key=None, model=None, cache=False):
+        self.api_key = api_key
+        self.model = model
+        # Opt-in: only deterministic callers should get identical answers for identical prompts
+        self.cache = cache
+
+    def _semaphore(self):
+        # Only touched from the shared loop's thread, so no lock is needed
+        if self.provider not in _SEMAPHORES:
+            _SEMAPHORES[self.provider] = asyncio.Semaphore(concurrency_limit(self.provider))
+        return _SEMAPHORES[self.provider]
+
+    def _sdk_client(self):
+        key = (self.provider, self.api_key)
+        if key not in _SDK_CLIENTS:
+            _SDK_CLIENTS[key] = self._make_sdk_client()
+        return _SDK_CLIENTS[key]
+
+    def _make_sdk_client(self):
+        raise NotImplementedError
+
+    async def _acall(self, prompt, model, temperature, json_output, seed=None):
+        """Returns (response text, total tokens reported by the provider or None)."""
+        raise NotImplementedError
+
+    def _astream_call(self, prompt, model, temperature, seed=None):
+        """Async iterator of (text delta, total tokens or None); providers report usage on the last chunk."""
+        raise NotImplementedError
+
+    async def acomplete(self, prompt, model=None, temperature=None, json_output=False, use_cache=None, seed=None):
+        model = model or self.model
+        use_cache = (self.cache if use_cache is None else use_cache) and response_cache.CACHE_ENABLED
+        if use_cache:
+            key = response_cache.cache_key(self.provider, model, prompt, temperature, json_output, seed)
+            cached = response_cache.get(key)
+            if cached is not None:
+                _record_usage(cached=True)
+                return cached
+
+        started = time.time()
+        text, used_tokens = await self._acomplete_uncached(prompt, model, temperature, json_output, seed)
+        _record_usage(tokens=used_tokens, seconds=time.time() - started)
+        if use_cache:
+            response_cache.put(key, text)
+        return text
+
+    async def _acomplete_uncached(self, prompt, model, temperature, json_output, seed=None):
+        reserved = rate_limiter.estimate_request_tokens(prompt)
+        async with self._semaphore():
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                # Blocks until this process (and every other one) is under the RPM/TPM quota
+                await rate_limiter.acquire_async(self.provider, model, reserved)
+                try:
+                    text, used_tokens = await self._acall(prompt, model, temperature, json_output, seed)
+                except Exception as e:
+                    if not rate_limiter.is_rate_limit_error(e) or attempt == RATE_LIMIT_RETRIES:
+                        raise
+                    print(f"⚠️ Rate Limit Hit (429) on {self.provider}/{model}. Backing off (attempt {attempt + 1})...")
+                    rate_limiter.penalize(self.provider, model)
+                    continue
+                if used_tokens:
+                    rate_limiter.settle(self.provider, model, reserved, used_tokens)
+                # Without a reported usage, the reservation is the best estimate
+                return text, used_tokens or reserved
+
+    async def astream(self, prompt, model=None, temperature=None, use_cache=None, seed=None):
+        """
+        Yields the completion in pieces as the provider sends them. Same cache, semaphore, rate
+        limiter and 429 handling as acomplete, except that a 429 can only be retried before the
+        first piece went out. A cache hit arrives as one piece.
+        """
+        model = model or self.model
+        use_cache = (self.cache if use_cache is None else use_cache) and response_cache.CACHE_ENABLED
+        if use_cache:
+            key = response_cache.cache_key(self.provider, model, prompt, temperature, False, seed)
+            cached = response_cache.get(key)
+            if cached is not None:
+                _record_usage(cached=True)
+                yield cached
+                return
+
+        started = time.time()
+        reserved = rate_limiter.estimate_request_tokens(prompt)
+        pieces, used_tokens = [], None
+        async with self._semaphore():
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                await rate_limiter.acquire_async(self.provider, model, reserved)
+                try:
+                    async for delta, tokens in self._astream_call(prompt, model, temperature, seed):
+                        used_tokens = tokens or used_tokens
+                        if delta:
+                            pieces.append(delta)
+                            yield delta
+                except Exception as e:
+                    if pieces or not rate_limiter.is_rate_limit_error(e) or attempt == RATE_LIMIT_RETRIES:
+                        raise
+                    print(f"⚠️ Rate Limit Hit (429) on {self.provider}/{model}. Backing off (attempt {attempt + 1})...")
+                    rate_limiter.penalize(self.provider, model)
+                    continue
+                break
+
+        if used_tokens:
+            rate_limiter.settle(self.provider, model, reserved, used_tokens)
+        _record_usage(tokens=used_tokens or reserved, seconds=time.time() - started)
+        if use_cache:
+            response_cache.put(key, "".join(pieces))
+
+    async def acomplete_many(self, prompts, **kwargs):
+        """All prompts at once (bounded by the semaphore). Failed calls come back as exceptions, in order."""
+        return await asyncio.gather(*[self.acomplete(p, **kwargs) for p in prompts], return_exceptions=True)
+
+    def complete(self, prompt, **kwargs):
+        return run_sync(self.acomplete(prompt, **kwargs))
+
+    def complete_many(self, prompts, **kwargs):
+        return run_sync(self.acomplete_many(prompts, **kwargs))
+
+    def stream(self, prompt, **kwargs):
+        return iterate_sync(self.astream(prompt, **kwargs))
+
+
+# --- 3. Providers ---
+class GroqClient(LLMClient):
+    provider = "groq"
+
+    def _make_sdk_client(self):
+        from groq import AsyncGroq
+        return AsyncGroq(api_key=self.api_key)
+
+    def _request(self, prompt, model, temperature, json_output, seed):
+        kwargs = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        if seed is not None:
+            kwargs["seed"] = seed
+        if json_output:
+            kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+    async def _acall(self, prompt, model, temperature, json_output, seed=None):
+        response = await self._sdk_client().chat.completions.create(**self._request(prompt, model, temperature, json_output, seed))
+        usage = getattr(response, "usage", None)
+        return response.choices[0].message.content, getattr(usage, "total_tokens", None)
+
+    async def _astream_call(self, prompt, model, temperature, seed=None):
+        stream = await self._sdk_client().chat.completions.create(
+            **self._request(prompt, model, temperature, False, seed), stream=True
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            # Groq reports usage on the final chunk, under x_groq
+            usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+            yield delta, getattr(usage, "total_tokens", None)
+
+
+class GeminiClient(LLMClient):
+    provider = "gemini"
+
+    def _make_sdk_client(self):
+        from google import genai
+        return genai.Client(api_key=self.api_key)
+
+    def _config(self, temperature, json_output, seed):
+        config = {}
+        if temperature is not None:
+            config["temperature"] = temperature
+        if seed is not None:
+            config["seed"] = seed
+        if json_output:
+            config["response_mime_type"] = "application/json"
+        return config or None
+
+    async def _acall(self, prompt, model, temperature, json_output, seed=None):
+        response = await self._sdk_client().aio.models.generate_content(
+            model=model, contents=prompt, config=self._config(temperature, json_output, seed)
+        )
+        usage = getattr(response, "usage_metadata", None)
+        return response.text, getattr(usage, "total_token_count", None)
+
+    async def _astream_call(self, prompt, model, temperature, seed=None):
+        stream = await self._sdk_client().aio.models.generate_content_stream(
+            model=model, contents=prompt, config=self._config(temperature, False, seed)
+        )
+        async for chunk in stream:
+            usage = getattr(chunk, "usage_metadata", None)
+            yield chunk.text, getattr(usage, "total_token_count", None)
+
+
+PROVIDERS = {"groq": GroqClient, "gemini": GeminiClient}
+
+
+def get_client(provider, api_key=None, model=None, cache=False):
+    return PROVIDERS[provider](api_key=api_key, model=model, cache=cache)
@@ -3,6 +3,9 @@ import urllib.parse
 import pandas as pd
 import xml.etree.ElementTree as ET
 import os
+import sys
+import json
+from datetime import date
 
 # --- 1. YOUR ORIGINAL FDA LOGIC (Restored) ---
 BASE_URL = "https://api.fda.gov/transparency/crl.json"
@@ -10,6 +13,8 @@ BIMO_CITATIONS = "(312.60 OR 312.50)"
 STATISTICAL_VIOLATIONS = "(ineligible+OR+unblinded+OR+stratification+OR+sample+size+OR+protocol+deviation)"
 RECIPIENT_FILTER = "(recipient:Sponsor+OR+recipient:Company)"
 SEARCH_QUERY = f'citation:{BIMO_CITATIONS}+AND+text:{STATISTICAL_VIOLATIONS}+AND+{RECIPIENT_FILTER}' 
+LIBRARY_FILE = "master_regulatory_library.csv"
+STATE_FILE = "ingestor_state.json"
 
 def fetch_fda_original():
     print(f"📡 Using your original FDA query...")
@@ -72,7 +77,7 @@ def run_sync():
     
     # Step B: Save Live Data to CSV
     combined_live = fda_data + pubmed_data
-    pd.DataFrame(combined_live).to_csv("master_regulatory_library.csv", index=False)
+    pd.DataFrame(combined_live).to_csv(LIBRARY_FILE, index=False)
     print(f"📡 Scraped {len(combined_live)} live records.")
 
     # Step C: TRIGGER HYDRATION (This adds your wisdom)
@@ -83,5 +88,26 @@ def run_sync():
     except Exception as e:
         print(f"❌ Could not find hydrate_library.py: {e}")
 
+# --- 4. THE INCREMENTAL SYNC (Daily runs) ---
+def run_incremental_sync():
+    """Appends only the newly scraped records to the library and indexes them as a delta segment."""
+    if not os.path.exists(LIBRARY_FILE):
+        print("📂 No library yet. Running a full sync first...")
+        return run_sync()
+
+    combined_live = fetch_fda_original() + fetch_pubmed_simple()
+    print(f"📡 Scraped {len(combined_live)} live records.")
+
+    import retrieval_index
+    added = retrieval_index.append_documents(combined_live, LIBRARY_FILE)
+
+    with open(STATE_FILE, "w") as f:
+        json.dump({"last_sync": date.today().isoformat()}, f)
+    print(f"✅ Incremental sync complete: {added} new records appended to {LIBRARY_FILE}.")
+
 if __name__ == "__main__":
-    run_sync()
\ No newline at end of file
+    # Default is the cheap append-only path; '--full' rewrites and re-hydrates the whole library
+    if "--full" in sys.argv:
+        run_sync()
+    else:
+        run_incremental_sync()
\ No newline at end of file
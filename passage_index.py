@@ -0,0 +1,215 @@
+import os
+import re
+import time
+import shutil
+import numpy as np
+
+import chunker
+import retrieval_index
+
+# --- 1. Configuration ---
+# Passages are exact substrings of a letter: paragraphs, or runs of whole sentences when a
+# paragraph is too long. Offsets are kept so quotes can always be traced back to the source.
+MAX_PASSAGE_CHARS = 1200
+MIN_PASSAGE_CHARS = 120
+
+# Scanned tables (lab shifts, page footers) split into "passages" full of numbers that outrank
+# real findings. A passage must be mostly words to be indexed.
+MIN_WORD_RATIO = 0.6
+WORD = re.compile(r'[A-Za-z]{3,}')
+
+# The old lifecycle_agent "hot zone" keywords. Passages containing one get a small score boost.
+RISK_KEYWORDS = ["multiplicity", "alpha", "p-value", "dropout", "missing data", "estimand", "bias", "sample size"]
+HOT_ZONE_BOOST = 0.05
+
+
+def passage_dir_for(library_path):
+    return os.path.join(retrieval_index.index_dir_for(library_path), "passages")
+
+
+# --- 2. Splitting (paragraphs -> sentences, with offsets) ---
+def split_passages(text, max_chars=MAX_PASSAGE_CHARS, min_chars=MIN_PASSAGE_CHARS):
+    """Returns [(start, end), ...] such that text[start:end] is each passage, verbatim."""
+    passages = []
+    for p_start, p_end in chunker.split_spans(text, chunker.PARAGRAPH_BREAK, 0, len(text)):
+        if p_end - p_start <= max_chars:
+            passages.append((p_start, p_end))
+            continue
+
+        # Long paragraph: pack consecutive whole sentences up to max_chars
+        run_start = run_end = None
+        for s_start, s_end in chunker.split_spans(text, chunker.SENTENCE_END, p_start, p_end):
+            if run_start is not None and s_end - run_start > max_chars:
+                passages.append((run_start, run_end))
+                run_start = None
+            if run_start is None:
+                run_start = s_start
+            run_end = s_end
+        if run_start is not None:
+            passages.append((run_start, run_end))
+
+    return [(s, e) for s, e in passages if e - s >= min_chars and _is_prose(text[s:e])]
+
+
+def _is_prose(passage):
+    tokens = passage.split()
+    return bool(tokens) and sum(1 for t in tokens if WORD.match(t)) / len(tokens) >= MIN_WORD_RATIO
+
+
+# --- 3. Build ---
+def _passages(contents, first_row=0):
+    """(spans [(row, start, end)], passage texts, hot-zone flags) for library rows first_row, first_row+1, ..."""
+    spans, texts = [], []
+    for row, content in enumerate(contents, first_row):
+        for start, end in split_passages(content):
+            spans.append((row, start, end))
+            texts.append(content[start:end])
+    spans = np.array(spans, dtype=np.int64).reshape(-1, 3)
+    hot = np.array([any(k in t.lower() for k in RISK_KEYWORDS) for t in texts], dtype=bool)
+    return spans, texts, hot
+
+
+def build_passage_index(library_path=retrieval_index.MASTER_FILE):
+    started = time.time()
+    df = retrieval_index.get_index(library_path).frame()
+    passage_dir = passage_dir_for(library_path)
+    spans, texts, hot = _passages(df['content'].fillna("").astype(str))
+
+    old_segments, next_seq = [], 1
+    if os.path.exists(os.path.join(passage_dir, retrieval_index.MANIFEST_FILE)):
+        old_manifest = retrieval_index._read_manifest(passage_dir)
+        old_segments = old_manifest.get("segments", [old_manifest["segment"]] if "segment" in old_manifest else [])
+        next_seq = old_manifest.get("next_segment", 2)
+
+    # New files and a new segment directory: a loaded index keeps memory-mapping the old ones
+    os.makedirs(passage_dir, exist_ok=True)
+    retrieval_index._save_array(os.path.join(passage_dir, "spans.npy"), spans)
+    retrieval_index._save_array(os.path.join(passage_dir, "hot.npy"), hot)
+    # sublinear_tf: a passage repeating "missing" ten times is not ten times as relevant
+    segment = retrieval_index._write_segment(passage_dir, next_seq, texts, first_row=0, sublinear_tf=True)
+    retrieval_index._write_manifest(passage_dir, {
+        "library_path": library_path,
+        "library_hash": retrieval_index.library_hash(library_path),
+        "n_rows": len(df),
+        "n_passages": len(texts),
+        "segments": [segment],
+        "next_segment": next_seq + 1,
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    for old in old_segments:
+        shutil.rmtree(os.path.join(passage_dir, old["name"]), ignore_errors=True)
+
+    print(f"✂️ Passage index built: {len(texts)} passages from {len(df)} documents in {time.time() - started:.2f}s.")
+    return PassageIndex.load(library_path)
+
+
+def append_passages(library_path, new_df, first_row, previous_hash, new_hash):
+    """
+    Indexes the passages of rows just appended to the library as a delta segment (like the
+    retrieval index). Returns False, leaving a full rebuild to the next load, when the index
+    didn't match the library before the append or already has MAX_SEGMENTS segments.
+    """
+    passage_dir = passage_dir_for(library_path)
+    manifest = retrieval_index._read_manifest(passage_dir)
+    if manifest.get("library_hash") != previous_hash or manifest.get("n_rows") != first_row:
+        return False
+    if len(manifest.get("segments", [])) >= retrieval_index.MAX_SEGMENTS:
+        return False
+
+    spans, texts, hot = _passages(new_df['content'].fillna("").astype(str), first_row)
+    if texts:
+        # Transformed with the base segment's vocabulary/IDF, so passage scores stay comparable
+        segment = retrieval_index._write_segment(passage_dir, manifest["next_segment"], texts,
+                                                 first_row=manifest["n_passages"],
+                                                 vectorizer=retrieval_index._base_vectorizer(passage_dir, manifest))
+        manifest["segments"] = manifest["segments"] + [segment]
+        manifest["next_segment"] += 1
+        retrieval_index._save_array(os.path.join(passage_dir, "spans.npy"),
+                                    np.concatenate([np.load(os.path.join(passage_dir, "spans.npy")), spans]))
+        retrieval_index._save_array(os.path.join(passage_dir, "hot.npy"),
+                                    np.concatenate([np.load(os.path.join(passage_dir, "hot.npy")), hot]))
+    manifest.update(library_hash=new_hash, n_rows=first_row + len(new_df), n_passages=manifest["n_passages"] + len(texts))
+    retrieval_index._write_manifest(passage_dir, manifest)
+    return True
+
+
+# --- 4. The Passage Index ---
+class PassageIndex:
+    def __init__(self, library_path, manifest, segments, spans, hot):
+        self.library_path = library_path
+        self.manifest = manifest
+        self.segments = segments
+        self.spans = spans
+        self.hot = hot
+
+    @classmethod
+    def load(cls, library_path=retrieval_index.MASTER_FILE):
+        passage_dir = passage_dir_for(library_path)
+        manifest = retrieval_index._read_manifest(passage_dir)
+        if "segments" not in manifest:
+            raise ValueError("index predates segmented layout")
+        segments = [retrieval_index.Segment.load(passage_dir, meta) for meta in manifest["segments"]]
+        spans = np.load(os.path.join(passage_dir, "spans.npy"), mmap_mode='r')
+        hot = np.load(os.path.join(passage_dir, "hot.npy"), mmap_mode='r')
+        return cls(library_path, manifest, segments, spans, hot)
+
+    def search(self, query, top_k=8, rows=None, per_row_limit=3):
+        """
+        Returns the best passages as dicts {row, start, end, score}, best first.
+        `rows` restricts the search to those library rows (e.g. only FDA letters).
+        """
+        # Delta segments share the base vocabulary/IDF, so their cosines concatenate in passage order
+        scores = np.concatenate([segment.scores(query) for segment in self.segments]) + HOT_ZONE_BOOST * self.hot
+        candidates = np.arange(len(scores))
+        if rows is not None:
+            candidates = candidates[np.isin(self.spans[:, 0], np.asarray(rows))]
+
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        results, per_row = [], {}
+        for i in order:
+            row, start, end = (int(v) for v in self.spans[i])
+            if per_row.get(row, 0) >= per_row_limit:
+                continue
+            per_row[row] = per_row.get(row, 0) + 1
+            results.append({"row": row, "start": start, "end": end, "score": float(scores[i])})
+            if len(results) >= top_k:
+                break
+        return results
+
+    def similarity(self, query, texts):
+        """Cosine similarity of each text to the query, in the passage vocabulary (of the base segment)."""
+        vectorizer = self.segments[0].vectorizer
+        if vectorizer is None or not texts:
+            return np.zeros(len(texts))
+        query_vec = vectorizer.transform([query])
+        return (vectorizer.transform(texts) @ query_vec.T).toarray().ravel()
+
+
+_LOADED = {}
+
+
+def get_passage_index(library_path=retrieval_index.MASTER_FILE):
+    """Loads the passage index, rebuilding it whenever the library content hash moves."""
+    current_hash = retrieval_index.get_index(library_path).manifest["library_hash"]
+    index = _LOADED.get(library_path)
+    if index is not None and index.manifest["library_hash"] == current_hash:
+        return index
+
+    index = None
+    if os.path.exists(os.path.join(passage_dir_for(library_path), retrieval_index.MANIFEST_FILE)):
+        try:
+            index = PassageIndex.load(library_path)
+            if index.manifest["library_hash"] != current_hash:
+                index = None
+        except Exception as e:
+            print(f"⚠️ Could not load passage index ({e}). Rebuilding...")
+            index = None
+
+    if index is None:
+        index = build_passage_index(library_path)
+    _LOADED[library_path] = index
+    return index
+
+
+if __name__ == "__main__":
+    build_passage_index()
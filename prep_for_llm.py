@@ -1,10 +1,22 @@
+import os
 import pandas as pd
 import json
+import hashlib
+
+import chunker
 
 # --- Configuration ---
 CSV_FILENAME = "fda_letters.csv"
 OUTPUT_PROMPTS_FILENAME = "llm_analysis_prompts.json"
-CHUNK_SIZE = 4000  # A typical safe chunk size for processing large documents
+# The manifest stores only (document, chunk offsets, template id) per prompt, one JSON line each;
+# prompts are rendered from fda_letters.csv on demand. Full prompts are only written by the
+# explicit exports (--export-jsonl, or --export-json for the old llm_analysis_prompts.json).
+MANIFEST_FILENAME = "llm_prompt_manifest.jsonl"
+OUTPUT_PROMPTS_JSONL = "llm_analysis_prompts.jsonl"
+MANIFEST_VERSION = 1
+# Sentence-aligned chunks sized in tokens, with their character offsets (see chunker.py)
+CHUNK_TOKENS = chunker.CHUNK_TOKENS
+OVERLAP_TOKENS = chunker.OVERLAP_TOKENS
 
 # --- 1. The Structured Prompt Template ---
 # This prompt defines the LLM's task and the desired output schema.
@@ -42,58 +54,139 @@ Generate ONLY a single JSON array containing objects for each finding.
 ]
 """
 
-# --- 2. Text Chunking Function ---
-def chunk_text(text, chunk_size):
-    """Splits a long string into smaller, manageable chunks."""
-    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+# Templates by id, so a manifest entry says which one renders it
+TEMPLATE_ID = "fda_findings_v1"
+TEMPLATES = {TEMPLATE_ID: PROMPT_TEMPLATE}
 
-# --- 3. Main Processing Function ---
-def prepare_data_for_llm(csv_filename):
+# --- 2. The Manifest (offsets only) ---
+def _source_hash(csv_filename):
+    """SHA-256 of the raw CSV bytes: the retrieval_index.library_hash digest, without importing scikit-learn."""
+    h = hashlib.sha256()
+    with open(csv_filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def build_manifest(csv_filename=CSV_FILENAME, manifest_path=MANIFEST_FILENAME, template_id=TEMPLATE_ID):
+    """Streams one {document_id, doc_index, chunk_id, char_start, char_end, template_id} line per chunk."""
     try:
         df = pd.read_csv(csv_filename)
     except FileNotFoundError:
         print(f"Error: {csv_filename} not found. Please run the data fetching script first.")
+        return None
+
+    header = {"manifest_version": MANIFEST_VERSION, "source": csv_filename,
+              "source_hash": _source_hash(csv_filename),
+              "chunk_tokens": CHUNK_TOKENS, "overlap_tokens": OVERLAP_TOKENS}
+    n_entries = 0
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        # Iterate through each letter in the dataframe
+        for index, (recipient, full_text) in enumerate(df.reindex(columns=["recipient", "full_text"]).itertuples(index=False, name=None)):
+            # Split the document into chunks
+            chunks = chunker.chunk_document(str(full_text), CHUNK_TOKENS, OVERLAP_TOKENS)
+            for chunk in chunks:
+                f.write(json.dumps({
+                    'document_id': f"doc_{index}_{recipient}",
+                    'doc_index': index,
+                    'chunk_id': chunk["index"] + 1,
+                    'char_start': chunk["start"],
+                    'char_end': chunk["end"],
+                    'template_id': template_id,
+                }, ensure_ascii=False) + "\n")
+            n_entries += len(chunks)
+    os.replace(tmp_path, manifest_path)
+
+    print(f"✅ Manifest of {n_entries} prompts over {len(df)} documents written to '{manifest_path}' "
+          f"({os.path.getsize(manifest_path) / 1024:.0f} KB).")
+    return manifest_path
+
+
+def read_manifest_header(manifest_path=MANIFEST_FILENAME):
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.loads(f.readline())
+
+
+def iter_manifest(manifest_path=MANIFEST_FILENAME):
+    """Manifest entries one at a time (the header line is skipped)."""
+    with open(manifest_path, encoding="utf-8") as f:
+        f.readline()
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _current_manifest(manifest_path, csv_filename):
+    """Offsets are only valid for the CSV they were computed on: rebuild the manifest if it changed."""
+    if os.path.exists(manifest_path):
+        header = read_manifest_header(manifest_path)
+        if (header.get("manifest_version"), header.get("source_hash"), header.get("chunk_tokens"), header.get("overlap_tokens")) == \
+                (MANIFEST_VERSION, _source_hash(csv_filename), CHUNK_TOKENS, OVERLAP_TOKENS):
+            return manifest_path
+        print(f"♻️ {csv_filename} or the chunking changed since '{manifest_path}' was built. Rebuilding it...")
+    return build_manifest(csv_filename, manifest_path)
+
+
+# --- 3. Rendering on Demand ---
+def iter_prompts(manifest_path=MANIFEST_FILENAME, csv_filename=CSV_FILENAME):
+    """
+    Generator of {document_id, chunk_id, char_start, char_end, template_id, prompt}, rendered one
+    at a time from the manifest and the letters (read once), so callers can start on the first prompt.
+    """
+    if _current_manifest(manifest_path, csv_filename) is None:
         return
+    df = pd.read_csv(csv_filename).reindex(columns=["doc_type", "date", "full_text"])
+    for entry in iter_manifest(manifest_path):
+        doc_type, doc_date, full_text = df.iloc[entry["doc_index"]]
+        # Populate the template with the current chunk and context
+        structured_prompt = TEMPLATES[entry["template_id"]].format(
+            DOC_TYPE=doc_type,
+            DOC_DATE=doc_date,
+            TEXT_CHUNK=str(full_text)[entry["char_start"]:entry["char_end"]]
+        )
+        yield {**entry, 'prompt': structured_prompt}
+
 
-    llm_prompts_list = []
-    
-    # Iterate through each letter in the dataframe
-    for index, row in df.iterrows():
-        full_text = str(row['full_text'])
-        doc_type = row['doc_type']
-        doc_date = row['date']
-        
-        # Split the document into chunks
-        chunks = chunk_text(full_text, CHUNK_SIZE)
-        
-        print(f"Processing document {index + 1} ({doc_type}). Total chunks: {len(chunks)}")
-        
-        # Create a unique prompt for each chunk
-        for i, chunk in enumerate(chunks):
-            
-            # Populate the template with the current chunk and context
-            structured_prompt = PROMPT_TEMPLATE.format(
-                DOC_TYPE=doc_type,
-                DOC_DATE=doc_date,
-                TEXT_CHUNK=chunk
-            )
-            
-            llm_prompts_list.append({
-                'document_id': f"doc_{index}_{row['recipient']}",
-                'chunk_id': i + 1,
-                'prompt': structured_prompt
-            })
-            
-            # NOTE: In a real system, you would send structured_prompt to the LLM API here.
-            
-    # Save the resulting list of structured prompts
-    with open(OUTPUT_PROMPTS_FILENAME, 'w', encoding='utf-8') as f:
-        json.dump(llm_prompts_list, f, ensure_ascii=False, indent=4)
-        
-    print(f"\n✅ Successfully prepared {len(llm_prompts_list)} structured prompts.")
-    print(f"The file '{OUTPUT_PROMPTS_FILENAME}' contains the input for your LLM analysis.")
+def export_prompts_jsonl(output_path=OUTPUT_PROMPTS_JSONL, manifest_path=MANIFEST_FILENAME, csv_filename=CSV_FILENAME):
+    """Materializes every prompt, one JSON line each, without holding them all in memory."""
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for item in iter_prompts(manifest_path, csv_filename):
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"✅ Exported {count} rendered prompts to '{output_path}'.")
+    return count
+
+
+def export_prompts_json(output_path=OUTPUT_PROMPTS_FILENAME, manifest_path=MANIFEST_FILENAME, csv_filename=CSV_FILENAME):
+    """The old llm_analysis_prompts.json array, streamed item by item."""
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for item in iter_prompts(manifest_path, csv_filename):
+            f.write(("," if count else "") + "\n    " + json.dumps(item, ensure_ascii=False))
+            count += 1
+        f.write("\n]")
+    print(f"✅ Exported {count} rendered prompts to '{output_path}'.")
+    return count
+
+
+def prepare_data_for_llm(csv_filename):
+    """Builds the prompt manifest; render prompts with iter_prompts() or the exports."""
+    manifest_path = build_manifest(csv_filename, MANIFEST_FILENAME)
+    if manifest_path:
+        print(f"The file '{manifest_path}' indexes the input for your LLM analysis (prompts render on demand).")
+    return manifest_path
 
 
 # --- Execution Block ---
 if __name__ == "__main__":
-    prepare_data_for_llm(CSV_FILENAME)
\ No newline at end of file
+    import sys
+    if "--export-jsonl" in sys.argv:
+        export_prompts_jsonl()
+    elif "--export-json" in sys.argv:
+        export_prompts_json()
+    else:
+        prepare_data_for_llm(CSV_FILENAME)
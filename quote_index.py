@@ -0,0 +1,198 @@
+import os
+import re
+import mmap
+import time
+import hashlib
+import numpy as np
+
+import retrieval_index
+
+# --- 1. Configuration ---
+# A quote is verified when its normalized form is a substring of a normalized library row
+# (the validator's original rule). The index makes the common case, an invented quote, a few
+# binary searches: every word 3-gram of the library is hashed into a sorted uint64 array, and a
+# quote whose interior 3-grams are not all in it cannot be in the library. Quotes that pass the
+# filter are confirmed with one substring search over the memory-mapped normalized buffer.
+NGRAM = 3
+SEPARATOR = "\x00"  # never survives normalization, so a match cannot span two rows
+
+BUFFER_FILE = "buffer.txt"
+HASHES_FILE = "ngrams.npy"
+STARTS_FILE = "starts.npy"
+
+NON_WORD = re.compile(r'[^\w\s]')
+QUOTED = re.compile(r'"([^"]*)"')
+
+
+def quote_dir_for(library_path):
+    return os.path.join(retrieval_index.index_dir_for(library_path), "quotes")
+
+
+def normalize(text):
+    """Same rule the validator always used: drop punctuation, lower-case, strip."""
+    return NON_WORD.sub('', str(text)).lower().strip()
+
+
+def _ngram_hashes(words):
+    hashes = [
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + NGRAM]).encode("utf-8"), digest_size=8).digest(), "little")
+        for i in range(len(words) - NGRAM + 1)
+    ]
+    return np.array(hashes, dtype=np.uint64)
+
+
+# --- 2. Build ---
+def build_quote_index(library_path=retrieval_index.MASTER_FILE):
+    started = time.time()
+    df = retrieval_index.get_index(library_path).frame()
+    quote_dir = quote_dir_for(library_path)
+    os.makedirs(quote_dir, exist_ok=True)
+
+    normalized = [normalize(c) for c in df['content']]
+    buffer = SEPARATOR.join(normalized).encode("utf-8")
+
+    # Byte offset where each row starts in the buffer, to map a match back to its row
+    starts, offset = [], 0
+    for text in normalized:
+        starts.append(offset)
+        offset += len(text.encode("utf-8")) + len(SEPARATOR)
+
+    hashes = np.unique(np.concatenate([_ngram_hashes(t.split()) for t in normalized] + [np.zeros(0, np.uint64)]))
+
+    # Swapped in, never rewritten in place: loaded indexes keep memory-mapping the old files
+    buffer_path = os.path.join(quote_dir, BUFFER_FILE)
+    with open(f"{buffer_path}.tmp", "wb") as f:
+        f.write(buffer)
+    os.replace(f"{buffer_path}.tmp", buffer_path)
+    retrieval_index._save_array(os.path.join(quote_dir, HASHES_FILE), hashes)
+    retrieval_index._save_array(os.path.join(quote_dir, STARTS_FILE), np.array(starts, dtype=np.int64))
+    retrieval_index._write_manifest(quote_dir, {
+        "library_path": library_path,
+        "library_hash": retrieval_index.library_hash(library_path),
+        "n_rows": len(normalized),
+        "n_ngrams": int(len(hashes)),
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+
+    print(f"🔎 Quote index built: {len(hashes)} word {NGRAM}-grams over {len(normalized)} rows in {time.time() - started:.2f}s.")
+    return QuoteIndex.load(library_path)
+
+
+def append_quotes(library_path, new_df, first_row, previous_hash, new_hash):
+    """
+    Adds rows just appended to the library: their text goes on the end of the buffer and their
+    3-grams are merged into the sorted hash array. Returns False, leaving a full rebuild to the
+    next load, when the index didn't match the library before the append.
+    """
+    quote_dir = quote_dir_for(library_path)
+    manifest = retrieval_index._read_manifest(quote_dir)
+    if manifest.get("library_hash") != previous_hash or manifest.get("n_rows") != first_row or not first_row:
+        return False
+
+    normalized = [normalize(c) for c in new_df['content']]
+    buffer_path = os.path.join(quote_dir, BUFFER_FILE)
+    starts, offset = [], os.path.getsize(buffer_path) + len(SEPARATOR)
+    for text in normalized:
+        starts.append(offset)
+        offset += len(text.encode("utf-8")) + len(SEPARATOR)
+    new_hashes = np.concatenate([_ngram_hashes(t.split()) for t in normalized] + [np.zeros(0, np.uint64)])
+    hashes = np.union1d(np.load(os.path.join(quote_dir, HASHES_FILE)), new_hashes)
+
+    # Appending leaves the bytes a loaded index has mapped untouched
+    with open(buffer_path, "ab") as f:
+        f.write((SEPARATOR + SEPARATOR.join(normalized)).encode("utf-8"))
+    retrieval_index._save_array(os.path.join(quote_dir, HASHES_FILE), hashes)
+    retrieval_index._save_array(os.path.join(quote_dir, STARTS_FILE),
+                                np.concatenate([np.load(os.path.join(quote_dir, STARTS_FILE)), np.array(starts, dtype=np.int64)]))
+    manifest.update(library_hash=new_hash, n_rows=first_row + len(normalized), n_ngrams=int(len(hashes)))
+    retrieval_index._write_manifest(quote_dir, manifest)
+    return True
+
+
+# --- 3. The Quote Index ---
+class QuoteIndex:
+    def __init__(self, library_path, manifest, buffer, hashes, starts):
+        self.library_path = library_path
+        self.manifest = manifest
+        self.buffer = buffer
+        self.hashes = hashes
+        self.starts = starts
+
+    @classmethod
+    def load(cls, library_path=retrieval_index.MASTER_FILE):
+        """Everything is memory-mapped, so worker processes share the same pages."""
+        quote_dir = quote_dir_for(library_path)
+        manifest = retrieval_index._read_manifest(quote_dir)
+        with open(os.path.join(quote_dir, BUFFER_FILE), "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(f.name) else b""
+        hashes = np.load(os.path.join(quote_dir, HASHES_FILE), mmap_mode='r')
+        starts = np.load(os.path.join(quote_dir, STARTS_FILE), mmap_mode='r')
+        return cls(library_path, manifest, buffer, hashes, starts)
+
+    def _may_contain(self, words):
+        """False means 'certainly not in the library'. Only interior words are whole words in the source."""
+        interior = words[1:-1]
+        if len(interior) < NGRAM:
+            return True
+        needles = _ngram_hashes(interior)
+        positions = np.searchsorted(self.hashes, needles)
+        positions[positions == len(self.hashes)] = 0
+        return bool(len(self.hashes)) and bool(np.all(self.hashes[positions] == needles))
+
+    def locate(self, quote):
+        """Row id of the first library row containing the quote (after normalization), or None."""
+        norm_quote = normalize(quote)
+        if not norm_quote or not self._may_contain(norm_quote.split()):
+            return None
+        position = self.buffer.find(norm_quote.encode("utf-8"))
+        if position < 0:
+            return None
+        return int(np.searchsorted(self.starts, position, side="right") - 1)
+
+    def contains(self, quote):
+        return self.locate(quote) is not None
+
+
+_LOADED = {}
+
+
+def get_quote_index(library_path=retrieval_index.MASTER_FILE):
+    """Loads the quote index, rebuilding it whenever the library content hash moves."""
+    current_hash = retrieval_index.get_index(library_path).manifest["library_hash"]
+    index = _LOADED.get(library_path)
+    if index is not None and index.manifest["library_hash"] == current_hash:
+        return index
+
+    index = None
+    if os.path.exists(os.path.join(quote_dir_for(library_path), retrieval_index.MANIFEST_FILE)):
+        try:
+            index = QuoteIndex.load(library_path)
+            if index.manifest["library_hash"] != current_hash:
+                index = None
+        except Exception as e:
+            print(f"⚠️ Could not load quote index ({e}). Rebuilding...")
+            index = None
+
+    if index is None:
+        index = build_quote_index(library_path)
+    _LOADED[library_path] = index
+    return index
+
+
+# --- 4. Report Helper ---
+def extract_quotes(report_text, min_words=5):
+    """Double-quoted phrases long enough to count as evidence."""
+    return [q.strip() for q in QUOTED.findall(report_text) if len(q.strip().split()) >= min_words]
+
+
+def verify_quotes(report_text, min_words=5, index=None, library_path=retrieval_index.MASTER_FILE):
+    """Returns (verified quotes, hallucinated quotes) for every quoted phrase of `min_words`+ words."""
+    index = index or get_quote_index(library_path)
+    verified, hallucinated = [], []
+    for quote in extract_quotes(report_text, min_words):
+        (verified if index.contains(quote) else hallucinated).append(quote)
+    return verified, hallucinated
+
+
+if __name__ == "__main__":
+    build_quote_index()
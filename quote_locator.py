@@ -0,0 +1,292 @@
+import os
+import re
+import time
+import hashlib
+import functools
+import numpy as np
+
+import retrieval_index
+
+# --- 1. Configuration ---
+# Fuzzy quote location in two steps:
+#   1. Shortlist: the library is cut into overlapping word windows, each with a MinHash
+#      signature over word bigrams. LSH banding finds windows sharing enough bigrams with the
+#      quote without comparing against every row.
+#   2. Align: the quote is aligned word by word (edit distance, free start/end in the text)
+#      against a band of text around each candidate window, giving the best span and a score.
+WINDOW_WORDS = 48
+WINDOW_STRIDE = 24
+SHINGLE = 2
+NUM_PERM = 64
+BANDS = 16                      # 16 bands x 4 rows: windows with Jaccard ~0.5+ collide reliably
+ROWS_PER_BAND = NUM_PERM // BANDS
+MIN_CANDIDATES = 4              # topped up from the full signature comparison if LSH finds fewer
+MAX_CANDIDATES = 12
+
+# Below PARAPHRASE_THRESHOLD a quote has no grounded source span at all
+PARAPHRASE_THRESHOLD = 0.6
+
+MERSENNE_PRIME = (1 << 31) - 1
+WORD = re.compile(r'\w+')
+
+_rng = np.random.RandomState(1)
+PERM_A = _rng.randint(1, MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+PERM_B = _rng.randint(0, MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+BAND_MULTIPLIERS = _rng.randint(1, 1 << 62, size=ROWS_PER_BAND, dtype=np.int64).astype(np.uint64)
+
+
+def locator_dir_for(library_path):
+    return os.path.join(retrieval_index.index_dir_for(library_path), "fuzzy")
+
+
+def tokenize(text):
+    """Lower-cased words with their character spans in the original text."""
+    matches = list(WORD.finditer(str(text)))
+    return [m.group(0).lower() for m in matches], [(m.start(), m.end()) for m in matches]
+
+
+# --- 2. MinHash / LSH ---
+def _shingle_hashes(words):
+    shingles = [" ".join(words[i:i + SHINGLE]) for i in range(max(1, len(words) - SHINGLE + 1))]
+    return np.array([
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") & MERSENNE_PRIME
+        for s in shingles
+    ], dtype=np.uint64)
+
+
+def minhash(words):
+    hashes = _shingle_hashes(words)
+    if not len(hashes):
+        return np.full(NUM_PERM, MERSENNE_PRIME, dtype=np.uint32)
+    permuted = (np.outer(hashes, PERM_A) + PERM_B) % MERSENNE_PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signatures):
+    """(n, NUM_PERM) signatures -> (n, BANDS) bucket keys; uint64 arithmetic wraps, which is fine for hashing."""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS_PER_BAND).astype(np.uint64)
+    return (bands * BAND_MULTIPLIERS).sum(axis=2)
+
+
+# --- 3. Alignment ---
+def align(quote_words, text_words):
+    """
+    Semi-global word alignment: the whole quote against the best-matching stretch of text.
+    Returns (edit distance, start word, end word) of that stretch. Each DP row is vectorized;
+    insertions (running minimum along the text) use the T[k] + (j - k) accumulate trick.
+    """
+    n = len(text_words)
+    text = np.array(text_words, dtype=object)
+    positions = np.arange(n + 1)
+    dist = np.zeros(n + 1)              # free start anywhere in the text
+    start = positions.copy()
+
+    for word in quote_words:
+        mismatch = np.concatenate([[1.0], (text != word).astype(float)])
+        diag = np.concatenate([[np.inf], dist[:-1]]) + mismatch
+        diag[0] = np.inf
+        up = dist + 1                   # quote word missing from the text
+        take_diag = diag < up
+        best = np.where(take_diag, diag, up)
+        best_start = np.where(take_diag, np.concatenate([[0], start[:-1]]), start)
+
+        # Extra text words inside the span: dist[j] = min_k (best[k] + j - k)
+        shifted = best - positions
+        running = np.minimum.accumulate(shifted)
+        source = np.maximum.accumulate(np.where(shifted <= running, positions, 0))
+        dist = running + positions
+        start = best_start[source]
+
+    end = int(np.argmin(dist))
+    return float(dist[end]), int(start[end]), end
+
+
+# --- 4. Build ---
+def _windows(contents, first_row=0):
+    """(windows [(row, start word, end word)], MinHash signatures) for library rows first_row, first_row+1, ..."""
+    windows, signatures = [], []
+    for row, content in enumerate(contents, first_row):
+        words, _ = tokenize(content)
+        for w_start in range(0, max(1, len(words) - WINDOW_WORDS + WINDOW_STRIDE), WINDOW_STRIDE):
+            w_end = min(len(words), w_start + WINDOW_WORDS)
+            if w_end - w_start < SHINGLE:
+                continue
+            windows.append((row, w_start, w_end))
+            signatures.append(minhash(words[w_start:w_end]))
+    return np.array(windows, dtype=np.int64).reshape(-1, 3), np.array(signatures, dtype=np.uint32).reshape(-1, NUM_PERM)
+
+
+def _band_index(signatures):
+    # Per band: keys sorted, plus the window order, so a bucket lookup is a binary search
+    keys = band_keys(signatures)
+    order = np.argsort(keys, axis=0, kind='stable')
+    return np.take_along_axis(keys, order, axis=0), order
+
+
+def build_locator(library_path=retrieval_index.MASTER_FILE):
+    started = time.time()
+    df = retrieval_index.get_index(library_path).frame()
+    locator_dir = locator_dir_for(library_path)
+    os.makedirs(locator_dir, exist_ok=True)
+
+    windows, signatures = _windows(df['content'].fillna("").astype(str))
+    sorted_keys, order = _band_index(signatures)
+
+    # Swapped in, never rewritten in place: loaded locators keep memory-mapping the old files
+    for name, array in (("windows", windows), ("signatures", signatures), ("band_keys", sorted_keys), ("band_order", order)):
+        retrieval_index._save_array(os.path.join(locator_dir, f"{name}.npy"), array)
+    retrieval_index._write_manifest(locator_dir, {
+        "library_path": library_path,
+        "library_hash": retrieval_index.library_hash(library_path),
+        "n_rows": len(df),
+        "n_windows": len(windows),
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+
+    print(f"🧭 Quote locator built: {len(windows)} windows in {time.time() - started:.2f}s.")
+    return QuoteLocator.load(library_path)
+
+
+def append_windows(library_path, new_df, first_row, previous_hash, new_hash):
+    """
+    Signs only the windows of rows just appended to the library (the MinHash is the expensive
+    part) and re-sorts the band keys. Returns False, leaving a full rebuild to the next load,
+    when the locator didn't match the library before the append.
+    """
+    locator_dir = locator_dir_for(library_path)
+    manifest = retrieval_index._read_manifest(locator_dir)
+    if manifest.get("library_hash") != previous_hash or manifest.get("n_rows") != first_row:
+        return False
+
+    new_windows, new_signatures = _windows(new_df['content'].fillna("").astype(str), first_row)
+    windows = np.concatenate([np.load(os.path.join(locator_dir, "windows.npy")), new_windows])
+    signatures = np.concatenate([np.load(os.path.join(locator_dir, "signatures.npy")), new_signatures])
+    sorted_keys, order = _band_index(signatures)
+    for name, array in (("windows", windows), ("signatures", signatures), ("band_keys", sorted_keys), ("band_order", order)):
+        retrieval_index._save_array(os.path.join(locator_dir, f"{name}.npy"), array)
+    manifest.update(library_hash=new_hash, n_rows=first_row + len(new_df), n_windows=len(windows))
+    retrieval_index._write_manifest(locator_dir, manifest)
+    return True
+
+
+# --- 5. The Locator ---
+class QuoteLocator:
+    def __init__(self, library_path, manifest, windows, signatures, sorted_keys, order):
+        self.library_path = library_path
+        self.manifest = manifest
+        self.windows = windows
+        self.signatures = signatures
+        self.sorted_keys = sorted_keys
+        self.order = order
+        self._row_tokens = functools.lru_cache(maxsize=256)(self._tokenize_row)
+
+    @classmethod
+    def load(cls, library_path=retrieval_index.MASTER_FILE):
+        locator_dir = locator_dir_for(library_path)
+        manifest = retrieval_index._read_manifest(locator_dir)
+        arrays = [np.load(os.path.join(locator_dir, f"{name}.npy"), mmap_mode='r')
+                  for name in ("windows", "signatures", "band_keys", "band_order")]
+        return cls(library_path, manifest, *arrays)
+
+    def _tokenize_row(self, row):
+        content = retrieval_index.get_index(self.library_path).frame()['content'].iloc[row]
+        content = content if isinstance(content, str) else ""
+        words, spans = tokenize(content)
+        return content, words, spans
+
+    def candidates(self, quote_words):
+        """Window ids sharing an LSH bucket with the quote, topped up by signature similarity."""
+        if not len(self.windows):
+            return []
+        signature = minhash(quote_words)
+        keys = band_keys(signature[None, :])[0]
+        hits = set()
+        for band in range(BANDS):
+            column = self.sorted_keys[:, band]
+            lo, hi = np.searchsorted(column, keys[band], "left"), np.searchsorted(column, keys[band], "right")
+            hits.update(int(w) for w in self.order[lo:hi, band])
+
+        similarity = (self.signatures == signature).mean(axis=1)
+        ranked = sorted(hits, key=lambda w: -similarity[w])[:MAX_CANDIDATES]
+        if len(ranked) < MIN_CANDIDATES:
+            for w in np.argsort(-similarity, kind='stable')[:MIN_CANDIDATES]:
+                if int(w) not in ranked:
+                    ranked.append(int(w))
+        return ranked
+
+    def locate(self, quote, top_k=3):
+        """
+        Best-matching source spans for a quote, best first:
+        [{"row", "start", "end" (character offsets in the row's content), "similarity", "text"}].
+        """
+        quote_words, _ = tokenize(quote)
+        if not quote_words:
+            return []
+
+        results = {}
+        for w in self.candidates(quote_words):
+            row, w_start, w_end = (int(v) for v in self.windows[w])
+            content, words, spans = self._row_tokens(row)
+            # Band of text around the window, wide enough for the quote to align anywhere in it
+            lo = max(0, w_start - len(quote_words))
+            hi = min(len(words), w_end + len(quote_words))
+            distance, s, e = align(quote_words, words[lo:hi])
+            if e <= s:
+                continue
+            similarity = max(0.0, 1.0 - distance / len(quote_words))
+            start, end = spans[lo + s][0], spans[lo + e - 1][1]
+            key = (row, start, end)
+            if key not in results or results[key]["similarity"] < similarity:
+                results[key] = {"row": row, "start": start, "end": end,
+                                "similarity": round(similarity, 4), "text": content[start:end]}
+
+        return sorted(results.values(), key=lambda r: -r["similarity"])[:top_k]
+
+    def best_match(self, quote):
+        matches = self.locate(quote, top_k=1)
+        return matches[0] if matches else None
+
+
+_LOADED = {}
+
+
+def get_locator(library_path=retrieval_index.MASTER_FILE):
+    """Loads the locator, rebuilding it whenever the library content hash moves."""
+    current_hash = retrieval_index.get_index(library_path).manifest["library_hash"]
+    locator = _LOADED.get(library_path)
+    if locator is not None and locator.manifest["library_hash"] == current_hash:
+        return locator
+
+    locator = None
+    if os.path.exists(os.path.join(locator_dir_for(library_path), retrieval_index.MANIFEST_FILE)):
+        try:
+            locator = QuoteLocator.load(library_path)
+            if locator.manifest["library_hash"] != current_hash:
+                locator = None
+        except Exception as e:
+            print(f"⚠️ Could not load quote locator ({e}). Rebuilding...")
+            locator = None
+
+    if locator is None:
+        locator = build_locator(library_path)
+    _LOADED[library_path] = locator
+    return locator
+
+
+def classify_quote(quote, quote_idx=None, locator=None, library_path=retrieval_index.MASTER_FILE):
+    """
+    'verified' (verbatim in the library), 'paraphrase' (a close source span exists) or
+    'hallucination' (nothing close). Returns (verdict, best match or None).
+    """
+    import quote_index
+    quote_idx = quote_idx or quote_index.get_quote_index(library_path)
+    if quote_idx.contains(quote):
+        return "verified", None
+    match = (locator or get_locator(library_path)).best_match(quote)
+    if match and match["similarity"] >= PARAPHRASE_THRESHOLD:
+        return "paraphrase", match
+    return "hallucination", match
+
+
+if __name__ == "__main__":
+    build_locator()
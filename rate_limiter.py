@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import sqlite3
+
+import context_packer
+
+# --- 1. Configuration ---
+# (requests per minute, tokens per minute) per provider/model, from the free-tier quota pages.
+# Tokens count prompt + completion, as the providers do.
+RATE_LIMITS = {
+    ("groq", "llama-3.3-70b-versatile"): (30, 12000),
+    ("groq", "llama-3.1-8b-instant"): (30, 6000),
+    ("gemini", "models/gemini-2.5-flash"): (10, 250000),
+    ("gemini", "gemini-1.5-pro"): (2, 32000),
+}
+PROVIDER_DEFAULT_LIMITS = {
+    "groq": (30, 6000),
+    "gemini": (10, 250000),
+}
+DEFAULT_LIMITS = (10, 10000)
+
+# Completion tokens are unknown until the response arrives, so this much is reserved up front
+# and settled against the real usage afterwards.
+COMPLETION_TOKEN_RESERVE = 1024
+
+# One SQLite file shared by every process on the machine (Streamlit, evaluator, batch scripts).
+LIMITER_DB = os.environ.get("LLM_LIMITER_DB", "llm_rate_limits.sqlite")
+
+
+def limits_for(provider, model):
+    return RATE_LIMITS.get((provider, model), PROVIDER_DEFAULT_LIMITS.get(provider, DEFAULT_LIMITS))
+
+
+def estimate_request_tokens(prompt):
+    return context_packer.estimate_tokens(prompt) + COMPLETION_TOKEN_RESERVE
+
+
+def is_rate_limit_error(error):
+    return "429" in str(error) or "RESOURCE_EXHAUSTED" in str(error) or "rate limit" in str(error).lower()
+
+
+# --- 2. The Shared Buckets ---
+def _connect():
+    conn = sqlite3.connect(LIMITER_DB, timeout=30, isolation_level=None)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS buckets (
+            key TEXT PRIMARY KEY,
+            requests REAL NOT NULL,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def _update_bucket(provider, model, apply):
+    """
+    Refills the bucket for the elapsed time, then lets `apply(requests, tokens, rpm, tpm)` return the
+    new levels plus a result. BEGIN IMMEDIATE holds SQLite's write lock, so concurrent processes
+    read-modify-write the bucket one at a time.
+    """
+    rpm, tpm = limits_for(provider, model)
+    key = f"{provider}:{model}"
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        row = conn.execute("SELECT requests, tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            requests, tokens = float(rpm), float(tpm)
+        else:
+            elapsed = max(0.0, now - row[2])
+            requests = min(rpm, row[0] + elapsed * rpm / 60.0)
+            tokens = min(tpm, row[1] + elapsed * tpm / 60.0)
+
+        requests, tokens, result = apply(requests, tokens, rpm, tpm)
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (key, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+            (key, requests, tokens, now)
+        )
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def try_acquire(provider, model, tokens):
+    """Takes one request + `tokens` if both are available. Returns 0, or the seconds to wait before retrying."""
+    def apply(requests, available, rpm, tpm):
+        needed = min(tokens, tpm)  # a prompt bigger than the whole minute can still go once the bucket is full
+        if requests >= 1 and available >= needed:
+            return requests - 1, available - needed, 0.0
+        wait = max((1 - requests) * 60.0 / rpm, (needed - available) * 60.0 / tpm)
+        return requests, available, max(wait, 0.05)
+
+    return _update_bucket(provider, model, apply)
+
+
+def acquire(provider, model, tokens):
+    while True:
+        wait = try_acquire(provider, model, tokens)
+        if not wait:
+            return
+        time.sleep(wait)
+
+
+async def acquire_async(provider, model, tokens):
+    while True:
+        wait = await asyncio.to_thread(try_acquire, provider, model, tokens)
+        if not wait:
+            return
+        await asyncio.sleep(wait)
+
+
+def settle(provider, model, reserved, used):
+    """Gives back (or charges) the difference between the reserved and the reported token usage."""
+    def apply(requests, tokens, rpm, tpm):
+        return requests, min(tpm, tokens + reserved - used), None
+
+    _update_bucket(provider, model, apply)
+
+
+def penalize(provider, model, seconds=None):
+    """
+    A 429 means the provider's view of the quota is stricter than ours: empty the bucket so
+    every process backs off together instead of each one retrying into the wall.
+    """
+    def apply(requests, tokens, rpm, tpm):
+        backoff = seconds if seconds is not None else 60.0 / rpm
+        return min(requests, 0.0) - backoff * rpm / 60.0, min(tokens, 0.0), None
+
+    _update_bucket(provider, model, apply)
@@ -0,0 +1,126 @@
+import os
+import re
+import sys
+import json
+import random
+import asyncio
+import hashlib
+from datetime import datetime
+
+# --- 1. Configuration ---
+# A fixed set of poisoned protocols, generated once, so regression runs audit the same inputs
+# every time instead of paying for (and varying with) a fresh temperature-0.8 generation.
+#   python redteam_corpus.py --per-flaw 5 [--flaws-file flaws.txt]   -> generate what is missing
+# Entries are keyed "<flaw-slug>-<variant>", so a re-run only fills gaps and raising --per-flaw
+# only adds the new variants.
+CORPUS_FILE = os.environ.get("REDTEAM_CORPUS", "redteam_corpus.jsonl")
+DEFAULT_FLAW_TYPES = ["Multiplicity Alpha Inflation", "Legacy LOCF Bias"]
+DEFAULT_PER_FLAW = 5
+SAMPLE_SEED = 0
+
+
+def slug(flaw_type):
+    return re.sub(r"[^a-z0-9]+", "-", flaw_type.lower()).strip("-")
+
+
+def protocol_id(flaw_type, variant):
+    return f"{slug(flaw_type)}-{variant:03d}"
+
+
+def variant_seed(flaw_type, variant):
+    """Stable per-entry generation seed (fits the 31-bit range providers accept)."""
+    digest = hashlib.sha256(f"{flaw_type}\x00{variant}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "little") & 0x7FFFFFFF
+
+
+# --- 2. Reading ---
+def load_corpus(path=CORPUS_FILE):
+    """{protocol_id: entry}. A torn last line from an interrupted build is ignored."""
+    corpus = {}
+    if not os.path.exists(path):
+        return corpus
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("text"):
+                corpus[entry["protocol_id"]] = entry
+    return corpus
+
+
+def sample_protocols(flaw_type, n=1, seed=SAMPLE_SEED, corpus=None, path=CORPUS_FILE):
+    """
+    `n` corpus entries for a flaw type. The same seed and corpus always give the same entries,
+    whatever order the corpus was written in.
+    """
+    corpus = corpus if corpus is not None else load_corpus(path)
+    entries = sorted((e for e in corpus.values() if e["flaw_type"] == flaw_type), key=lambda e: e["protocol_id"])
+    if len(entries) <= n:
+        return entries
+    return random.Random(f"{seed}:{flaw_type}").sample(entries, n)
+
+
+# --- 3. Building ---
+async def _generate(red_team, flaw_type, variant):
+    seed = variant_seed(flaw_type, variant)
+    text = await red_team.agenerate_poison_pill_protocol(flaw_type, seed=seed)
+    prompt = red_team._poison_pill_prompt(flaw_type)
+    return {
+        "protocol_id": protocol_id(flaw_type, variant),
+        "flaw_type": flaw_type,
+        "variant": variant,
+        "seed": seed,
+        "model": red_team.model,
+        "temperature": 0.8,
+        "prompt_sha1": hashlib.sha1(prompt.encode("utf-8")).hexdigest(),
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "text": text,
+    }
+
+
+async def abuild_corpus(flaw_types=DEFAULT_FLAW_TYPES, per_flaw=DEFAULT_PER_FLAW, path=CORPUS_FILE, red_team=None):
+    """
+    Generates every missing (flaw type, variant) at once; the LLM client's semaphore and the shared
+    rate limiter pace the calls. Each entry is appended as soon as it arrives.
+    """
+    if red_team is None:
+        from adversarial_generator import RedTeamAgent
+        red_team = RedTeamAgent()
+
+    existing = load_corpus(path)
+    missing = [(flaw, v) for flaw in flaw_types for v in range(per_flaw) if protocol_id(flaw, v) not in existing]
+    print(f"🧫 Red-team corpus: {len(existing)} entries on disk, generating {len(missing)} more...")
+
+    generated, failed = 0, 0
+    with open(path, "a", encoding="utf-8") as out:
+        for next_done in asyncio.as_completed([_generate(red_team, flaw, v) for flaw, v in missing]):
+            try:
+                entry = await next_done
+            except Exception as e:
+                failed += 1
+                print(f"⚠️ Generation failed: {e}")
+                continue
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            out.flush()
+            generated += 1
+            print(f"   + {entry['protocol_id']} ({len(entry['text'])} chars)")
+
+    print(f"✅ Red-team corpus: {generated} generated, {failed} failed -> {path}")
+    return load_corpus(path)
+
+
+def build_corpus(flaw_types=DEFAULT_FLAW_TYPES, per_flaw=DEFAULT_PER_FLAW, path=CORPUS_FILE, red_team=None):
+    import llm_clients
+    return llm_clients.run_sync(abuild_corpus(flaw_types, per_flaw, path, red_team))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    flaw_types = DEFAULT_FLAW_TYPES
+    if "--flaws-file" in args:
+        with open(args[args.index("--flaws-file") + 1], encoding="utf-8") as f:
+            flaw_types = [line.strip() for line in f if line.strip()]
+    per_flaw = int(args[args.index("--per-flaw") + 1]) if "--per-flaw" in args else DEFAULT_PER_FLAW
+    build_corpus(flaw_types, per_flaw)
@@ -0,0 +1,118 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+
+# --- 1. Configuration ---
+# Identical (model, prompt, temperature) requests are answered from disk. Set LLM_CACHE=0 to
+# switch the cache off for a whole run, LLM_CACHE_TTL to expire entries after N seconds.
+CACHE_DB = os.environ.get("LLM_CACHE_DB", "llm_response_cache.sqlite")
+CACHE_ENABLED = os.environ.get("LLM_CACHE", "1") != "0"
+TTL_SECONDS = float(os.environ["LLM_CACHE_TTL"]) if os.environ.get("LLM_CACHE_TTL") else None
+MAX_CACHE_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+
+# Eviction frees a little more than needed so every put near the limit doesn't trigger another one
+EVICT_TO_RATIO = 0.9
+
+
+def cache_key(provider, model, prompt, temperature=None, json_output=False, seed=None):
+    # The seed only joins the key when set, so existing entries keep their keys
+    parts = [provider, model, temperature, bool(json_output), prompt] + ([seed] if seed is not None else [])
+    payload = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _connect():
+    conn = sqlite3.connect(CACHE_DB, timeout=30, isolation_level=None)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+    return conn
+
+
+# --- 2. Lookups ---
+def get(key, ttl=TTL_SECONDS):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if ttl is not None and now - row[1] > ttl:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return row[0]
+    finally:
+        conn.close()
+
+
+def put(key, response, max_bytes=MAX_CACHE_BYTES):
+    if response is None:
+        return
+    now = time.time()
+    size = len(response.encode("utf-8"))
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, response, size, now, now)
+        )
+        _evict(conn, max_bytes)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _evict(conn, max_bytes):
+    """Least-recently-used entries go first once the cache outgrows `max_bytes`."""
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= max_bytes:
+        return
+    to_free = total - int(max_bytes * EVICT_TO_RATIO)
+    victims = []
+    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+        if to_free <= 0:
+            break
+        victims.append((key,))
+        to_free -= size
+    conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+    print(f"🧹 LLM cache: evicted {len(victims)} least-recently-used responses.")
+
+
+def clear():
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM responses")
+    finally:
+        conn.close()
+
+
+def stats():
+    conn = _connect()
+    try:
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": count, "bytes": total}
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import sys
+    if "--clear" in sys.argv:
+        clear()
+        print("🗑️ LLM response cache cleared.")
+    print(stats())
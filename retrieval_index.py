@@ -0,0 +1,441 @@
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# --- 1. Configuration ---
+MASTER_FILE = "master_regulatory_library.csv"
+MANIFEST_FILE = "manifest.json"
+VECTORIZER_FILE = "vectorizer.pkl"
+
+# LSM-style compaction: daily ingestion adds small delta segments on top of the base segment.
+# Once there are more than MAX_SEGMENTS, the deltas are merged in the background; when the
+# merged deltas grow past FULL_MERGE_RATIO of the base, everything is compacted into one segment.
+# Deltas reuse the base segment's vocabulary and IDF, so scores from every segment are comparable;
+# terms the base has never seen only become searchable at the next full merge.
+MAX_SEGMENTS = 4
+FULL_MERGE_RATIO = 0.25
+
+# Loaded indexes, keyed by library path, so every agent in the process shares one copy
+_LOADED = {}
+
+# Serialises CSV appends, manifest rewrites and merges within this process
+_WRITE_LOCK = threading.RLock()
+_MERGE_THREADS = {}
+
+
+def index_dir_for(library_path):
+    """master_regulatory_library.csv -> master_regulatory_library.index/"""
+    return f"{os.path.splitext(library_path)[0]}.index"
+
+
+def library_hash(library_path):
+    """SHA-256 of the raw CSV bytes. Any edit to the library changes it."""
+    h = hashlib.sha256()
+    with open(library_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _stat_signature(library_path):
+    st = os.stat(library_path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def load_library_frame(library_path, nrows=None, from_store=True):
+    """The library as a DataFrame: from the indexed SQLite store, or parsed straight from the CSV."""
+    if from_store and nrows is None:
+        import library_store
+        return library_store.read_library(library_path)
+    df = pd.read_csv(library_path, nrows=nrows)
+    df.columns = [c.strip() for c in df.columns]
+    return df
+
+
+def _read_manifest(index_dir):
+    with open(os.path.join(index_dir, MANIFEST_FILE), "r") as f:
+        return json.load(f)
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _write_manifest(index_dir, manifest):
+    # Written atomically and last, so readers never see a half-built index
+    tmp_path = os.path.join(index_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_FILE))
+
+
+def _save_array(path, array):
+    # Replaced, not rewritten in place: loaded indexes keep memory-mapping the old file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _write_segment(index_dir, seq, texts, first_row, vectorizer=None, **vectorizer_options):
+    """
+    Writes one TF-IDF segment over `texts` (library rows first_row .. first_row+len-1). With a
+    `vectorizer` (the base segment's), the texts are only transformed, so the segment's cosines
+    are comparable with the base; otherwise a new vocabulary and IDF are fitted.
+    """
+    name = f"seg_{seq:06d}"
+    seg_dir = os.path.join(index_dir, name)
+    os.makedirs(seg_dir, exist_ok=True)
+
+    if vectorizer is not None:
+        matrix = vectorizer.transform(texts).tocsr()
+    else:
+        vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32, **vectorizer_options)
+        try:
+            matrix = vectorizer.fit_transform(texts).tocsr()
+        except ValueError:
+            # Only stop words / empty content: keep the rows addressable but unsearchable
+            vectorizer = None
+            matrix = sparse.csr_matrix((len(texts), 0), dtype=np.float32)
+
+    np.save(os.path.join(seg_dir, "data.npy"), matrix.data)
+    np.save(os.path.join(seg_dir, "indices.npy"), matrix.indices)
+    np.save(os.path.join(seg_dir, "indptr.npy"), matrix.indptr)
+    with open(os.path.join(seg_dir, VECTORIZER_FILE), "wb") as f:
+        pickle.dump(vectorizer, f)
+
+    return {"name": name, "first_row": first_row, "n_docs": matrix.shape[0], "n_terms": matrix.shape[1]}
+
+
+# --- 2. Build (runs once, at hydration time) ---
+def build_index(library_path=MASTER_FILE, index_dir=None):
+    """Fits the TF-IDF vocabulary and document matrix over the whole library as a single base segment."""
+    index_dir = index_dir or index_dir_for(library_path)
+    started = time.time()
+
+    with _WRITE_LOCK:
+        df = load_library_frame(library_path)
+        texts = df['content'].fillna("").astype(str).tolist()
+
+        old_segments = []
+        if os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+            old_manifest = _read_manifest(index_dir)
+            old_segments = old_manifest.get("segments", [])
+            next_seq = old_manifest.get("next_segment", 1)
+        else:
+            next_seq = 1
+
+        os.makedirs(index_dir, exist_ok=True)
+        segment = _write_segment(index_dir, next_seq, texts, first_row=0)
+        manifest = {
+            "library_path": library_path,
+            "library_hash": library_hash(library_path),
+            "n_docs": len(texts),
+            "segments": [segment],
+            "next_segment": next_seq + 1,
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        _write_manifest(index_dir, manifest)
+        for old in old_segments:
+            shutil.rmtree(os.path.join(index_dir, old["name"]), ignore_errors=True)
+
+    print(f"🗂️ Retrieval index built: {len(texts)} docs x {segment['n_terms']} terms in {time.time() - started:.2f}s -> {index_dir}")
+    index = RetrievalIndex.load(index_dir, library_path)
+    _LOADED[library_path] = index
+    return index
+
+
+# --- 3. The Index (memory-mapped at agent startup) ---
+class Segment:
+    def __init__(self, meta, vectorizer, matrix):
+        self.meta = meta
+        self.first_row = meta["first_row"]
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+
+    @classmethod
+    def load(cls, index_dir, meta):
+        seg_dir = os.path.join(index_dir, meta["name"])
+        with open(os.path.join(seg_dir, VECTORIZER_FILE), "rb") as f:
+            vectorizer = pickle.load(f)
+
+        # mmap_mode='r' keeps the document matrix on disk and lets the OS page it in
+        data = np.load(os.path.join(seg_dir, "data.npy"), mmap_mode='r')
+        indices = np.load(os.path.join(seg_dir, "indices.npy"), mmap_mode='r')
+        indptr = np.load(os.path.join(seg_dir, "indptr.npy"), mmap_mode='r')
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(meta["n_docs"], meta["n_terms"]))
+        return cls(meta, vectorizer, matrix)
+
+    def scores(self, query):
+        if self.vectorizer is None:
+            return np.zeros(self.meta["n_docs"], dtype=np.float32)
+        query_vec = self.vectorizer.transform([query])
+        # Rows of the matrix are L2-normalised, so the dot product is the cosine similarity
+        return (self.matrix @ query_vec.T).toarray().ravel()
+
+
+class RetrievalIndex:
+    def __init__(self, index_dir, library_path, manifest, segments):
+        self.index_dir = index_dir
+        self.library_path = library_path
+        self.manifest = manifest
+        self.segments = segments
+        self.n_docs = manifest["n_docs"]
+        self._signature = _stat_signature(library_path)
+        self._frame = None
+
+    @classmethod
+    def load(cls, index_dir, library_path=MASTER_FILE):
+        manifest = _read_manifest(index_dir)
+        if "segments" not in manifest:
+            raise ValueError("index predates segmented layout")
+        segments = [Segment.load(index_dir, meta) for meta in manifest["segments"]]
+        return cls(index_dir, library_path, manifest, segments)
+
+    def is_fresh(self):
+        """True while the library CSV still has the content hash the index was built from."""
+        signature = _stat_signature(self.library_path)
+        if signature == self._signature:
+            return True
+        if library_hash(self.library_path) != self.manifest['library_hash']:
+            return False
+        # Touched but not changed (e.g. re-saved with identical content)
+        self._signature = signature
+        return True
+
+    def frame(self):
+        """The library as a DataFrame, parsed once per index build instead of once per request."""
+        if self._frame is None:
+            self._frame = load_library_frame(self.library_path)
+        return self._frame
+
+    def search(self, query, top_k=3, rows=None):
+        """Returns [(row_position, cosine_score), ...] best first. Only the query is transformed."""
+        # Every segment shares the base vocabulary/IDF, so the cosines can be merged by score
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for segment in self.segments:
+            seg_scores = segment.scores(query)
+            scores[segment.first_row:segment.first_row + len(seg_scores)] = seg_scores
+
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            scores = scores[rows]
+        else:
+            rows = np.arange(len(scores))
+
+        top_k = min(top_k, len(rows))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+
+# --- 4. Access Point ---
+def get_index(library_path=MASTER_FILE):
+    """Returns the prebuilt index for a library, rebuilding it automatically if the CSV changed."""
+    index = _LOADED.get(library_path)
+    if index is not None and index.is_fresh():
+        return index
+
+    index_dir = index_dir_for(library_path)
+    index = None
+    if os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+        try:
+            index = RetrievalIndex.load(index_dir, library_path)
+            if not index.is_fresh():
+                print(f"♻️ {library_path} changed since the last build. Rebuilding retrieval index...")
+                index = None
+        except Exception as e:
+            print(f"⚠️ Could not load retrieval index ({e}). Rebuilding...")
+            index = None
+
+    if index is None:
+        index = build_index(library_path, index_dir)
+
+    _LOADED[library_path] = index
+    return index
+
+
+# --- 5. Append-Only Ingestion (delta segments) ---
+def append_documents(records, library_path=MASTER_FILE):
+    """
+    Appends new letters to the library CSV and indexes only them, as a delta segment.
+    Records already in the library (same 'content') are skipped. Returns the number added.
+    """
+    with _WRITE_LOCK:
+        if not os.path.exists(library_path):
+            new_df = pd.DataFrame(records).drop_duplicates(subset=['content'])
+            new_df.to_csv(library_path, index=False)
+            build_index(library_path)
+            return len(new_df)
+
+        # Make sure the index matches the CSV *before* the append, so the delta lines up
+        index = get_index(library_path)
+        existing = index.frame()
+
+        new_df = pd.DataFrame(records).reindex(columns=existing.columns)
+        new_df = new_df.drop_duplicates(subset=['content'])
+        new_df = new_df[~new_df['content'].isin(set(existing['content'].dropna()))]
+        if new_df.empty:
+            print("📭 No new letters to index.")
+            return 0
+
+        needs_newline = not _ends_with_newline(library_path)
+        with open(library_path, "a", newline="", encoding="utf-8") as f:
+            if needs_newline:
+                f.write("\n")
+            new_df.to_csv(f, header=False, index=False)
+
+        # Read from disk: a background merge may have reserved a segment number meanwhile
+        manifest = _read_manifest(index.index_dir)
+        previous_hash = manifest["library_hash"]
+        texts = new_df['content'].fillna("").astype(str).tolist()
+        segment = _write_segment(index.index_dir, manifest["next_segment"], texts, first_row=manifest["n_docs"],
+                                 vectorizer=_base_vectorizer(index.index_dir, manifest))
+        manifest["segments"] = manifest["segments"] + [segment]
+        manifest["next_segment"] += 1
+        manifest["n_docs"] += len(texts)
+        manifest["library_hash"] = library_hash(library_path)
+        _write_manifest(index.index_dir, manifest)
+
+        _LOADED[library_path] = RetrievalIndex.load(index.index_dir, library_path)
+        segment_count = len(manifest["segments"])
+        _append_derived(library_path, new_df, segment["first_row"], previous_hash, manifest["library_hash"])
+
+    print(f"➕ Indexed {len(texts)} new letters as {segment['name']} ({segment_count} segments).")
+    if segment_count > MAX_SEGMENTS:
+        schedule_merge(library_path)
+    return len(texts)
+
+
+def _base_vectorizer(index_dir, manifest):
+    """The base segment's fitted vectorizer, which delta segments are transformed with."""
+    with open(os.path.join(index_dir, manifest["segments"][0]["name"], VECTORIZER_FILE), "rb") as f:
+        return pickle.load(f)
+
+
+def _append_derived(library_path, new_df, first_row, previous_hash, new_hash):
+    """
+    Extends the store and the passage / quote / locator indexes with the appended rows, so their
+    next load doesn't rebuild them from the whole library. An index that wasn't current before
+    the append (or can't take the delta) is left alone and rebuilds on its next load, as before.
+    """
+    import library_store, passage_index, quote_index, quote_locator
+    appenders = [
+        ("library store", library_store.append_documents),
+        ("passage index", passage_index.append_passages),
+        ("quote index", quote_index.append_quotes),
+        ("quote locator", quote_locator.append_windows),
+    ]
+    for name, append in appenders:
+        try:
+            if not append(library_path, new_df, first_row, previous_hash, new_hash):
+                print(f"♻️ The {name} is not current; it will be rebuilt on its next load.")
+        except Exception as e:
+            print(f"⚠️ Could not append to the {name} ({e}); it will be rebuilt on its next load.")
+
+
+def merge_segments(library_path=MASTER_FILE, full=False):
+    """Compacts delta segments (or every segment, when `full`) into one refitted segment."""
+    index_dir = index_dir_for(library_path)
+
+    # Snapshot the segments to merge and the rows they cover, under the lock
+    with _WRITE_LOCK:
+        index = get_index(library_path)
+        segments = index.manifest["segments"]
+        if len(segments) < 2:
+            return index
+        base_docs = segments[0]["n_docs"]
+        delta_docs = sum(s["n_docs"] for s in segments[1:])
+        if full or delta_docs > base_docs * FULL_MERGE_RATIO:
+            chosen = segments
+        else:
+            chosen = segments[1:]
+        if len(chosen) < 2:
+            return index
+
+        first_row = chosen[0]["first_row"]
+        end_row = chosen[-1]["first_row"] + chosen[-1]["n_docs"]
+        df = load_library_frame(library_path, nrows=end_row)
+        texts = df['content'].fillna("").astype(str).tolist()[first_row:end_row]
+
+        # Reserve the sequence number so a concurrent append doesn't reuse it
+        reserved = _read_manifest(index_dir)
+        seq = reserved["next_segment"]
+        reserved["next_segment"] = seq + 1
+        _write_manifest(index_dir, reserved)
+        # Only a full merge refits the vocabulary; merged deltas stay in the base's
+        base_vectorizer = None if first_row == 0 else _base_vectorizer(index_dir, reserved)
+
+    # The expensive refit runs outside the lock; ingestion can keep appending meanwhile
+    started = time.time()
+    merged = _write_segment(index_dir, seq, texts, first_row=first_row, vectorizer=base_vectorizer)
+
+    with _WRITE_LOCK:
+        manifest = _read_manifest(index_dir)
+        chosen_names = {s["name"] for s in chosen}
+        kept = [s for s in manifest["segments"] if s["name"] not in chosen_names]
+        stale = []
+        if first_row == 0:
+            # Deltas appended during the refit were transformed with the old base vocabulary
+            stale = [s for s in kept if s["first_row"] >= end_row]
+            kept = [s for s in kept if s["first_row"] < end_row]
+            if stale:
+                kept += _rebase_segments(library_path, index_dir, manifest, merged, stale)
+        manifest["segments"] = sorted(kept + [merged], key=lambda s: s["first_row"])
+        _write_manifest(index_dir, manifest)
+        for old in chosen + stale:
+            shutil.rmtree(os.path.join(index_dir, old["name"]), ignore_errors=True)
+        index = RetrievalIndex.load(index_dir, library_path)
+        _LOADED[library_path] = index
+
+    print(f"🧱 Merged {len(chosen)} segments ({len(texts)} docs) into {merged['name']} in {time.time() - started:.2f}s.")
+    return index
+
+
+def _rebase_segments(library_path, index_dir, manifest, base, segments):
+    """Re-transforms delta segments with a new base vocabulary, taking fresh sequence numbers from `manifest`."""
+    vectorizer = _base_vectorizer(index_dir, {"segments": [base]})
+    end_row = segments[-1]["first_row"] + segments[-1]["n_docs"]
+    contents = load_library_frame(library_path, nrows=end_row)['content'].fillna("").astype(str).tolist()
+    rebased = []
+    for old in segments:
+        texts = contents[old["first_row"]:old["first_row"] + old["n_docs"]]
+        rebased.append(_write_segment(index_dir, manifest["next_segment"], texts, old["first_row"], vectorizer=vectorizer))
+        manifest["next_segment"] += 1
+    return rebased
+
+
+def schedule_merge(library_path=MASTER_FILE):
+    """Starts a background merge unless one is already running for this library."""
+    with _WRITE_LOCK:
+        running = _MERGE_THREADS.get(library_path)
+        if running is not None and running.is_alive():
+            return running
+        # Non-daemon: a short-lived ingestion script still waits for the merge to land
+        thread = threading.Thread(target=merge_segments, args=(library_path,), name="index-merge")
+        _MERGE_THREADS[library_path] = thread
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    if "--merge" in sys.argv:
+        merge_segments(MASTER_FILE, full="--full" in sys.argv)
+    else:
+        build_index(MASTER_FILE)
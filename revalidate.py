@@ -0,0 +1,127 @@
+import os
+import re
+import sys
+import json
+import time
+import multiprocessing
+from datetime import datetime
+
+import retrieval_index
+import quote_index
+import quote_locator
+import validation_scoring
+
+# --- 1. Configuration ---
+# Re-scores every archived report (validation_scoring.REPORT_ARCHIVE) against the current library
+# and rubrics, without calling an LLM. Each run writes a new numbered results file next to the
+# live log, so earlier runs stay comparable:
+#   audit_validation_performance.v1.jsonl, .v2.jsonl, ...
+RESULTS_PREFIX = "audit_validation_performance"
+WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+CHUNKSIZE = 8
+
+# Per worker process: the indexes are memory-mapped, so every worker shares the same pages
+_QUOTES = None
+_LOCATOR = None
+
+
+def next_results_path(prefix=RESULTS_PREFIX):
+    directory = os.path.dirname(prefix) or "."
+    pattern = re.compile(re.escape(os.path.basename(prefix)) + r"\.v(\d+)\.jsonl$")
+    versions = [int(m.group(1)) for m in map(pattern.match, os.listdir(directory)) if m]
+    return f"{prefix}.v{max(versions, default=0) + 1}.jsonl"
+
+
+# --- 2. Workers ---
+def _init_worker(library_path):
+    global _QUOTES, _LOCATOR
+    _QUOTES = quote_index.get_quote_index(library_path)
+    _LOCATOR = quote_locator.get_locator(library_path)
+
+
+def _rescore(record):
+    rubric = record.get("rubric") if record.get("rubric") in validation_scoring.RUBRICS else "evaluator"
+    try:
+        verdict = validation_scoring.score_report(record["report"], rubric, _QUOTES, _LOCATOR)
+    except Exception as e:
+        verdict = {"score": None, "status": "ERROR", "failures": [f"ERROR: {e}"], "verified_quotes": 0}
+    return {
+        "report_id": record.get("report_id"),
+        "protocol": record.get("protocol"),
+        "rubric": rubric,
+        "archived_at": record.get("timestamp"),
+        "previous": record.get("result"),
+        **verdict,
+    }
+
+
+# --- 3. The Batch Run ---
+def revalidate(archive_path=validation_scoring.REPORT_ARCHIVE, library_path=retrieval_index.MASTER_FILE,
+               workers=WORKERS, results_prefix=RESULTS_PREFIX):
+    """Streams the archive through a process pool and writes a versioned results file. Returns its path."""
+    started = time.time()
+    # Build (or refresh) the indexes once here, so the workers only ever map the finished files
+    _init_worker(library_path)
+    library_hash = retrieval_index.get_index(library_path).manifest["library_hash"]
+
+    results_path = next_results_path(results_prefix)
+    run = {
+        "run_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "library_hash": library_hash,
+        "scoring_version": validation_scoring.SCORING_VERSION,
+    }
+    records = validation_scoring.iter_archive(archive_path)
+    counts = {"reports": 0, "PASS": 0, "FAIL": 0, "ERROR": 0, "changed": 0}
+
+    tmp_path = f"{results_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        if workers <= 1:
+            results = map(_rescore, records)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(library_path,))
+            results = pool.imap(_rescore, records, chunksize=CHUNKSIZE)
+        try:
+            for result in results:
+                out.write(json.dumps({**run, **result}, ensure_ascii=False) + "\n")
+                counts["reports"] += 1
+                counts[result["status"]] += 1
+                previous = result.get("previous") or {}
+                if previous.get("status") and previous["status"] != result["status"]:
+                    counts["changed"] += 1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    os.replace(tmp_path, results_path)
+
+    print(f"📊 Re-validated {counts['reports']} reports in {time.time() - started:.2f}s "
+          f"({counts['PASS']} PASS, {counts['FAIL']} FAIL, {counts['ERROR']} errors, "
+          f"{counts['changed']} changed status) -> {results_path}")
+    return results_path
+
+
+def import_reports(paths, rubric="evaluator", archive_path=validation_scoring.REPORT_ARCHIVE):
+    """Adds saved report files (e.g. latest_auditor_report.txt) to the archive, named after the file."""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            report_text = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        validation_scoring.archive_report(name, rubric, report_text, {}, path=archive_path)
+        print(f"📥 Archived {path} as '{name}' ({rubric} rubric).")
+
+
+if __name__ == "__main__":
+    # python revalidate.py                          -> re-score the whole archive
+    # python revalidate.py --workers 1              -> in-process, no pool
+    # python revalidate.py --import report.txt ...  -> add saved reports to the archive first
+    args = sys.argv[1:]
+    workers = WORKERS
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    if "--import" in args:
+        i = args.index("--import")
+        import_reports(args[i + 1:])
+    revalidate(workers=workers)
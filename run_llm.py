@@ -1,22 +1,34 @@
 import pandas as pd
 import json
-import time
 import os
+import asyncio
 import re
-import google.generativeai as genai
+import time
+import hashlib
+
+import llm_clients
+import chunker
 
 # -------------------------------
 # Configure Gemini API
 # -------------------------------
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+MODEL_ID = "gemini-1.5-pro"
+gemini = llm_clients.GeminiClient(api_key=os.environ["GEMINI_API_KEY"], model=MODEL_ID)
 
 # -------------------------------
 # Configuration
 # -------------------------------
 CSV_FILENAME = "fda_letters.csv"
 OUTPUT_ANALYSIS_FILENAME = "llm_master_analysis.json"
-CHUNK_SIZE = 4000
-RATE_LIMIT_DELAY = 1  # seconds between API calls
+# Sentence-aligned chunks sized in tokens (see chunker.py); findings are deduplicated by span
+CHUNK_TOKENS = chunker.CHUNK_TOKENS
+OVERLAP_TOKENS = chunker.OVERLAP_TOKENS
+# One JSON record per analysed chunk, appended as soon as it comes back: the checkpoint a rerun
+# resumes from. llm_master_analysis.json is exported from it at the end of every run.
+ANALYSIS_SINK = "llm_master_analysis.jsonl"
+# Concurrent LLM workers (the Gemini semaphore and rate limiter still cap the real request rate)
+WORKERS = llm_clients.concurrency_limit("gemini")
+QUEUE_SIZE = 2 * WORKERS
 
 # -------------------------------
 # Prompt Template
@@ -58,91 +70,179 @@ Generate ONLY a single JSON array of objects for all findings in the segment.
 # -------------------------------
 # Gemini API Call (updated for latest client)
 # -------------------------------
-def call_llm_api(prompt):
+async def call_llm_api_async(prompt):
+    # Pacing comes from the shared RPM/TPM limiter, not a fixed delay. Errors propagate, so a
+    # failed chunk is retried on the next run instead of being checkpointed as "no findings".
     print(f"  [API Call] Sending {len(prompt)} characters to Gemini...")
-    time.sleep(RATE_LIMIT_DELAY)
+    llm_response_text = await gemini.acomplete(prompt, temperature=0.2) or "[]"
+    # Clean up code fences
+    return re.sub(r"```json|```", "", llm_response_text, flags=re.IGNORECASE).strip()
+
+
+def call_llm_api(prompt):
+    return llm_clients.run_sync(call_llm_api_async(prompt))
 
+# -------------------------------
+# Chunk jobs
+# -------------------------------
+def chunk_key(doc_id, chunk_no, prompt):
+    """Stable id of one chunk job; the prompt hash makes edited letters count as new work."""
+    return f"{doc_id}:{chunk_no}:{hashlib.blake2b(prompt.encode('utf-8'), digest_size=8).hexdigest()}"
+
+
+def iter_chunk_jobs(df):
+    """Producer side: one job per chunk, generated lazily document by document."""
+    columns = ["doc_type", "date", "recipient", "full_text"]
+    for doc_id, (doc_type, doc_date, recipient, full_text) in enumerate(df.reindex(columns=columns).itertuples(index=False, name=None)):
+        recipient = recipient if pd.notna(recipient) else "Unknown"
+        chunks = chunker.chunk_document(str(full_text), CHUNK_TOKENS, OVERLAP_TOKENS)
+        for chunk in chunks:
+            prompt = PROMPT_TEMPLATE.format(DOC_TYPE=doc_type, DOC_DATE=doc_date, TEXT_CHUNK=chunk["text"])
+            yield {"key": chunk_key(doc_id, chunk["index"] + 1, prompt), "doc_id": doc_id, "chunk": chunk["index"] + 1,
+                   "n_chunks": len(chunks), "recipient": recipient, "span": chunk, "prompt": prompt}
+
+
+def load_checkpoint(sink_path=ANALYSIS_SINK):
+    """{chunk key: record} of the chunks already analysed successfully."""
+    done = {}
+    if not os.path.exists(sink_path):
+        return done
+    with open(sink_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line of a crashed run
+            if record.get("status") == "ok":
+                done[record["key"]] = record
+    return done
+
+
+def parse_findings(llm_response_text):
+    """The findings array, or None if the response isn't one."""
     try:
-        response = genai.generate_text(
-            model="gemini-1.5-pro",
-            prompt=prompt,
-            temperature=0.2
-        )
-        llm_response_text = response.text if hasattr(response, "text") else "[]"
-        # Clean up code fences
-        llm_response_text = re.sub(r"```json|```", "", llm_response_text, flags=re.IGNORECASE).strip()
-        return llm_response_text
-    except Exception as e:
-        print(f"  [Error] Gemini API call failed: {e}")
-        return "[]"
+        findings = json.loads(llm_response_text)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(findings, dict):
+        findings = [findings]
+    return [f for f in findings if isinstance(f, dict)] if isinstance(findings, list) else None
 
 # -------------------------------
-# Chunking function
+# Pipeline Stages
 # -------------------------------
-def chunk_text(text, chunk_size):
-    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+async def _produce(jobs, todo, n_workers):
+    for job in jobs:
+        await todo.put(job)  # blocks while the workers are QUEUE_SIZE jobs behind
+    for _ in range(n_workers):
+        await todo.put(None)
+
+
+async def _analyse(todo, done):
+    while True:
+        job = await todo.get()
+        if job is None:
+            await done.put(None)
+            return
+        record = {"key": job["key"], "doc_id": job["doc_id"], "chunk": job["chunk"], "recipient": job["recipient"],
+                  "char_start": job["span"]["start"], "char_end": job["span"]["end"]}
+        try:
+            llm_response_text = await call_llm_api_async(job["prompt"])
+        except Exception as e:
+            print(f"  [Error] Gemini API call failed for document {job['doc_id'] + 1}, chunk {job['chunk']}: {e}")
+            await done.put({**record, "status": "error", "error": str(e), "findings": []})
+            continue
+
+        findings = parse_findings(llm_response_text)
+        if findings is None:
+            print(f"  [Warning] Failed to parse JSON for document {job['doc_id'] + 1}, chunk {job['chunk']}. Preview:")
+            print(llm_response_text[:500])
+            await done.put({**record, "status": "unparsed", "raw": llm_response_text[:2000], "findings": []})
+            continue
+
+        # Add metadata, including where in the letter the quoted violation sits (for deduplication)
+        for finding in findings:
+            finding['source_doc_id'] = job["doc_id"]
+            finding['source_recipient'] = job["recipient"]
+            finding['source_chunk'] = job["chunk"]
+            span = chunker.locate(finding.get("violation_text"), job["span"])
+            finding['source_char_start'], finding['source_char_end'] = span if span else (None, None)
+        await done.put({**record, "status": "ok", "findings": findings})
+
+
+async def _checkpoint(done, sink_path, n_workers):
+    """Single writer: appends every chunk record to the sink the moment it arrives."""
+    finished = 0
+    counts = {}
+    with open(sink_path, "a", encoding="utf-8") as sink:
+        while finished < n_workers:
+            record = await done.get()
+            if record is None:
+                finished += 1
+                continue
+            sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+            sink.flush()
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+            print(f"  [{record['status']}] Document {record['doc_id'] + 1}, chunk {record['chunk']}: "
+                  f"{len(record['findings'])} findings ({sum(counts.values())} chunks this run)")
+    return counts
+
+
+async def arun_pipeline(df, sink_path=ANALYSIS_SINK, workers=WORKERS):
+    """Producer -> `workers` concurrent LLM workers -> checkpoint writer. Chunks already in the sink are skipped."""
+    already_done = load_checkpoint(sink_path)
+    jobs = (job for job in iter_chunk_jobs(df) if job["key"] not in already_done)
+    todo = asyncio.Queue(maxsize=QUEUE_SIZE)
+    done = asyncio.Queue()
+    results = await asyncio.gather(
+        _produce(jobs, todo, workers),
+        *[_analyse(todo, done) for _ in range(workers)],
+        _checkpoint(done, sink_path, workers),
+    )
+    return results[-1]
+
+
+def export_findings(df, sink_path=ANALYSIS_SINK, output_filename=OUTPUT_ANALYSIS_FILENAME):
+    """Writes the findings of the current letters' chunks, in document order and without repeats, as the master JSON."""
+    done = load_checkpoint(sink_path)
+    master_analysis_list = []
+    missing = 0
+    for job in iter_chunk_jobs(df):
+        record = done.get(job["key"])
+        if record is None:
+            missing += 1
+            continue
+        master_analysis_list.extend(record["findings"])
+    # The same violation extracted from two overlapping chunks is kept once
+    master_analysis_list = chunker.dedupe_findings(master_analysis_list)
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        json.dump(master_analysis_list, f, ensure_ascii=False, indent=4)
+    return len(master_analysis_list), missing
 
 # -------------------------------
 # Main Pipeline
 # -------------------------------
-def run_llm_analysis_pipeline(csv_filename):
+def run_llm_analysis_pipeline(csv_filename, workers=WORKERS):
     try:
         df = pd.read_csv(csv_filename)
     except FileNotFoundError:
         print(f"Error: {csv_filename} not found.")
         return
 
-    master_analysis_list = []
-
-    print(f"Starting LLM analysis on {len(df)} documents...")
-
-    for index, row in df.iterrows():
-        full_text = str(row['full_text'])
-        doc_type = row['doc_type']
-        doc_date = row['date']
-        recipient = row['recipient'] if pd.notna(row['recipient']) else "Unknown"
-
-        chunks = chunk_text(full_text, CHUNK_SIZE)
-        doc_findings = []
-
-        print(f"\nAnalyzing Document {index + 1}/{len(df)}: {recipient} ({doc_type}). Chunks: {len(chunks)}")
-
-        for i, chunk in enumerate(chunks):
-            structured_prompt = PROMPT_TEMPLATE.format(
-                DOC_TYPE=doc_type,
-                DOC_DATE=doc_date,
-                TEXT_CHUNK=chunk
-            )
-
-            llm_response_text = call_llm_api(structured_prompt)
-
-            # Safely parse JSON
-            try:
-                findings = json.loads(llm_response_text)
-            except json.JSONDecodeError:
-                print(f"  [Warning] Failed to parse JSON for chunk {i+1}. Preview:")
-                print(llm_response_text[:500])
-                findings = []
-
-            # Add metadata
-            for finding in findings:
-                finding['source_doc_id'] = index
-                finding['source_recipient'] = recipient
-                finding['source_chunk'] = i + 1
-                doc_findings.append(finding)
-
-        master_analysis_list.extend(doc_findings)
-        print(f"Total findings extracted so far: {len(master_analysis_list)}")
+    print(f"Starting LLM analysis on {len(df)} documents with {workers} workers (checkpoint: {ANALYSIS_SINK})...")
+    started = time.time()
+    counts = llm_clients.run_sync(arun_pipeline(df, ANALYSIS_SINK, workers))
 
     # Save master JSON
-    print(f"\nAnalysis complete. Saving to {OUTPUT_ANALYSIS_FILENAME}")
-    with open(OUTPUT_ANALYSIS_FILENAME, 'w', encoding='utf-8') as f:
-        json.dump(master_analysis_list, f, ensure_ascii=False, indent=4)
-
-    print(f"✅ Done! Total findings: {len(master_analysis_list)}")
+    total, missing = export_findings(df, ANALYSIS_SINK, OUTPUT_ANALYSIS_FILENAME)
+    print(f"\nAnalysis run finished in {time.time() - started:.1f}s: {counts or 'nothing left to do'}. Saved to {OUTPUT_ANALYSIS_FILENAME}")
+    if missing:
+        print(f"⚠️ {missing} chunks still have no result; run again to retry them.")
+    print(f"✅ Done! Total findings: {total}")
 
 # -------------------------------
 # Run script
 # -------------------------------
 if __name__ == "__main__":
-    run_llm_analysis_pipeline(CSV_FILENAME)
+    import sys
+    run_llm_analysis_pipeline(CSV_FILENAME, int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else WORKERS)
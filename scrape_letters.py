@@ -1,6 +1,12 @@
 import requests
 import os
 import time
+import json
+import threading
+import functools
+import http.server
+import concurrent.futures
+from urllib.parse import urlparse
 from bs4 import BeautifulSoup
 import re
 
@@ -140,110 +146,107 @@ BOILERPLATE_KEYS = [
     "Inspections, Compliance, Enforcement, and Criminal Investigations"
 ]
 
-# --- 4. Scraper Function (The final attempt) ---
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
 
-# --- 4. Scraper Function (FINAL & HOTFIXED VERSION) ---
+# Concurrent mode: a few connections in flight overall, but never more than one request
+# per HOST_MIN_INTERVAL seconds to the same host (fda.gov blocks aggressive clients).
+MAX_WORKERS = 4
+HOST_MIN_INTERVAL = 1.0
 
-def download_and_save_letter(url, index):
-    """Fetches the webpage, extracts text by paragraph isolation and filtering, and saves it."""
-    print(f"[{index}/{len(URL_LIST)}] Fetching: {url}...")
+# Records what was fetched (with ETag / Last-Modified), so reruns only download what is missing or changed
+MANIFEST_FILE = os.path.join(OUTPUT_DIR, "_manifest.json")
+
+# --- 4. Extraction (pure: HTML in, letter text out) ---
+def extract_letter_text(html):
+    """Isolates the letter body from an FDA page. Returns the cleaned text ('' if no container was found)."""
+    soup = BeautifulSoup(html, 'html.parser')
     
-    # Boilerplate Keys are defined outside this function and assumed to be correct
-    # BOILERPLATE_KEYS = [...]
+    # Smart Container Search (EXPANDED FIX)
     
-    try:
-        # 1. Setup Request
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        page = requests.get(url, headers=headers, timeout=20)
-        page.raise_for_status() 
-
-        soup = BeautifulSoup(page.content, 'html.parser')
-        
-        # 2. Smart Container Search (EXPANDED FIX)
+    # Priority 1: The standard, specific FDA main content wrapper
+    content_wrapper = soup.find('article', id='main-content') 
+    
+    if not content_wrapper:
+         # Priority 2: Standard template main role
+        content_wrapper = soup.find('div', role='main')
         
-        # Priority 1: The standard, specific FDA main content wrapper
-        content_wrapper = soup.find('article', id='main-content') 
+    if not content_wrapper:
+        # Priority 3: Common structural div for main content on older/alternate templates
+        # Search for a <div> with common content classes (like 'container' or 'region')
+        content_wrapper = soup.find('div', {'class': ['container', 'region region-content']})
+
+    if not content_wrapper:
+        # Priority 4: Final, broadest fallback to the body tag
+        content_wrapper = soup.find('body')
+
+    if not content_wrapper:
+        return ""
+
+    # Aggressive Paragraph Isolation & Filtering (The robust logic)
+    # Search for all relevant elements within the selected wrapper
+    # Prioritize P tags, but include list items, blockquotes, and headers for structure.
+    content_elements = content_wrapper.find_all(['p', 'li', 'blockquote', 'h2', 'h3'])
+    
+    processed_paragraphs = []
+
+    # Filter and clean the extracted content
+    for element in content_elements:
+        text = element.get_text(strip=True)
         
-        if not content_wrapper:
-             # Priority 2: Standard template main role
-            content_wrapper = soup.find('div', role='main')
+        # Skip short elements (< 50 characters)
+        if len(text) < 50:
+            continue
             
-        if not content_wrapper:
-            # Priority 3: Common structural div for main content on older/alternate templates
-            # Search for a <div> with common content classes (like 'container' or 'region')
-            content_wrapper = soup.find('div', {'class': ['container', 'region region-content']})
-
-        if not content_wrapper:
-            # Priority 4: Final, broadest fallback to the body tag
-            content_wrapper = soup.find('body')
-
-        if not content_wrapper:
-            print(f"[{index}/{len(URL_LIST)}] **FAIL** ❌: Could not find any suitable wrapper element.")
-            # We return False here to skip the rest of the extraction logic if no container is found
-            return False
-
-        # 3. Aggressive Paragraph Isolation & Filtering (The robust logic)
-        # Search for all relevant elements within the selected wrapper
-        # Prioritize P tags, but include list items, blockquotes, and headers for structure.
-        content_elements = content_wrapper.find_all(['p', 'li', 'blockquote', 'h2', 'h3'])
+        # Skip boilerplate text
+        is_boilerplate = any(key in text for key in BOILERPLATE_KEYS)
+        if is_boilerplate:
+            continue
         
-        processed_paragraphs = []
+        # Heuristic to filter navigation/menu items
+        if re.search(r'^\s*(Skip to main content|Home|Search|Menu|Table of Contents|Share$)', text, re.IGNORECASE):
+            continue
         
-        # Define the boilerplate keys again for certainty
-        BOILERPLATE_KEYS = [
-            "About Warning and Close-Out Letters",
-            "Content current as of:",
-            "Regulated Product(s)",
-            "Download Section",
-            "How to Contact FDA",
-            "Follow FDA",
-            "Back to top",
-            "Inspections, Compliance, Enforcement, and Criminal Investigations"
-        ]
-
-        # Filter and clean the extracted content
-        for element in content_elements:
-            text = element.get_text(strip=True)
-            
-            # Skip short elements (< 50 characters)
-            if len(text) < 50:
-                continue
-                
-            # Skip boilerplate text
-            is_boilerplate = any(key in text for key in BOILERPLATE_KEYS)
-            if is_boilerplate:
-                continue
-            
-            # Heuristic to filter navigation/menu items
-            if re.search(r'^\s*(Skip to main content|Home|Search|Menu|Table of Contents|Share$)', text, re.IGNORECASE):
-                continue
-            
-            # Final specific cleaning for addresses/contact lines that get missed but are repetitive
-            if re.search(r'(Please notify this office in writing|Sincerely|Contact information for the FDA)', text, re.IGNORECASE):
-                continue
+        # Final specific cleaning for addresses/contact lines that get missed but are repetitive
+        if re.search(r'(Please notify this office in writing|Sincerely|Contact information for the FDA)', text, re.IGNORECASE):
+            continue
 
-            processed_paragraphs.append(text)
+        processed_paragraphs.append(text)
 
-        # 4. Reassemble the letter text
-        letter_text = '\n\n'.join(processed_paragraphs)
+    # Reassemble the letter text
+    letter_text = '\n\n'.join(processed_paragraphs)
+    return re.sub(r'\n\s*\n', '\n\n', letter_text)
 
-        # --- Check for successful extraction and save ---
-        if letter_text and len(letter_text) > 500:
-            
-            # Final cleaning
-            letter_text = re.sub(r'\n\s*\n', '\n\n', letter_text)
-            
-            # Create a unique filename
-            filename_segment = url.split('/')[-1] 
-            filename = os.path.join(OUTPUT_DIR, f"{filename_segment}.txt")
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(letter_text)
+
+def letter_filename(url, output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, f"{url.split('/')[-1]}.txt")
+
+
+def save_letter(url, letter_text, output_dir=OUTPUT_DIR):
+    """Writes the letter if extraction produced a real body. Returns the filename, or None if too short."""
+    if not letter_text or len(letter_text) <= 500:
+        return None
+    filename = letter_filename(url, output_dir)
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(letter_text)
+    return filename
+
+
+# --- 5. Scraper Function (sequential, one URL) ---
+def download_and_save_letter(url, index, session=None):
+    """Fetches the webpage, extracts text by paragraph isolation and filtering, and saves it."""
+    print(f"[{index}/{len(URL_LIST)}] Fetching: {url}...")
+    
+    try:
+        page = (session or requests).get(url, headers=HEADERS, timeout=20)
+        page.raise_for_status() 
+
+        letter_text = extract_letter_text(page.content)
+        filename = save_letter(url, letter_text)
+        if filename:
             print(f"[{index}/{len(URL_LIST)}] **SUCCESS** ✅: Saved to {filename}")
             return True
-        else:
-            print(f"[{index}/{len(URL_LIST)}] **FAIL** ❌: Isolation succeeded but final text was too short (Length: {len(letter_text)} chars).")
-            return False
+        print(f"[{index}/{len(URL_LIST)}] **FAIL** ❌: Isolation succeeded but final text was too short (Length: {len(letter_text)} chars).")
+        return False
             
     except requests.exceptions.RequestException as e:
         print(f"[{index}/{len(URL_LIST)}] ERROR: Network or Request failed: {e}")
@@ -251,33 +254,178 @@ def download_and_save_letter(url, index):
     except Exception as e:
         print(f"[{index}/{len(URL_LIST)}] ERROR: General failure: {e}")
         return False
-    
-# --- 5. Main Execution Loop ---
+
+
+# --- 6. Concurrent, Resumable Scraper ---
+class HostThrottle:
+    """Per-host politeness: callers for the same host are spaced at least `interval` seconds apart."""
+    def __init__(self, interval=HOST_MIN_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def load_manifest(path=MANIFEST_FILE):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def make_session(max_workers=MAX_WORKERS):
+    """One pooled session: connections (and TLS handshakes) are reused across letters."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def fetch_letter(session, throttle, url, entry=None, fetch_url=None, output_dir=OUTPUT_DIR):
+    """
+    Conditional GET for one letter. Returns the new manifest entry; status is one of
+    'saved', 'unchanged', 'too_short' or 'error'.
+    """
+    entry = entry or {}
+    headers = {}
+    # Only revalidate if we still have the file the validators belong to
+    if entry.get("status") in ("saved", "unchanged") and os.path.exists(letter_filename(url, output_dir)):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    throttle.wait(fetch_url or url)
+    try:
+        page = session.get(fetch_url or url, headers=headers, timeout=20)
+        if page.status_code == 304:
+            return {**entry, "status": "unchanged", "checked_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        page.raise_for_status()
+
+        letter_text = extract_letter_text(page.content)
+        filename = save_letter(url, letter_text, output_dir)
+        return {
+            "status": "saved" if filename else "too_short",
+            "file": filename,
+            "chars": len(letter_text),
+            "etag": page.headers.get("ETag"),
+            "last_modified": page.headers.get("Last-Modified"),
+            "checked_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    except Exception as e:
+        return {**entry, "status": "error", "error": str(e), "checked_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def scrape_all(urls=URL_LIST, max_workers=MAX_WORKERS, manifest_path=MANIFEST_FILE, revalidate=True,
+               url_map=None, output_dir=OUTPUT_DIR):
+    """
+    Scrapes `urls` concurrently and records every result in the manifest as it lands, so an
+    interrupted run resumes where it stopped. With revalidate=False, letters already saved are
+    not contacted at all; otherwise they get a cheap conditional request (304 if unchanged).
+    `url_map` optionally rewrites where each URL is fetched from (e.g. a local fixture server).
+    """
+    manifest = load_manifest(manifest_path)
+    manifest_lock = threading.Lock()
+    throttle = HostThrottle()
+    session = make_session(max_workers)
+
+    todo = [u for u in urls if revalidate or manifest.get(u, {}).get("status") not in ("saved", "unchanged")]
+    print(f"--- Scraping {len(todo)} of {len(urls)} URLs with {max_workers} workers ---")
+
+    counts = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(fetch_letter, session, throttle, url, manifest.get(url),
+                        url_map(url) if url_map else None, output_dir): url
+            for url in todo
+        }
+        for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            url = futures[future]
+            entry = future.result()
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+            icon = "✅" if entry["status"] in ("saved", "unchanged") else "❌"
+            print(f"[{done}/{len(todo)}] {icon} {entry['status'].upper()}: {url.split('/')[-1]}")
+            with manifest_lock:
+                manifest[url] = entry
+                save_manifest(manifest, manifest_path)
+
+    session.close()
+    print(f"--- Scraping Complete: {counts} ---")
+    return manifest
+
+
+# --- 7. Local Stand-in Server (offline runs against saved HTML) ---
+def serve_fixtures(directory, port=0):
+    """
+    Serves `directory` over HTTP on localhost in a background thread. The stdlib handler sends
+    Last-Modified and answers If-Modified-Since with 304, so conditional requests work too.
+    Returns (server, base_url); call server.shutdown() when done.
+    """
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def fixture_url(base_url):
+    """Maps each FDA URL to '<base_url>/<last path segment>.html' on the fixture server."""
+    return lambda url: f"{base_url}/{url.split('/')[-1]}.html"
+
+
+# --- 8. Main Execution ---
 if __name__ == "__main__":
-    # URL_LIST should be defined earlier in your script
-    total_urls = len(URL_LIST)
-    success_count = 0
-    fail_count = 0
+    import sys
 
-    print(f"--- Starting Scraping of {total_urls} URLs ---")
-    
-    # Iterate through the list, keeping track of the index (i) and the URL
-    for i, url in enumerate(URL_LIST):
-        # Index for display starts at 1, not 0
-        index = i + 1 
-        
-        # Call the scraping function
-        result = download_and_save_letter(url, index)
-        
-        if result:
-            success_count += 1
-        else:
-            fail_count += 1
-        
-        # Wait for 3 seconds to be polite to the server and avoid being blocked
-        time.sleep(3) 
+    if "--sequential" in sys.argv:
+        # Original one-at-a-time mode
+        total_urls = len(URL_LIST)
+        success_count = 0
+        fail_count = 0
+
+        print(f"--- Starting Scraping of {total_urls} URLs ---")
+        with make_session(1) as session:
+            for i, url in enumerate(URL_LIST):
+                if download_and_save_letter(url, i + 1, session=session):
+                    success_count += 1
+                else:
+                    fail_count += 1
+                # Wait for 3 seconds to be polite to the server and avoid being blocked
+                time.sleep(3) 
+
+        print("--- Scraping Complete ---")
+        print(f"Total URLs Processed: {total_urls}")
+        print(f"Successful Extractions: {success_count} ✅")
+        print(f"Failed Extractions: {fail_count} ❌")
+
+    elif "--fixtures" in sys.argv:
+        # Offline run: python scrape_letters.py --fixtures <dir of saved .html pages>
+        # Extracted letters land in <dir>/extracted so the real corpus is left alone.
+        fixture_dir = sys.argv[sys.argv.index("--fixtures") + 1]
+        extracted_dir = os.path.join(fixture_dir, "extracted")
+        os.makedirs(extracted_dir, exist_ok=True)
+        server, base_url = serve_fixtures(fixture_dir)
+        try:
+            scrape_all(URL_LIST, manifest_path=os.path.join(extracted_dir, "_manifest.json"),
+                       url_map=fixture_url(base_url), output_dir=extracted_dir)
+        finally:
+            server.shutdown()
 
-    print("--- Scraping Complete ---")
-    print(f"Total URLs Processed: {total_urls}")
-    print(f"Successful Extractions: {success_count} ✅")
-    print(f"Failed Extractions: {fail_count} ❌")
\ No newline at end of file
+    else:
+        scrape_all(URL_LIST, revalidate="--skip-done" not in sys.argv)
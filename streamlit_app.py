@@ -1,7 +1,7 @@
 import streamlit as st
-import pandas as pd 
 import os
 from dotenv import load_dotenv
+import library_store
 from lifecycle_agent import BiostatLifecycleAgent
 
 # Load Environment
@@ -19,22 +19,14 @@ agent = get_agent(api_key, "regulatory_library.txt")
 # --- POP-UP DIALOG FOR FULL LETTER VIEWING ---
 @st.dialog("Original FDA Correspondence", width="large")
 def show_full_letter(name_to_find):
-    df = pd.read_csv("fda_letters.csv")
+    # Indexed lookup in the library store instead of parsing fda_letters.csv on every click
+    letter = library_store.find_letter(name_to_find)
     
-    # --- SAFE FIX START ---
-    # 1. Force the 'recipient' column to be text (strings)
-    # 2. Fill any empty boxes with an empty space so it doesn't crash
-    df['recipient'] = df['recipient'].astype(str).fillna('')
-    # --- SAFE FIX END ---
-    
-    # Now this line won't crash!
-    match = df[df['recipient'].str.contains(name_to_find, case=False, na=False)]
-    
-    if not match.empty:
-        st.subheader(f"Full Letter to {match.iloc[0]['recipient']}")
-        st.caption(f"Date: {match.iloc[0]['date']}")
+    if letter:
+        st.subheader(f"Full Letter to {letter['recipient']}")
+        st.caption(f"Date: {letter['date']}")
         st.divider()
-        st.text_area("Official Text", value=match.iloc[0]['full_text'], height=600)
+        st.text_area("Official Text", value=letter['full_text'], height=600)
     else:
         st.error(f"Could not find a letter for '{name_to_find}' in the database.")
 
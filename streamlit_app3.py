@@ -1,9 +1,8 @@
 import streamlit as st
-import pandas as pd 
 import os
 from dotenv import load_dotenv
-from lifecycle_agent3 import BiostatLifecycleAgent3
-from evaluator import AuditorEvaluator
+import app_resources
+import background_jobs
 
 
 # --- INITIALIZATION BLOCK ---
@@ -28,34 +27,68 @@ load_dotenv()
 api_key = os.getenv("GROQ_API_KEY")
 
 # Cache the agent to avoid re-initialization on every interaction
-@st.cache_resource
-def get_agent(api_key, library_path):
-    return BiostatLifecycleAgent3(api_key, library_path)
+# (app_resources also preloads the letters and indexes, and rebuilds them when their files change)
+get_agent = app_resources.get_agent
 
 # Initialize Agent
 agent = get_agent(api_key, "master_regulatory_library.csv")
 
 # --- POP-UP DIALOG FOR FULL LETTER VIEWING ---
 @st.dialog("Original FDA Correspondence", width="large")
-def show_full_letter(name_to_find):
-    df = pd.read_csv("fda_letters.csv")
+def show_full_letter(letter_id):
+    # Preloaded letters, opened by the id the entity index resolved (not by a recipient substring)
+    letter = app_resources.get_letter_store().get(letter_id)
     
-    # --- SAFE FIX START ---
-    # 1. Force the 'recipient' column to be text (strings)
-    # 2. Fill any empty boxes with an empty space so it doesn't crash
-    df['recipient'] = df['recipient'].astype(str).fillna('')
-    # --- SAFE FIX END ---
-    
-    # Now this line won't crash!
-    match = df[df['recipient'].str.contains(name_to_find, case=False, na=False)]
-    
-    if not match.empty:
-        st.subheader(f"Full Letter to {match.iloc[0]['recipient']}")
-        st.caption(f"Date: {match.iloc[0]['date']}")
+    if letter:
+        st.subheader(f"Full Letter to {letter['recipient']}")
+        st.caption(f"Date: {letter['date']}")
         st.divider()
-        st.text_area("Official Text", value=match.iloc[0]['full_text'], height=600)
+        st.text_area("Official Text", value=letter['full_text'], height=600)
     else:
-        st.error(f"Could not find a letter for '{name_to_find}' in the database.")
+        st.error(f"Could not find letter #{letter_id} in the database.")
+
+
+# --- BACKGROUND AUDIT / OPTIMIZE JOBS ---
+# The long LLM runs go to background_jobs instead of blocking this script thread. The job id is kept
+# in session state and in the URL (?audit_job=...), so reruns, tab switches and page reloads
+# reattach to the same job and stream its output from where it is.
+JOB_TARGETS = {"audit_job": "audit_report", "optimize_job": "final_protocol"}
+
+
+def start_job(job_key, kind, stream, final=None, inputs=None):
+    job_id = background_jobs.submit(kind, stream, final=final, inputs=inputs)
+    st.session_state[job_key] = job_id
+    st.query_params[job_key] = job_id
+
+
+def sync_job(job_key):
+    """Copies a finished job's result into session state (once per session); returns the job or None."""
+    job_id = st.session_state.get(job_key)
+    job = background_jobs.get(job_id) if job_id else None
+    if job is None:
+        return None
+    # After a reload, bring back what the job was started from
+    for name, value in job["inputs"].items():
+        if st.session_state.get(name) is None:
+            st.session_state[name] = value
+    if job["status"] == background_jobs.DONE and job_id not in st.session_state.applied_jobs:
+        st.session_state[JOB_TARGETS[job_key]] = job["result"]
+        st.session_state.applied_jobs.add(job_id)
+    return job
+
+
+@st.fragment
+def watch_job(job_key, caption):
+    """Streams the job's output as it is written (only this fragment updates); reruns the page when the job ends."""
+    with st.container(border=True):
+        st.caption(f"{caption} (it keeps running if you switch tabs or reload the page)")
+        st.write_stream(background_jobs.stream_output(st.session_state[job_key]))
+    st.rerun()
+
+
+def show_job_error(job, label):
+    if job is not None and job["status"] in (background_jobs.FAILED, background_jobs.INTERRUPTED):
+        st.error(f"{label} {job['status']}: {job['error']}")
 
 
 # --- INITIALIZE SESSION STATE ---
@@ -66,10 +99,13 @@ if 'protocol' not in st.session_state: st.session_state.protocol = None
 if 'audit_report' not in st.session_state: st.session_state.audit_report = None
 if 'final_protocol' not in st.session_state: st.session_state.final_protocol = None
 if 'user_notes' not in st.session_state: st.session_state.user_notes = ""
+if 'applied_jobs' not in st.session_state: st.session_state.applied_jobs = set()
+for job_key in JOB_TARGETS:
+    if job_key not in st.session_state: st.session_state[job_key] = st.query_params.get(job_key)
+jobs = {job_key: sync_job(job_key) for job_key in JOB_TARGETS}
 
 # --- UI CONFIG ---
 st.set_page_config(page_title="BioStat Enterprise AI", layout="wide", page_icon="🧬")
-agent = BiostatLifecycleAgent3(api_key, "regulatory_library.txt")
 
 # --- SIDEBAR (MLOps Explanation) ---
 with st.sidebar:
@@ -95,7 +131,7 @@ with st.sidebar:
     st.divider()
     st.subheader("🧪 Developer Stress Tests")
     if st.button("🚀 Run Logic Validation"):
-        evaluator = AuditorEvaluator()
+        evaluator = app_resources.get_evaluator()
         
         # USE THE CACHED AGENT instead of making a new one to ensure consistency
         # And ensure the library path is correct
@@ -249,11 +285,19 @@ with tab2:
             default="Full Protocol"
         )
 
-        if st.button("Run Regulatory Scan"):
-            with st.spinner("Performing Semantic Search & Regulatory Audit..."):
-                # We wrap the protocol in a 'Scope' tag so the Agent knows how to grade it
-                scoped_input = f"SCOPE: {audit_scope}\n\n{st.session_state.protocol}"
-                st.session_state.audit_report = agent.audit_protocol(scoped_input, "FDA Lessons")
+        audit_job = jobs["audit_job"]
+        audit_running = audit_job is not None and audit_job["status"] == background_jobs.RUNNING
+        if st.button("Run Regulatory Scan", disabled=audit_running):
+            # We wrap the protocol in a 'Scope' tag so the Agent knows how to grade it
+            scoped_input = f"SCOPE: {audit_scope}\n\n{st.session_state.protocol}"
+            start_job("audit_job", "audit", agent.audit_protocol_stream(scoped_input, "FDA Lessons"),
+                      inputs={"protocol": st.session_state.protocol})
+            st.rerun()
+
+        # The report streams in as it is written; the formatted version below replaces it when done
+        if audit_running:
+            watch_job("audit_job", "Performing Semantic Search & Regulatory Audit...")
+        show_job_error(audit_job, "Audit")
         
         if st.session_state.audit_report:
             # --- 1. THE TABLE ---
@@ -270,16 +314,23 @@ with tab2:
 
             ev_cols = st.columns(3)
             col_idx = 0
+            entities = app_resources.get_entity_index()
+            shown = set()
             # We look for the "MATCH FOUND" or any line that looks like a citation in Section 1
             for line in st.session_state.audit_report.split('\n'):
                 if "MATCH FOUND" in line.upper() or "PRECEDENT:" in line.upper():
-                    # Extracts words that look like company names (Capitalized words)
+                    # "MATCH FOUND: [Date] | [Recipient Name] | [Quote]": the full name (exact, prefix
+                    # or fuzzy) plus the date pick the exact letter, even when a company has several
                     parts = line.split('|')
                     if len(parts) >= 2:
-                        company_name = parts[1].strip().split(' ')[0] # Takes the first word/name
+                        match = entities.resolve(parts[1].strip(), date=parts[0])
+                        if match is None or match['letter_id'] in shown:
+                            continue
+                        shown.add(match['letter_id'])
+                        label = match['recipient'] or ", ".join(match['applications']) or f"letter #{match['letter_id']}"
                         with ev_cols[col_idx % 3]:
-                            if st.button(f"📖 View {company_name}", key=f"btn_{col_idx}"):
-                                show_full_letter(company_name)
+                            if st.button(f"📖 View {label}", key=f"btn_{col_idx}", help=f"Letter dated {match['date']}"):
+                                show_full_letter(match['letter_id'])
                         col_idx += 1
 
             # --- 4. THE NOTES SECTION ---
@@ -294,14 +345,26 @@ with tab2:
 with tab3:
     st.header("Step 3: Optimization & Export")
     if st.session_state.audit_report:
-        if st.button("🚀 Finalize FDA-Proof Protocol"):
-            with st.spinner("Optimizing..."):
-                # PASS THE USER NOTES (DIRECTIVES) HERE!
-                st.session_state.final_protocol = agent.optimize_protocol(
-                    st.session_state.protocol, 
-                    st.session_state.audit_report,
-                    user_directives=st.session_state.user_notes
-                )
+        optimize_job = jobs["optimize_job"]
+        optimize_running = optimize_job is not None and optimize_job["status"] == background_jobs.RUNNING
+        if st.button("🚀 Finalize FDA-Proof Protocol", disabled=optimize_running):
+            # Every rewrite streams in as it is drafted; the one that passes the check is kept
+            optimized = {}
+            # PASS THE USER NOTES (DIRECTIVES) HERE!
+            stream = agent.optimize_protocol_stream(
+                st.session_state.protocol, 
+                st.session_state.audit_report,
+                user_directives=st.session_state.user_notes,
+                result=optimized
+            )
+            start_job("optimize_job", "optimize", stream, final=lambda text: optimized["protocol"], inputs={
+                "protocol": st.session_state.protocol, "audit_report": st.session_state.audit_report
+            })
+            st.rerun()
+
+        if optimize_running:
+            watch_job("optimize_job", "Optimizing...")
+        show_job_error(optimize_job, "Optimization")
             
     if st.session_state.final_protocol:
         st.success("### Final FDA-Proof Protocol")
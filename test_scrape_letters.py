@@ -0,0 +1,158 @@
+import os
+
+import pytest
+import requests
+
+import scrape_letters
+
+# Offline checks of the concurrent, resumable scraper (scrape_all) against a stubbed session.
+# Run with: python -m pytest test_scrape_letters.py
+URLS = [
+    "https://www.fda.gov/warning-letters/acme-pharma-inc-100001-01012025",
+    "https://www.fda.gov/warning-letters/globex-labs-llc-100002-01022025",
+]
+PARAGRAPH = "<p>During our inspection of your facility, investigators observed significant violations of CGMP regulations.</p>"
+PAGE = f"<html><body><article id='main-content'>{PARAGRAPH * 8}</article></body></html>".encode("utf-8")
+
+
+class StubResponse:
+    def __init__(self, status_code=200, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error")
+
+
+class StubSession:
+    """Answers like a server that supports ETags; `fail` holds URLs that get a 503 for now."""
+
+    def __init__(self):
+        self.requests = []
+        self.fail = set()
+
+    def get(self, url, headers=None, timeout=None):
+        headers = headers or {}
+        self.requests.append((url, headers))
+        if url in self.fail:
+            return StubResponse(503)
+        etag = f'"{url.split("-")[-1]}"'
+        if headers.get("If-None-Match") == etag:
+            return StubResponse(304)
+        return StubResponse(200, PAGE, {"ETag": etag, "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"})
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def session(monkeypatch):
+    stub = StubSession()
+    monkeypatch.setattr(scrape_letters, "make_session", lambda max_workers=None: stub)
+    # One host for every URL: skip the politeness delay between them
+    monkeypatch.setattr(scrape_letters.HostThrottle, "wait", lambda self, url: None)
+    return stub
+
+
+def run(tmp_path, **kwargs):
+    return scrape_letters.scrape_all(URLS, max_workers=2, manifest_path=str(tmp_path / "_manifest.json"),
+                                     output_dir=str(tmp_path), **kwargs)
+
+
+def test_unchanged_letter_is_revalidated_with_304(tmp_path, session):
+    first = run(tmp_path)
+    assert all(first[url]["status"] == "saved" for url in URLS)
+    saved = scrape_letters.letter_filename(URLS[0], str(tmp_path))
+    mtime = os.path.getmtime(saved)
+
+    session.requests.clear()
+    second = run(tmp_path)
+    sent = dict(session.requests)
+    assert sent[URLS[0]]["If-None-Match"] == first[URLS[0]]["etag"]
+    assert sent[URLS[0]]["If-Modified-Since"] == first[URLS[0]]["last_modified"]
+    assert all(second[url]["status"] == "unchanged" for url in URLS)
+    assert second[URLS[0]]["etag"] == first[URLS[0]]["etag"]
+    assert os.path.getmtime(saved) == mtime
+
+
+def test_missing_file_is_downloaded_again(tmp_path, session):
+    run(tmp_path)
+    os.remove(scrape_letters.letter_filename(URLS[0], str(tmp_path)))
+
+    session.requests.clear()
+    manifest = run(tmp_path)
+    sent = dict(session.requests)
+    assert "If-None-Match" not in sent[URLS[0]]
+    assert manifest[URLS[0]]["status"] == "saved"
+
+
+def test_resume_skips_letters_already_saved(tmp_path, session):
+    session.fail.add(URLS[1])
+    run(tmp_path)
+
+    session.requests.clear()
+    run(tmp_path, revalidate=False)
+    assert [url for url, _ in session.requests] == [URLS[1]]
+
+
+def test_failed_letter_is_retried_on_the_next_run(tmp_path, session):
+    session.fail.add(URLS[1])
+    first = run(tmp_path)
+    assert first[URLS[0]]["status"] == "saved"
+    assert first[URLS[1]]["status"] == "error"
+    assert not os.path.exists(scrape_letters.letter_filename(URLS[1], str(tmp_path)))
+
+    session.fail.clear()
+    second = scrape_letters.load_manifest(str(tmp_path / "_manifest.json"))
+    assert second[URLS[1]]["status"] == "error"
+    third = run(tmp_path, revalidate=False)
+    assert third[URLS[1]]["status"] == "saved"
+    assert os.path.exists(scrape_letters.letter_filename(URLS[1], str(tmp_path)))
+
+
+# --- Saved FDA page, served by the local stand-in server ---
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "fda_pages")
+FIXTURE_URL = next(url for url in scrape_letters.URL_LIST if url.endswith("/nana-barseghian-md-708009-04282025"))
+
+
+def expected_letter(url):
+    with open(os.path.join(FIXTURE_DIR, "expected", f"{url.split('/')[-1]}.txt"), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def fixture_server():
+    server, base_url = scrape_letters.serve_fixtures(FIXTURE_DIR)
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_saved_page_is_extracted_without_template_text(tmp_path, fixture_server):
+    manifest = scrape_letters.scrape_all([FIXTURE_URL], max_workers=1, manifest_path=str(tmp_path / "_manifest.json"),
+                                         url_map=scrape_letters.fixture_url(fixture_server), output_dir=str(tmp_path))
+    assert manifest[FIXTURE_URL]["status"] == "saved"
+    with open(scrape_letters.letter_filename(FIXTURE_URL, str(tmp_path)), encoding="utf-8") as f:
+        text = f.read()
+
+    assert text == expected_letter(FIXTURE_URL)
+    assert text.startswith("19875 Nordhoff Street")
+    # Site template: navigation, sidebar, share buttons, page footer
+    for template_text in ["Skip to main content", "Inspections, Compliance, Enforcement", "About Warning and Close-Out Letters",
+                          "Content current as of:", "Regulated Product(s)", "Back to top", "How to Contact FDA", "Follow FDA",
+                          "official website of the United States government", "Linkedin"]:
+        assert template_text not in text
+    # Letter furniture: the signature block and the short header lines
+    assert "Sincerely" not in text
+    assert "MARCS-CMS" not in text
+
+
+def test_saved_page_is_revalidated_by_the_server(tmp_path, fixture_server):
+    kwargs = dict(max_workers=1, manifest_path=str(tmp_path / "_manifest.json"),
+                  url_map=scrape_letters.fixture_url(fixture_server), output_dir=str(tmp_path))
+    first = scrape_letters.scrape_all([FIXTURE_URL], **kwargs)
+    assert first[FIXTURE_URL]["last_modified"]
+    # The stdlib server answers If-Modified-Since with 304
+    assert scrape_letters.scrape_all([FIXTURE_URL], **kwargs)[FIXTURE_URL]["status"] == "unchanged"
@@ -1,16 +1,18 @@
-import pandas as pd
-from difflib import get_close_matches
+import library_store
+import quote_locator
 
-lib = pd.read_csv("master_regulatory_library.csv")
-library_sentences = lib['content'].tolist()
+lib = library_store.read_library("master_regulatory_library.csv")
+locator = quote_locator.get_locator("master_regulatory_library.csv")
 
 # Paste one of your "Hallucinated" quotes here
 hallucination = "The use of LOCF for handling missing data is not acceptable"
 
 print(f"Checking: {hallucination}")
-matches = get_close_matches(hallucination, library_sentences, n=1, cutoff=0.1)
+matches = locator.locate(hallucination, top_k=3)
 
-if matches:
-    print(f"Closest Match in Library:\n-> {matches[0]}")
+if matches and matches[0]['similarity'] >= quote_locator.PARAPHRASE_THRESHOLD:
+    for m in matches:
+        print(f"Closest Match in Library (row {m['row']}, '{lib['title'].iloc[m['row']]}', sim {m['similarity']:.2f}, chars {m['start']}-{m['end']}):\n-> {m['text']}")
 else:
-    print("NO MATCH FOUND. The agent invented this entirely.")
\ No newline at end of file
+    closest = f" (closest sim {matches[0]['similarity']:.2f}: {matches[0]['text']})" if matches else ""
+    print(f"NO MATCH FOUND. The agent invented this entirely.{closest}")
@@ -0,0 +1,118 @@
+import os
+import re
+import json
+import hashlib
+from datetime import datetime
+
+# --- 1. Configuration ---
+# The scoring rules used by validator.py and evaluator.py, kept free of agent/LLM imports so the
+# batch re-validator (revalidate.py) can run them in worker processes. Bump SCORING_VERSION
+# whenever a rubric changes, so re-scored results can be told apart from older ones.
+SCORING_VERSION = 1
+
+# Every validated report is archived here, so it can be re-scored later without a new LLM call
+REPORT_ARCHIVE = os.environ.get("AUDIT_REPORT_ARCHIVE", "audit_reports.jsonl")
+
+QUOTED = re.compile(r'"([^"]*)"')
+
+RUBRICS = {
+    # validator.py: 6+ word quotes, truthfulness 2 points, the "thinking monologue" 2 points
+    "validator": {
+        "min_words": 6,
+        "total_checks": 5,
+        "truth_points": 2,
+        "format_points": 2,
+        "format_markers": ["DOES THE PROTOCOL MENTION"],
+        "labels": ("✅ VERIFIED QUOTE", "❌ HALLUCINATED QUOTE"),
+    },
+    # evaluator.py: 5+ word quotes, truthfulness 60% of the grade, formatting 40%
+    "evaluator": {
+        "min_words": 5,
+        "total_checks": 5,
+        "truth_points": 3,
+        "format_points": 2,
+        "format_markers": ["SECTION", "RISK"],
+        "labels": ("✅ VERIFIED", "❌ HALLUCINATED"),
+    },
+}
+PASS_THRESHOLD = 80
+
+
+# --- 2. Quote Checks ---
+def check_quotes(report_text, min_words, quote_idx, locator, labels=RUBRICS["evaluator"]["labels"], verbose=False):
+    """Returns (verbatim quotes, diagnostics) for every double-quoted phrase of `min_words`+ words."""
+    import quote_locator
+    valid_quotes, diagnostics = [], []
+    for phrase in QUOTED.findall(report_text):
+        clean = phrase.strip()
+        if len(clean.split()) < min_words:
+            continue
+        # NORMALIZATION (punctuation off, lower-case) and lookup happen in the quote index
+        verdict, match = quote_locator.classify_quote(clean, quote_idx, locator)
+        if verdict == "verified":
+            if verbose: print(f"{labels[0]}: '{clean[:50]}...'")
+            valid_quotes.append(clean)
+        elif verdict == "paraphrase":
+            if verbose: print(f"⚠️ PARAPHRASED: '{clean[:50]}...' (sim {match['similarity']:.2f}, row {match['row']})")
+            diagnostics.append(f"PARAPHRASE: {clean} (closest: row {match['row']}, sim {match['similarity']:.2f})")
+        else:
+            if verbose: print(f"{labels[1]}: '{clean[:50]}...'")
+            diagnostics.append(f"HALLUCINATION: {clean}")
+    return valid_quotes, diagnostics
+
+
+# --- 3. Scoring ---
+def score_report(report_text, rubric, quote_idx, locator, verbose=False):
+    """Applies one of RUBRICS to a report: {"score", "status", "failures", "verified_quotes"}."""
+    rules = RUBRICS[rubric]
+    valid_quotes, diagnostics = check_quotes(
+        report_text, rules["min_words"], quote_idx, locator, rules["labels"], verbose
+    )
+    passed_checks = 0
+    # Paraphrased quotes are still not verbatim evidence
+    if valid_quotes and not diagnostics:
+        passed_checks += rules["truth_points"]
+    if any(marker in report_text.upper() for marker in rules["format_markers"]):
+        passed_checks += rules["format_points"]
+
+    final_score = (passed_checks / rules["total_checks"]) * 100
+    return {
+        "score": f"{final_score}%",
+        "status": "PASS" if final_score >= PASS_THRESHOLD else "FAIL",
+        "failures": diagnostics,
+        "verified_quotes": len(valid_quotes),
+    }
+
+
+# --- 4. The Report Archive ---
+def report_id(protocol_name, report_text):
+    return hashlib.sha1(f"{protocol_name}\x00{report_text}".encode("utf-8")).hexdigest()[:16]
+
+
+def archive_report(protocol_name, rubric, report_text, result, path=REPORT_ARCHIVE):
+    record = {
+        "report_id": report_id(protocol_name, report_text),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "protocol": protocol_name,
+        "rubric": rubric,
+        "scoring_version": SCORING_VERSION,
+        "result": {k: result[k] for k in ("score", "status") if k in result},
+        "report": report_text,
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return record["report_id"]
+
+
+def iter_archive(path=REPORT_ARCHIVE):
+    """Streams archived reports one line at a time; a torn last line (crash mid-write) is skipped."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get("report"):
+                yield record
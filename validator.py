@@ -1,10 +1,12 @@
-import pandas as pd
-import re
 import json
 from datetime import datetime
 from lifecycle_agent3 import BiostatLifecycleAgent3 
 import os
 from dotenv import load_dotenv
+import library_store
+import quote_index
+import quote_locator
+import validation_scoring
 
 # Load the .env file
 load_dotenv()
@@ -12,9 +14,13 @@ load_dotenv()
 # --- 1. THE EVALUATOR CLASS (The Judge) ---
 class AuditorValidator:
     def __init__(self, library_path="master_regulatory_library.csv"):
-        self.library = pd.read_csv(library_path)
+        self.library = library_store.read_library(library_path)
         self.library.columns = [c.strip() for c in self.library.columns]
         self.log_file = "audit_validation_performance.jsonl"
+        # Built once (and memory-mapped), so each quote check is a hash lookup, not a library scan
+        self.quote_index = quote_index.get_quote_index(library_path)
+        # Near-miss quotes are located fuzzily, so a paraphrase is told apart from an invention
+        self.locator = quote_locator.get_locator(library_path)
         
         # --- NEW: Print Library Stats on Init ---
         print(f"--- VALIDATOR INITIALIZED ---")
@@ -23,53 +29,22 @@ class AuditorValidator:
         print("-" * 30)
 
     def validate_report(self, protocol_name, report_text):
-        diagnostics = []
-        metrics = {"passed_checks": 0, "total_checks": 5}
-        
-        # --- NEW LOGIC: Extract text inside " " instead of ** ** ---
-        quoted_phrases = re.findall(r'"([^"]*)"', report_text)
-        
         print(f"\n--- VERIFYING QUOTED EVIDENCE ---")
-        valid_quotes = []
-        for phrase in quoted_phrases:
-            clean = phrase.strip()
-            if len(clean.split()) >= 6:
-                # NORMALIZATION: Remove punctuation and lower-case for the check
-                def normalize(text):
-                    return re.sub(r'[^\w\s]', '', text).lower().strip()
-
-                norm_phrase = normalize(clean)
-                # Check if the normalized phrase exists in any normalized library entry
-                match_exists = self.library['content'].apply(lambda x: norm_phrase in normalize(str(x))).any()
-                
-                if match_exists:
-                    print(f"✅ VERIFIED QUOTE: '{clean[:50]}...'")
-                    valid_quotes.append(clean)
-                else:
-                    print(f"❌ HALLUCINATED QUOTE: '{clean[:50]}...'")
-                    diagnostics.append(f"HALLUCINATION: {clean}")
-
-        if valid_quotes and not any("HALLUCINATION" in d for d in diagnostics):
-            metrics["passed_checks"] += 2 # Heavy weight on truthfulness
-
-        # Monologue Check
-        monologue_passed = "DOES THE PROTOCOL MENTION" in report_text.upper()
-        if monologue_passed: metrics["passed_checks"] += 2
-
-        final_score = (metrics["passed_checks"] / metrics["total_checks"]) * 100
-        status = "PASS" if final_score >= 80 else "FAIL"
+        # Scoring rules live in validation_scoring, shared with the batch re-validator
+        verdict = validation_scoring.score_report(report_text, "validator", self.quote_index, self.locator, verbose=True)
 
         result = {
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "protocol": protocol_name,
-            "score": f"{final_score}%",
-            "status": status,
-            "failures": diagnostics
+            "score": verdict["score"],
+            "status": verdict["status"],
+            "failures": verdict["failures"]
         }
         
-        # Append to log
+        # Append to log, and archive the report itself so it can be re-scored later
         with open(self.log_file, "a") as f:
             f.write(json.dumps(result) + "\n")
+        validation_scoring.archive_report(protocol_name, "validator", report_text, result)
             
         return result
 
@@ -1,37 +1,61 @@
-import time
+import os
 import json
-from lifecycle_agent3 import BiostatLifecycleAgent3 # Your existing class
+from dotenv import load_dotenv
+
+import rate_limiter
+
+load_dotenv()
+
+# Outcomes of one job, read by the queue (job_queue.py)
+DONE = "DONE"
+RETRY = "RETRY"
+FAILED = "FAILED"
+
+# INITIALIZE YOUR AGENT (lazily, once per worker process, so the queue CLI can import this module cheaply)
+_agent = None
+
+
+def get_agent():
+    global _agent
+    if _agent is None:
+        from lifecycle_agent3 import BiostatLifecycleAgent3 # Your existing class
+        _agent = BiostatLifecycleAgent3(
+            api_key=os.environ.get("GROQ_API_KEY"),
+            library_path="master_regulatory_library.csv"
+        )
+    return _agent
 
-# INITIALIZE YOUR AGENT
-agent = BiostatLifecycleAgent3(
-    api_key="YOUR_GROQ_KEY",
-    library_path="master_regulatory_library.csv"
-)
 
 def process_audit_job(protocol_data):
     """
-    This is the core 'Worker' logic. 
+    This is the core 'Worker' logic.
     It doesn't care about loops; it only cares about ONE job.
+    Returns (DONE, report), (RETRY, error) or (FAILED, error); the queue stores the report.
     """
     try:
         print(f"🚀 Starting audit for: {protocol_data['id']}")
-        
+
         # 1. RUN THE AUDIT
-        report = agent.audit_protocol(
+        report = get_agent().audit_protocol(
             user_protocol=protocol_data['text'],
             historical_lessons=protocol_data.get('lessons', "")
         )
-        
-        # 2. SAVE RESULTS (This would go to an AWS S3 bucket later)
-        with open(f"audit_results_{protocol_data['id']}.txt", "w") as f:
-            f.write(report)
-            
-        return True # Job Success
+
+        return DONE, report # Job Success
 
     except Exception as e:
-        if "429" in str(e):
+        if rate_limiter.is_rate_limit_error(e) or "throttled" in str(e):
             print(f"🛑 RATE LIMIT REACHED. Strategy: Back-off and Re-queue.")
-            return "RETRY" # Signal to the queue to try again later
+            return RETRY, str(e) # Signal to the queue to try again later
         else:
             print(f"❌ CRITICAL FAILURE: {e}")
-            return False
\ No newline at end of file
+            return FAILED, str(e)
+
+
+if __name__ == "__main__":
+    # One job by hand: python worker.py job.json  ({"id": ..., "text": ..., "lessons": ...})
+    import sys
+    with open(sys.argv[1]) as f:
+        outcome, output = process_audit_job(json.load(f))
+    print(outcome)
+    print(output)